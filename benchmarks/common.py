@@ -0,0 +1,98 @@
+"""Shared helpers for the vdsgen benchmarks."""
+
+import os
+import sys
+import json
+import time
+import platform
+from contextlib import contextmanager
+
+# Allow running from a source checkout without installing
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+import h5py as h5
+
+
+def make_sources(folder, prefix, count, shape, dtype, source_node="data",
+                 fill=False):
+    """Create synthetic source HDF5 files.
+
+    Args:
+        folder(str): Folder to create files in
+        prefix(str): Prefix of file names - files are <prefix><idx>.h5
+        count(int): Number of files
+        shape(tuple): Shape of the dataset in each file
+        dtype(str): Data type of the dataset in each file
+        source_node(str): Data node in each file
+        fill(bool): Write data to each file - Otherwise the datasets are
+            created without allocating any storage
+
+    Returns:
+        list(str): Paths of created files
+
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    files = []
+    for idx in range(1, count + 1):
+        file_path = os.path.join(folder, "{}{}.h5".format(prefix, idx))
+        with h5.File(file_path, "w", libver="latest") as source:
+            if fill:
+                # A distinct value per file, so reads can be told apart
+                data = np.full(shape, idx % np.iinfo(np.uint8).max,
+                               dtype=dtype)
+                source.create_dataset(source_node, data=data)
+            else:
+                source.create_dataset(source_node, shape=shape, dtype=dtype)
+        files.append(file_path)
+
+    return files
+
+
+@contextmanager
+def timer(timings, name):
+    """Add the time taken by the body of the with statement to timings.
+
+    Args:
+        timings(dict): Seconds taken by each named phase
+        name(str): Name of phase
+
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.time() - start
+
+
+def environment():
+    """Get details of the environment the benchmark is running in.
+
+    Returns:
+        dict: Python, h5py, HDF5 and numpy versions and host name
+
+    """
+    return dict(python=platform.python_version(),
+                h5py=h5.version.version,
+                hdf5=h5.version.hdf5_version,
+                numpy=np.__version__,
+                host=platform.node())
+
+
+def write_result(result, output=None):
+    """Write a benchmark result as a line of JSON.
+
+    Args:
+        result(dict): Benchmark result
+        output(str): File to append to - Default is stdout
+
+    """
+    line = json.dumps(result, sort_keys=True)
+    if output is None:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+    else:
+        with open(output, "a") as output_file:
+            output_file.write(line + "\n")
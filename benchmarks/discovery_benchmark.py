@@ -0,0 +1,132 @@
+#!/bin/env dls-python
+"""Benchmark finding source files in large folders."""
+
+import os
+import re
+import sys
+import shutil
+import tempfile
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from collections import OrderedDict
+
+from common import timer, environment, write_result
+
+from vdsgen import vdsgenerator
+
+help_message = """
+-------------------------------------------------------------------------------
+A script to benchmark finding source files in folders of many files.
+
+Empty files are created for each file count, along with the same number of
+files that do not match the prefix. Finding the files with the prefix and
+checking that an explicit list of files exists are timed, along with the
+listdir and per file isfile approaches they replace. Run with --dir on a
+network file system to see the cost there. For example:
+
+ > python benchmarks/discovery_benchmark.py --files 1000 100000 \\
+       --dir /dls/tmp/discovery -o results.jsonl
+-------------------------------------------------------------------------------
+"""
+
+
+def make_files(folder, prefix, count):
+    """Create empty files with and without the given prefix.
+
+    Args:
+        folder(str): Folder to create files in
+        prefix(str): Prefix of matching files - files are <prefix><idx>.h5
+        count(int): Number of files of each kind
+
+    Returns:
+        list(str): Paths of files with prefix
+
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    files = []
+    for idx in range(1, count + 1):
+        for name in ["{}{}.h5".format(prefix, idx), "other_{}.h5".format(idx)]:
+            file_path = os.path.join(folder, name)
+            if not os.path.isfile(file_path):
+                open(file_path, "w").close()
+        files.append(os.path.join(folder, "{}{}.h5".format(prefix, idx)))
+
+    return files
+
+
+def listdir_find_files(path, prefix):
+    """Find files as before scan_files, for comparison."""
+    regex = re.compile(prefix + r"\d+\.(hdf5|hdf|h5)")
+    return [os.path.abspath(os.path.join(path, file_))
+            for file_ in sorted(os.listdir(path)) if re.match(regex, file_)]
+
+
+def benchmark(folder, prefix, files):
+    """Time finding and checking the files in folder.
+
+    Args:
+        folder(str): Folder containing files
+        prefix(str): Prefix of files to find
+        files(list(str)): Paths of files with prefix
+
+    Returns:
+        dict: Parameters and timings of the benchmark
+
+    """
+    timings = OrderedDict()
+    with timer(timings, "find_files"):
+        found = vdsgenerator.find_files(folder, prefix)
+    with timer(timings, "listdir_find_files"):
+        listdir_find_files(folder, prefix)
+    with timer(timings, "find_missing_files"):
+        missing = vdsgenerator.find_missing_files(files)
+    with timer(timings, "isfile_each"):
+        [file_ for file_ in files if not os.path.isfile(file_)]
+
+    assert len(found) == len(files) and not missing
+
+    return dict(benchmark="discovery", files=len(files),
+                scandir=vdsgenerator.scandir is not None, timings=timings,
+                environment=environment())
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(usage=help_message,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "--files", type=int, nargs="*", default=[100, 10000, 100000],
+        dest="files", help="Numbers of matching files to benchmark.")
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=3, dest="repeat",
+        help="Number of times to repeat each benchmark.")
+    parser.add_argument(
+        "--dir", type=str, default=None, dest="folder",
+        help="Folder to create files in. If None then a temporary folder, "
+             "which is removed afterwards.")
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, dest="output",
+        help="File to append JSON results to. If None then stdout.")
+
+    return parser.parse_args()
+
+
+def main():
+    """Run benchmarks."""
+    args = parse_args()
+
+    root = args.folder if args.folder is not None else tempfile.mkdtemp()
+    try:
+        for count in args.files:
+            folder = os.path.join(root, "files_{}".format(count))
+            files = make_files(folder, "stripe_", count)
+            for _ in range(args.repeat):
+                write_result(benchmark(folder, "stripe_", files), args.output)
+    finally:
+        if args.folder is None:
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
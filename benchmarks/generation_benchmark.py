@@ -0,0 +1,160 @@
+#!/bin/env dls-python
+"""Benchmark each phase of VDS generation against the number of sources."""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from collections import OrderedDict
+
+from common import make_sources, timer, environment, write_result
+
+from vdsgen.vdsgenerator import VDSGenerator
+from vdsgen.template import generate_from_template
+
+help_message = """
+-------------------------------------------------------------------------------
+A script to benchmark each phase of VDS generation.
+
+Synthetic source files are created for each source count and a VDS is
+generated from them, timing find_files, process_source_datasets,
+construct_vds_metadata, create_vds_plan and the write of the VDS. A second VDS
+is then created with the first as a template, as for a repeated scan. One line
+of JSON is written per source count and repeat. For example:
+
+ > python benchmarks/generation_benchmark.py --sources 2 100 1000 10000 \\
+       --shape 100 256 2048 -o results.jsonl
+-------------------------------------------------------------------------------
+"""
+
+
+class TimedVDSGenerator(VDSGenerator):
+
+    """A VDSGenerator that records the time taken by each phase."""
+
+    def __init__(self, *args, **kwargs):
+        self.timings = OrderedDict()
+        super(TimedVDSGenerator, self).__init__(*args, **kwargs)
+
+    def find_files(self):
+        with timer(self.timings, "find_files"):
+            return super(TimedVDSGenerator, self).find_files()
+
+    def process_source_datasets(self):
+        with timer(self.timings, "process_source_datasets"):
+            return super(TimedVDSGenerator, self).process_source_datasets()
+
+    def construct_vds_metadata(self, source, *args, **kwargs):
+        with timer(self.timings, "construct_vds_metadata"):
+            return super(TimedVDSGenerator, self).construct_vds_metadata(
+                source, *args, **kwargs)
+
+    def create_vds_plan(self, source, vds_data, *args, **kwargs):
+        with timer(self.timings, "create_vds_plan"):
+            return super(TimedVDSGenerator, self).create_vds_plan(
+                source, vds_data, *args, **kwargs)
+
+    def generate_vds(self):
+        with timer(self.timings, "generate_vds"):
+            super(TimedVDSGenerator, self).generate_vds()
+        # Everything in generate_vds other than planning the maps
+        self.timings["write"] = self.timings["generate_vds"] - \
+            self.timings["construct_vds_metadata"] - \
+            self.timings["create_vds_plan"]
+
+
+def benchmark(folder, sources, shape, dtype, layout, workers):
+    """Generate a VDS from the sources in folder and time each phase.
+
+    Args:
+        folder(str): Folder containing source files
+        sources(int): Number of source files
+        shape(tuple): Shape of the dataset in each source file
+        dtype(str): Data type of the dataset in each source file
+        layout(str): VDSGenerator layout
+        workers(int): Number of processes to read source metadata with
+
+    Returns:
+        dict: Parameters and timings of the benchmark
+
+    """
+    output = os.path.join(folder, "stripe_vds.h5")
+    template_output = os.path.join(folder, "template_vds.h5")
+    for output_file in [output, template_output]:
+        if os.path.isfile(output_file):
+            os.remove(output_file)
+
+    start = time.time()
+    gen = TimedVDSGenerator(folder, prefix="stripe_", layout=layout,
+                            workers=workers, log_level=3)
+    gen.generate_vds()
+    gen.timings["total"] = time.time() - start
+
+    with timer(gen.timings, "template"):
+        generate_from_template(output, [("stripe_vds", "template_vds")])
+
+    return dict(benchmark="generation", sources=sources, shape=list(shape),
+                dtype=dtype, layout=layout, workers=workers,
+                vds_size=os.path.getsize(output), timings=gen.timings,
+                counters=gen.metrics.counters, environment=environment())
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(usage=help_message,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "--sources", type=int, nargs="*", default=[2, 10, 100, 1000],
+        dest="sources", help="Numbers of source files to benchmark.")
+    parser.add_argument(
+        "--shape", type=int, nargs="*", default=[10, 256, 2048],
+        dest="shape",
+        help="Shape of each source dataset - 'frames height width', where "
+             "frames is N dimensional.")
+    parser.add_argument(
+        "-t", "--data_type", type=str, default="uint16", dest="data_type",
+        help="Data type of source datasets.")
+    parser.add_argument(
+        "--layout", type=str, default=VDSGenerator.layout, dest="layout",
+        choices=VDSGenerator.LAYOUTS, help="VDS layout.")
+    parser.add_argument(
+        "-w", "--workers", type=int, default=VDSGenerator.workers,
+        dest="workers",
+        help="Number of processes to read source file metadata with.")
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=3, dest="repeat",
+        help="Number of times to repeat each benchmark.")
+    parser.add_argument(
+        "--dir", type=str, default=None, dest="folder",
+        help="Folder to create source files in. If None then a temporary "
+             "folder, which is removed afterwards.")
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, dest="output",
+        help="File to append JSON results to. If None then stdout.")
+
+    return parser.parse_args()
+
+
+def main():
+    """Run benchmarks."""
+    args = parse_args()
+    shape = tuple(args.shape)
+
+    root = args.folder if args.folder is not None else tempfile.mkdtemp()
+    try:
+        for sources in args.sources:
+            folder = os.path.join(root, "sources_{}".format(sources))
+            make_sources(folder, "stripe_", sources, shape, args.data_type)
+            for _ in range(args.repeat):
+                result = benchmark(folder, sources, shape, args.data_type,
+                                   args.layout, args.workers)
+                write_result(result, args.output)
+    finally:
+        if args.folder is None:
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
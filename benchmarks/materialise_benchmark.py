@@ -0,0 +1,124 @@
+#!/bin/env dls-python
+"""Benchmark materialisation of a VDS against the number of reader workers."""
+
+import os
+import sys
+import shutil
+import tempfile
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from common import make_sources, environment, write_result
+
+from vdsgen.vdsgenerator import VDSGenerator
+from vdsgen.materialise import materialise_vds, COMPRESSIONS
+
+help_message = """
+-------------------------------------------------------------------------------
+A script to benchmark the throughput of materialising a VDS into a chunked,
+optionally compressed, dataset with different numbers of reader processes.
+
+Synthetic source files with data are created and a VDS is generated from them
+once. The VDS is then materialised for each number of workers and one line of
+JSON is written per worker count and repeat. For example:
+
+ > python benchmarks/materialise_benchmark.py --workers 1 2 4 8 \\
+       --sources 8 --shape 100 256 2048 --compression lzf -o results.jsonl
+
+Use --dir on the disks of interest; source data will usually be in the page
+cache after the first repeat.
+-------------------------------------------------------------------------------
+"""
+
+
+def benchmark(vds_file, output_file, workers, compression, memory):
+    """Materialise the VDS and measure throughput.
+
+    Args:
+        vds_file(str): Path to VDS file
+        output_file(str): Path to file to materialise into
+        workers(int): Number of reader processes
+        compression(str): Compression filter
+        memory(int): Memory limit for blocks in MB
+
+    Returns:
+        dict: Parameters, timing and throughput of the benchmark
+
+    """
+    if os.path.isfile(output_file):
+        os.remove(output_file)
+
+    result = materialise_vds(vds_file, output_file, workers=workers,
+                             compression=compression, memory=memory)
+    result.update(
+        benchmark="materialise", workers=workers, compression=compression,
+        memory=memory, output_size=os.path.getsize(output_file),
+        mb_per_second=result["bytes"] / 1024.0 ** 2 / result["seconds"],
+        environment=environment())
+    return result
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(usage=help_message,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "--workers", type=int, nargs="*", default=[1, 2, 4], dest="workers",
+        help="Numbers of reader processes to benchmark.")
+    parser.add_argument(
+        "--sources", type=int, default=4, dest="sources",
+        help="Number of source files.")
+    parser.add_argument(
+        "--shape", type=int, nargs="*", default=[100, 256, 2048],
+        dest="shape",
+        help="Shape of each source dataset - 'frames height width', where "
+             "frames is N dimensional.")
+    parser.add_argument(
+        "-t", "--data_type", type=str, default="uint16", dest="data_type",
+        help="Data type of source datasets.")
+    parser.add_argument(
+        "--compression", type=str, default=None, dest="compression",
+        choices=COMPRESSIONS, help="Compression filter.")
+    parser.add_argument(
+        "-m", "--memory", type=int, default=1024, dest="memory",
+        help="Memory limit for blocks of frames in MB.")
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=3, dest="repeat",
+        help="Number of times to repeat each benchmark.")
+    parser.add_argument(
+        "--dir", type=str, default=None, dest="folder",
+        help="Folder to create source files in. If None then a temporary "
+             "folder, which is removed afterwards.")
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, dest="output",
+        help="File to append JSON results to. If None then stdout.")
+
+    return parser.parse_args()
+
+
+def main():
+    """Run benchmarks."""
+    args = parse_args()
+
+    folder = args.folder if args.folder is not None else tempfile.mkdtemp()
+    try:
+        make_sources(folder, "stripe_", args.sources, tuple(args.shape),
+                     args.data_type, fill=True)
+        vds_file = os.path.join(folder, "stripe_vds.h5")
+        if os.path.isfile(vds_file):
+            os.remove(vds_file)
+        VDSGenerator(folder, prefix="stripe_", layout=VDSGenerator.FRAMES,
+                     log_level=3).generate_vds()
+
+        output_file = os.path.join(folder, "materialised.h5")
+        for workers in args.workers:
+            for _ in range(args.repeat):
+                result = benchmark(vds_file, output_file, workers,
+                                   args.compression, args.memory)
+                write_result(result, args.output)
+    finally:
+        if args.folder is None:
+            shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
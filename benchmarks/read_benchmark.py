@@ -0,0 +1,371 @@
+#!/bin/env dls-python
+"""Benchmark reads through a VDS against reads of its source files."""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import numpy as np
+import h5py as h5
+
+from common import make_sources, environment, write_result
+
+from vdsgen.vdsgenerator import VDSGenerator
+
+help_message = """
+-------------------------------------------------------------------------------
+A script to benchmark common read patterns on a VDS created by vdsgen.
+
+Each pattern is read through the VDS and then directly from the source slices
+the VDS maps it to, reporting MB/s and per-read latency of both. The
+patterns are a single frame, a range of frames, an ROI within one source, an
+ROI across the gap between two sources and a full scan, frame by frame.
+
+Benchmark an existing VDS, or synthesise sources with data and a VDS from
+them. For example:
+
+ > python benchmarks/read_benchmark.py /scratch/images/stripe_vds.h5
+ > python benchmarks/read_benchmark.py --synthesise 6 --shape 100 256 2048 \\
+       -m 100
+
+Source data will usually be in the page cache after the first read of it, so
+this measures the overhead of the virtual layer rather than disk throughput.
+-------------------------------------------------------------------------------
+"""
+
+
+def resolve_maps(vds_file, dataset):
+    """Get the maps of a VDS with absolute source file paths.
+
+    Args:
+        vds_file(str): Path to VDS file
+        dataset(h5py.Dataset): Virtual dataset
+
+    Returns:
+        list(Mapping): File path, data node, source shape, target index and
+            source index of each map
+
+    """
+    folder = os.path.dirname(os.path.abspath(vds_file))
+    return [mapping._replace(file=os.path.join(folder, mapping.file))
+            for mapping in VDSGenerator.read_vds_maps(dataset)]
+
+
+def read_direct(sources, maps, selection):
+    """Read the source slices a VDS selection maps to.
+
+    Args:
+        sources(dict): Open dataset of each source file path and node
+        maps(list(Mapping)): File path, data node, source shape, target index
+            and source index of each map
+        selection(tuple(slice)): Selection in the VDS
+
+    Returns:
+        int: Number of bytes read
+
+    """
+    total = 0
+    for mapping in maps:
+        source_index = mapping.source_index
+        if source_index is None:
+            source_index = [slice(0, size) for size in mapping.source_shape]
+        source_selection = []
+        for requested, target, source in zip(selection, mapping.target_index,
+                                             source_index):
+            step = target.step or 1
+            # Source positions of the first and last requested elements,
+            # clipped to the selected part of the source in case the target
+            # includes spacing
+            first = max(0, -(-(requested.start - target.start) // step))
+            last = min(source.stop - source.start,
+                       -(-(requested.stop - target.start) // step))
+            if first >= last:
+                break
+            source_selection.append(
+                slice(source.start + first, source.start + last))
+        else:
+            data = sources[(mapping.file, mapping.node)][
+                tuple(source_selection)]
+            total += data.nbytes
+
+    return total
+
+
+def time_reads(read, selections):
+    """Time a read of each selection.
+
+    Args:
+        read(function): Function to read a selection and return bytes read
+        selections(list(tuple(slice))): Selections to read
+
+    Returns:
+        dict: Bytes read, seconds taken, MB/s and latency statistics
+
+    """
+    # Untimed warm up read, so that every source file is already open
+    read(selections[0])
+
+    latencies = []
+    total = 0
+    for selection in selections:
+        start = time.time()
+        total += read(selection)
+        latencies.append(time.time() - start)
+
+    seconds = sum(latencies)
+    return dict(reads=len(selections), bytes=total, seconds=seconds,
+                mb_per_s=total / seconds / 1e6 if seconds > 0 else None,
+                latency_mean=float(np.mean(latencies)),
+                latency_p50=float(np.percentile(latencies, 50)),
+                latency_p99=float(np.percentile(latencies, 99)))
+
+
+def frame_selection(shape, frame):
+    """Select a whole frame of the VDS.
+
+    Args:
+        shape(tuple): Shape of VDS
+        frame(tuple(int)): Index of frame in each frame axis
+
+    Returns:
+        tuple(slice): Selection
+
+    """
+    return tuple([slice(idx, idx + 1) for idx in frame] +
+                 [slice(0, shape[-2]), slice(0, shape[-1])])
+
+
+def read_patterns(shape, maps, reads, frame_range, roi):
+    """Create the selections to read for each access pattern.
+
+    Args:
+        shape(tuple): Shape of VDS
+        maps(list(Mapping)): File path, data node, source shape, target index
+            and source index of each map
+        reads(int): Number of random reads of each pattern
+        frame_range(int): Number of frames to read in the frame range pattern
+        roi(int): Height and width of ROI patterns
+
+    Returns:
+        dict: Selections of each pattern
+
+    """
+    frame_shape = shape[:-2]
+    height, width = shape[-2:]
+    roi_height, roi_width = min(roi, height), min(roi, width)
+
+    def random_frame():
+        return tuple(random.randrange(size) for size in frame_shape)
+
+    def roi_selection(row):
+        column = random.randrange(width - roi_width + 1)
+        return tuple([slice(idx, idx + 1) for idx in random_frame()] +
+                     [slice(row, row + roi_height),
+                      slice(column, column + roi_width)])
+
+    patterns = dict()
+    patterns["single_frame"] = [frame_selection(shape, random_frame())
+                                for _ in range(reads)]
+
+    frame_range = min(frame_range, frame_shape[0]) if frame_shape else 0
+    if frame_range:
+        patterns["frame_range"] = []
+        for _ in range(reads):
+            start = random.randrange(frame_shape[0] - frame_range + 1)
+            patterns["frame_range"].append(tuple(
+                [slice(start, start + frame_range)] +
+                [slice(0, size) for size in shape[1:]]))
+
+    # Row bounds of the first two sources, from the row axis of their maps
+    rows = sorted((mapping.target_index[-2].start,
+                   mapping.target_index[-2].stop) for mapping in maps)
+    first_start, first_stop = rows[0]
+    if first_stop - first_start >= roi_height:
+        patterns["roi_in_source"] = [
+            roi_selection(random.randrange(
+                first_start, first_stop - roi_height + 1))
+            for _ in range(reads)]
+    if len(rows) > 1:
+        # Straddle the boundary after the second source if there is one,
+        # which is the gap between modules in the stripes layout
+        boundary = rows[min(1, len(rows) - 2)][1]
+        row = max(0, min(boundary - roi_height // 2, height - roi_height))
+        patterns["roi_across_gap"] = [roi_selection(row)
+                                      for _ in range(reads)]
+
+    patterns["full_scan"] = [frame_selection(shape, frame)
+                             for frame in np.ndindex(*frame_shape)]
+
+    return patterns
+
+
+def benchmark(vds_file, node, reads, frame_range, roi):
+    """Benchmark each read pattern through the VDS and from the sources.
+
+    Args:
+        vds_file(str): Path to VDS file
+        node(str): Data node in VDS file
+        reads(int): Number of random reads of each pattern
+        frame_range(int): Number of frames to read in the frame range pattern
+        roi(int): Height and width of ROI patterns
+
+    Returns:
+        list(dict): Parameters and results of each pattern
+
+    """
+    results = []
+    with h5.File(vds_file, "r", libver="latest") as vds:
+        dataset = vds[node]
+        maps = resolve_maps(vds_file, dataset)
+        patterns = read_patterns(dataset.shape, maps, reads, frame_range, roi)
+
+        source_files = dict()
+        sources = dict()
+        try:
+            for mapping in maps:
+                if mapping.file not in source_files:
+                    source_files[mapping.file] = h5.File(mapping.file, "r")
+                sources[(mapping.file, mapping.node)] = \
+                    source_files[mapping.file][mapping.node]
+
+            def read_vds(selection):
+                return dataset[selection].nbytes
+
+            def read_sources(selection):
+                return read_direct(sources, maps, selection)
+
+            for pattern, selections in sorted(patterns.items()):
+                vds_result = time_reads(read_vds, selections)
+                direct_result = time_reads(read_sources, selections)
+                overhead = None
+                if direct_result["seconds"] > 0:
+                    overhead = vds_result["seconds"] / \
+                        direct_result["seconds"]
+                results.append(dict(
+                    benchmark="read", pattern=pattern, vds_file=vds_file,
+                    node=node, shape=list(dataset.shape),
+                    dtype=dataset.dtype.str, sources=len(maps),
+                    vds=vds_result, direct=direct_result,
+                    overhead=overhead, environment=environment()))
+        finally:
+            for source_file in source_files.values():
+                source_file.close()
+
+    return results
+
+
+def synthesise(folder, sources, shape, dtype, layout, stripe_spacing,
+               module_spacing):
+    """Create source files with data and a VDS of them.
+
+    Args:
+        folder(str): Folder to create files in
+        sources(int): Number of source files
+        shape(tuple): Shape of the dataset in each source file
+        dtype(str): Data type of the dataset in each source file
+        layout(str): VDSGenerator layout
+        stripe_spacing(int): Spacing between stripes in module
+        module_spacing(int): Spacing between modules
+
+    Returns:
+        str: Path to VDS file
+
+    """
+    make_sources(folder, "stripe_", sources, shape, dtype, fill=True)
+    gen = VDSGenerator(folder, prefix="stripe_", layout=layout,
+                       stripe_spacing=stripe_spacing,
+                       module_spacing=module_spacing, log_level=3)
+    gen.generate_vds()
+    return gen.output_file
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(usage=help_message,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "vds_file", type=str, nargs="?", default=None,
+        help="VDS file to benchmark. Not required with --synthesise.")
+    parser.add_argument(
+        "--node", type=str, default=VDSGenerator.target_node, dest="node",
+        help="Data node in VDS file.")
+    parser.add_argument(
+        "-n", "--reads", type=int, default=20, dest="reads",
+        help="Number of random reads of each pattern.")
+    parser.add_argument(
+        "--frame_range", type=int, default=10, dest="frame_range",
+        help="Number of frames to read in the frame range pattern.")
+    parser.add_argument(
+        "--roi", type=int, default=64, dest="roi",
+        help="Height and width of ROI patterns.")
+    parser.add_argument(
+        "--seed", type=int, default=0, dest="seed",
+        help="Seed for random read positions.")
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, dest="output",
+        help="File to append JSON results to. If None then stdout.")
+
+    # Arguments to create a VDS to benchmark
+    synthetic = parser.add_argument_group()
+    synthetic.add_argument(
+        "--synthesise", type=int, default=None, dest="sources",
+        help="Number of source files to synthesise a VDS from.")
+    synthetic.add_argument(
+        "--shape", type=int, nargs="*", default=[100, 256, 2048],
+        dest="shape",
+        help="Shape of each synthetic source - 'frames height width', where "
+             "frames is N dimensional.")
+    synthetic.add_argument(
+        "-t", "--data_type", type=str, default="uint16", dest="data_type",
+        help="Data type of synthetic sources.")
+    synthetic.add_argument(
+        "--layout", type=str, default=VDSGenerator.layout, dest="layout",
+        choices=VDSGenerator.LAYOUTS, help="Layout of synthetic VDS.")
+    synthetic.add_argument(
+        "-s", "--stripe_spacing", type=int, dest="stripe_spacing",
+        default=VDSGenerator.stripe_spacing,
+        help="Spacing between two stripes in a module of synthetic VDS.")
+    synthetic.add_argument(
+        "-m", "--module_spacing", type=int, dest="module_spacing",
+        default=VDSGenerator.module_spacing,
+        help="Spacing between two modules of synthetic VDS.")
+
+    args = parser.parse_args()
+    if args.vds_file is None and args.sources is None:
+        parser.error("Either a VDS file or --synthesise is required.")
+
+    return args
+
+
+def main():
+    """Run benchmarks."""
+    args = parse_args()
+    random.seed(args.seed)
+
+    folder = None
+    vds_file = args.vds_file
+    try:
+        if args.sources is not None:
+            folder = tempfile.mkdtemp()
+            vds_file = synthesise(folder, args.sources, tuple(args.shape),
+                                  args.data_type, args.layout,
+                                  args.stripe_spacing, args.module_spacing)
+
+        for result in benchmark(vds_file, args.node, args.reads,
+                                args.frame_range, args.roi):
+            if args.sources is not None:
+                result.update(stripe_spacing=args.stripe_spacing,
+                              module_spacing=args.module_spacing,
+                              layout=args.layout)
+            write_result(result, args.output)
+    finally:
+        if folder is not None:
+            shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/bin/env dls-python
+"""Benchmark the startup time of the vdsgen command line tools."""
+
+import os
+import sys
+import time
+import json
+import shutil
+import tempfile
+import subprocess
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import numpy as np
+
+from common import environment, write_result
+
+help_message = """
+-------------------------------------------------------------------------------
+A script to benchmark the startup time of the vdsgen command line tools.
+
+Each command is run in a new interpreter, as cron or a shell script would,
+and timed from start to exit. 'import h5py' is timed as well, as the cost the
+tools avoid by only importing h5py when a VDS is actually generated. Compare
+two versions by running with --root pointing at each checkout. For example:
+
+ > python benchmarks/startup_benchmark.py -r 20
+ > python benchmarks/startup_benchmark.py --root /path/to/old/vds-gen
+-------------------------------------------------------------------------------
+"""
+
+IMPORTED_MODULES = "import sys; import vdsgen.app; " \
+                   "print([name for name in ('h5py', 'numpy') " \
+                   "if name in sys.modules])"
+
+
+def commands(root, manifest):
+    """Get the commands to time.
+
+    Args:
+        root(str): Root of vdsgen checkout
+        manifest(str): Path to a valid batch manifest
+
+    Returns:
+        dict: Arguments of each command to time
+
+    """
+    app = os.path.join(root, "vdsgen", "app.py")
+    batch = os.path.join(root, "vdsgen", "batch.py")
+    commands_ = {"python": [sys.executable, "-c", "pass"],
+                 "import_h5py": [sys.executable, "-c", "import h5py"],
+                 "import_vdsgen_app": [sys.executable, "-c",
+                                       "import vdsgen.app"],
+                 "app_help": [sys.executable, app, "--help"],
+                 "app_argument_error": [sys.executable, app, "/tmp"]}
+    if os.path.isfile(batch):
+        commands_["batch_validate"] = [sys.executable, batch, manifest,
+                                       "--validate"]
+    return commands_
+
+
+def time_command(command, root, repeat):
+    """Run a command repeatedly and time each run.
+
+    Args:
+        command(list(str)): Arguments of command
+        root(str): Root of vdsgen checkout, to put on the PYTHONPATH
+        repeat(int): Number of times to run command
+
+    Returns:
+        dict: Statistics of the time taken
+
+    """
+    env = dict(os.environ, PYTHONPATH=root)
+    with open(os.devnull, "w") as devnull:
+        times = []
+        for _ in range(repeat):
+            start = time.time()
+            subprocess.call(command, env=env, stdout=devnull, stderr=devnull)
+            times.append(time.time() - start)
+
+    return dict(runs=repeat, min=min(times), mean=float(np.mean(times)),
+                median=float(np.median(times)))
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(usage=help_message,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "--root", type=str, dest="root",
+        default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
+        help="Root of the vdsgen checkout to benchmark.")
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=10, dest="repeat",
+        help="Number of times to run each command.")
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, dest="output",
+        help="File to append JSON results to. If None then stdout.")
+
+    return parser.parse_args()
+
+
+def main():
+    """Run benchmarks."""
+    args = parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        manifest = os.path.join(folder, "manifest.json")
+        with open(manifest, "w") as manifest_file:
+            json.dump([dict(path=folder, prefix="stripe_")], manifest_file)
+
+        imported = subprocess.check_output(
+            [sys.executable, "-c", IMPORTED_MODULES],
+            env=dict(os.environ, PYTHONPATH=args.root)).strip()
+
+        for name, command in sorted(commands(args.root, manifest).items()):
+            write_result(dict(benchmark="startup", command=name,
+                              root=args.root,
+                              imported_by_app=imported,
+                              seconds=time_command(command, args.root,
+                                                   args.repeat),
+                              environment=environment()), args.output)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
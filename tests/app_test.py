@@ -1,4 +1,7 @@
+import os
+import sys
 import unittest
+import subprocess
 from pkg_resources import require
 
 require("mock")
@@ -22,7 +25,8 @@ class ParseArgsTest(unittest.TestCase):
         add_group_mock = parser_mock.add_argument_group
         add_exclusive_group_mock = parser_mock.add_mutually_exclusive_group
         parse_mock = parser_mock.parse_args
-        parse_mock.return_value = MagicMock(empty=False, files=None)
+        parse_mock.return_value = MagicMock(empty=False, files=None,
+                                            append=False, extra_nodes=None)
         empty_mock = MagicMock()
         other_mock = MagicMock()
         add_group_mock.side_effect = [empty_mock, other_mock]
@@ -41,6 +45,60 @@ For example:
 You can create an empty VDS, for raw files that don't exist yet, with the -e
 flag; you will then need to provide --shape and --data_type, though defaults
 are provided for these.
+
+With --layout frames, sources are concatenated along the frame axis instead.
+New files can then be added to the end of an existing VDS with the -a flag:
+
+ > ../vdsgen/app.py /scratch/images -f image_3.hdf5 -o image_vds.hdf5 \\
+       --layout frames -a
+
+With --layout grid, sources are placed as tiles of a 2D grid described by a
+JSON --geometry file, either as a regular grid with gaps between tiles, e.g.
+{"rows": 2, "columns": 4, "row_gap": 30, "column_gap": 10}, or as explicit
+offsets of each source, e.g. {"offsets": [[0, 0], [0, 1034], [522, 0]]}:
+
+ > ../vdsgen/app.py /scratch/images -p module_ --layout grid \\
+       --geometry detector.json
+
+The spacing between stripes, modules and tiles can be left out with
+--compact, or a compact dataset can be created alongside the spaced one with
+--compact_node, for processing that only needs the real pixels.
+
+Other datasets in the source files, e.g. timestamps, can be mapped into the
+same VDS in the same pass with -x <source_node> <target_node> [<layout>]:
+
+ > ../vdsgen/app.py /scratch/images -p image_ --layout frames \\
+       -x timestamps timestamps -x exposure exposure
+
+Sources with different numbers of frames, e.g. after an aborted acquisition,
+raise an error unless --frame_policy is truncate, to map only the frames that
+every source has, or pad, to map every frame with fill value where a source
+has none. The policy and frames of each source are set as attributes.
+
+With --layout frames and --printf_maps, a series of sources numbered from 0,
+e.g. image_0.h5, image_1.h5, ..., is mapped with one printf-style map to
+image_%%b.h5 rather than one map per file, so the VDS stays small and grows as
+more files of the series are written. Other files are mapped one by one.
+
+To follow an acquisition live, create the VDS once at the start with --live.
+The frame axis is then unlimited and each source is mapped in full as it
+grows, so a SWMR reader of the VDS sees new frames without regenerating it.
+This works with stripes, interleave and grid layouts, but not frames:
+
+ > ../vdsgen/app.py /scratch/images -p stripe_ --live
+ > ../vdsgen/app.py /scratch/images -f stripe_1.h5 stripe_2.h5 -e --live \\
+       --shape 0 256 2048
+
+The maps can be written to a JSON file with --plan instead of creating the
+VDS, to inspect, compare or keep them:
+
+ > ../vdsgen/app.py /scratch/images -p stripe_ --plan stripe_plan.json
+
+The time taken by each phase and counters of the files, metadata and maps
+processed can be written with --metrics, as JSON or, for a file ending .prom,
+as a Prometheus node exporter textfile. The generation itself can be profiled
+with --profile, as cProfile stats or, for a file ending .folded, as sampled
+stacks for a flame graph.
 -------------------------------------------------------------------------------
 """
 
@@ -76,6 +134,38 @@ are provided for these.
             [call("-o", "--output", type=str, default=None, dest="output",
                   help="Output file name. If None then generated as input "
                        "file prefix with vds suffix."),
+             call("--layout", type=str, dest="layout",
+                  default=gen_mock.layout, choices=gen_mock.LAYOUTS,
+                  help="Stack sources vertically as stripes, concatenate "
+                       "them along the frame axis, interleave their frames "
+                       "or place them as tiles of a 2D grid."),
+             call("--geometry", type=str, dest="geometry", default=None,
+                  help="JSON file describing the placement of tiles for grid "
+                       "layout."),
+             call("--compact", action="store_true", dest="compact",
+                  help="Leave out the spacing between stripes, modules and "
+                       "tiles."),
+             call("--compact_node", type=str, dest="compact_node",
+                  default=gen_mock.compact_node,
+                  help="Data node in VDS file to also create a compact "
+                       "dataset at."),
+             call("-a", "--append", action="store_true", dest="append",
+                  help="Append sources to the end of an existing frames "
+                       "VDS."),
+             call("--live", action="store_true", dest="live",
+                  help="Create the VDS with an unlimited frame axis that "
+                       "follows sources as they are written."),
+             call("--frame_policy", type=str, dest="frame_policy",
+                  default=gen_mock.frame_policy,
+                  choices=gen_mock.FRAME_POLICIES,
+                  help="How to handle sources with different numbers of "
+                       "frames."),
+             call("--printf_maps", action="store_true", dest="printf_maps",
+                  help="Map a series of sources numbered from 0 with one "
+                       "printf-style map, for frames layout."),
+             call("--plan", type=str, dest="plan", default=None,
+                  help="Write the maps to a JSON plan file instead of "
+                       "creating the VDS."),
              call("-s", "--stripe_spacing", type=int, dest="stripe_spacing",
                   default=gen_mock.stripe_spacing,
                   help="Spacing between two stripes in a module."),
@@ -88,6 +178,29 @@ are provided for these.
              call("--target_node", type=str,
                   default=gen_mock.target_node, dest="target_node",
                   help="Data node in VDS file."),
+             call("-x", "--extra_node", type=str, nargs="+",
+                  action="append", dest="extra_nodes", default=None,
+                  metavar="SOURCE_NODE TARGET_NODE [LAYOUT]",
+                  help="Other data node in source files to map to a data "
+                       "node in VDS file, optionally with a different "
+                       "layout."),
+             call("-w", "--workers", type=int, dest="workers",
+                  default=gen_mock.workers,
+                  help="Number of processes to read source file metadata "
+                       "with."),
+             call("--cache", type=str, dest="cache_file",
+                  default=gen_mock.cache_file,
+                  help="File to cache source file metadata in between runs."),
+             call("--cache_size", type=int, dest="cache_size",
+                  default=gen_mock.cache_size,
+                  help="Maximum number of entries in metadata cache."),
+             call("--metrics", type=str, dest="metrics", default=None,
+                  help="File to write timings and counters of the run to - "
+                       "Prometheus textfile if it ends .prom, else JSON."),
+             call("--profile", type=str, dest="profile", default=None,
+                  help="File to write a profile of the run to - sampled "
+                       "stacks for a flame graph if it ends .folded, else "
+                       "cProfile stats."),
              call("-l", "--log_level", type=int, dest="log_level",
                   default=gen_mock.log_level,
                   help="Logging level (off=3, info=2, debug=1).")])
@@ -97,7 +210,8 @@ are provided for these.
 
     @patch(parser_patch_path + '.error')
     @patch(parser_patch_path + '.parse_args',
-           return_value=MagicMock(empty=True, files=None))
+           return_value=MagicMock(empty=True, files=None, append=False,
+                                  extra_nodes=None))
     def test_empty_and_not_files_then_error(self, parse_mock, error_mock):
 
         app.parse_args()
@@ -108,7 +222,8 @@ are provided for these.
 
     @patch(parser_patch_path + '.error')
     @patch(parser_patch_path + '.parse_args',
-           return_value=MagicMock(empty=True, files=["file"]))
+           return_value=MagicMock(empty=True, files=["file"], append=False,
+                                  extra_nodes=None))
     def test_only_one_file_then_error(self, parse_mock, error_mock):
 
         app.parse_args()
@@ -116,6 +231,79 @@ are provided for these.
         error_mock.assert_called_once_with(
             "Must define at least two files to combine.")
 
+    @patch(parser_patch_path + '.error')
+    @patch(parser_patch_path + '.parse_args',
+           return_value=MagicMock(empty=False, files=["file"], append=True,
+                                  layout="frames", plan=None,
+                                  extra_nodes=None, live=False))
+    def test_append_one_file_then_no_error(self, parse_mock, error_mock):
+
+        app.parse_args()
+
+        error_mock.assert_not_called()
+
+    @patch(parser_patch_path + '.error')
+    @patch(parser_patch_path + '.parse_args',
+           return_value=MagicMock(empty=False, files=None, append=True,
+                                  layout="stripes", plan=None,
+                                  extra_nodes=None))
+    def test_append_stripes_then_error(self, parse_mock, error_mock):
+
+        app.parse_args()
+
+        error_mock.assert_called_once_with(
+            "Can only append to a VDS with frames layout.")
+
+    @patch(parser_patch_path + '.error')
+    @patch(parser_patch_path + '.parse_args',
+           return_value=MagicMock(empty=False, files=None, append=True,
+                                  layout="frames", plan="plan.json",
+                                  extra_nodes=None, live=False))
+    def test_append_and_plan_then_error(self, parse_mock, error_mock):
+
+        app.parse_args()
+
+        error_mock.assert_called_once_with(
+            "Cannot write a plan when appending.")
+
+    @patch(parser_patch_path + '.error')
+    @patch(parser_patch_path + '.parse_args',
+           return_value=MagicMock(empty=False, files=None, append=False,
+                                  layout="grid", geometry=None,
+                                  extra_nodes=None))
+    def test_grid_without_geometry_then_error(self, parse_mock, error_mock):
+
+        app.parse_args()
+
+        error_mock.assert_called_once_with(
+            "Must define --geometry for grid layout.")
+
+    @patch(parser_patch_path + '.error')
+    @patch(parser_patch_path + '.parse_args',
+           return_value=MagicMock(empty=False, files=None, append=False,
+                                  layout="frames", live=False,
+                                  extra_nodes=[["times", "timestamps"],
+                                               ["ex", "ex", "diagonal"]]))
+    def test_extra_node_invalid_layout_then_error(self, parse_mock,
+                                                  error_mock):
+
+        app.parse_args()
+
+        error_mock.assert_called_once_with(
+            "Invalid --extra_node layout diagonal.")
+
+    @patch(parser_patch_path + '.error')
+    @patch(parser_patch_path + '.parse_args',
+           return_value=MagicMock(empty=False, files=None, append=False,
+                                  layout="frames", live=True,
+                                  extra_nodes=None))
+    def test_live_frames_then_error(self, parse_mock, error_mock):
+
+        app.parse_args()
+
+        error_mock.assert_called_once_with(
+            "Cannot make a live VDS with frames layout.")
+
 
 class MainTest(unittest.TestCase):
     @patch(VDSGenerator_patch_path)
@@ -125,8 +313,11 @@ class MainTest(unittest.TestCase):
                files=["file1.hdf5", "file2.hdf5"], output="vds",
                shape=[3, 256, 2048], data_type="int16",
                source_node="data", target_node="full_frame",
-               stripe_spacing=3, module_spacing=127,
-               log_level=2))
+               stripe_spacing=3, module_spacing=127, layout="stripes",
+               geometry=None, compact=False, compact_node="compact",
+               extra_nodes=None, append=False, plan=None, workers=4,
+               cache_file=None,
+               cache_size=100, log_level=2, metrics=None, profile=None))
     def test_main_empty(self, parse_mock, init_mock):
         gen_mock = init_mock.return_value
         args_mock = parse_mock.return_value
@@ -143,7 +334,20 @@ class MainTest(unittest.TestCase):
             target_node=args_mock.target_node,
             stripe_spacing=args_mock.stripe_spacing,
             module_spacing=args_mock.module_spacing,
-            log_level=args_mock.log_level)
+            layout=args_mock.layout,
+            geometry=None,
+            compact=args_mock.compact,
+            compact_node=args_mock.compact_node,
+            extra_nodes=None,
+            live=args_mock.live,
+            frame_policy=args_mock.frame_policy,
+            printf_maps=args_mock.printf_maps,
+            append=args_mock.append,
+            workers=args_mock.workers,
+            cache_file=args_mock.cache_file,
+            cache_size=args_mock.cache_size,
+            log_level=args_mock.log_level,
+            hooks=None)
 
         gen_mock.generate_vds.assert_called_once_with()
 
@@ -154,8 +358,11 @@ class MainTest(unittest.TestCase):
                files=["file1.hdf5", "file2.hdf5"], output="vds",
                frames=3, height=256, width=2048, data_type="int16",
                source_node="data", target_node="full_frame",
-               stripe_spacing=3, module_spacing=127,
-               log_level=2))
+               stripe_spacing=3, module_spacing=127, layout="stripes",
+               geometry=None, compact=False, compact_node="compact",
+               extra_nodes=None, append=False, plan=None, workers=4,
+               cache_file=None,
+               cache_size=100, log_level=2, metrics=None, profile=None))
     def test_main_not_empty(self, parse_mock, generate_mock):
         args_mock = parse_mock.return_value
 
@@ -170,4 +377,128 @@ class MainTest(unittest.TestCase):
             stripe_spacing=args_mock.stripe_spacing,
             target_node=args_mock.target_node,
             module_spacing=args_mock.module_spacing,
-            log_level=args_mock.log_level)
+            layout=args_mock.layout,
+            geometry=None,
+            compact=args_mock.compact,
+            compact_node=args_mock.compact_node,
+            extra_nodes=None,
+            live=args_mock.live,
+            frame_policy=args_mock.frame_policy,
+            printf_maps=args_mock.printf_maps,
+            append=args_mock.append,
+            workers=args_mock.workers,
+            cache_file=args_mock.cache_file,
+            cache_size=args_mock.cache_size,
+            log_level=args_mock.log_level,
+            hooks=None)
+
+    @patch(VDSGenerator_patch_path)
+    @patch(app_patch_path + '.parse_args',
+           return_value=MagicMock(
+               path="/test/path", prefix=None, empty=False,
+               files=["file3.hdf5"], output="vds.hdf5",
+               source_node="data", target_node="full_frame",
+               stripe_spacing=3, module_spacing=127, layout="frames",
+               geometry=None, extra_nodes=None, append=True, plan=None,
+               workers=4,
+               cache_file=None,
+               cache_size=100,
+               log_level=2, metrics=None, profile=None))
+    def test_main_append(self, parse_mock, init_mock):
+        gen_mock = init_mock.return_value
+
+        app.main()
+
+        gen_mock.append_vds.assert_called_once_with()
+        gen_mock.generate_vds.assert_not_called()
+
+    @patch(app_patch_path + '.save_plans')
+    @patch(VDSGenerator_patch_path)
+    @patch(app_patch_path + '.parse_args',
+           return_value=MagicMock(
+               path="/test/path", prefix="stripe_", empty=False, files=None,
+               geometry=None, extra_nodes=None, append=False,
+               plan="/test/plan.json", metrics=None, profile=None))
+    def test_main_plan(self, parse_mock, init_mock, save_mock):
+        gen_mock = init_mock.return_value
+
+        app.main()
+
+        save_mock.assert_called_once_with(gen_mock.plan_vds.return_value,
+                                          "/test/plan.json")
+        gen_mock.generate_vds.assert_not_called()
+
+    @patch(app_patch_path + '.load_geometry')
+    @patch(VDSGenerator_patch_path)
+    @patch(app_patch_path + '.parse_args',
+           return_value=MagicMock(
+               path="/test/path", prefix="module_", empty=False, files=None,
+               output=None, layout="grid", geometry="/test/detector.json",
+               extra_nodes=None, append=False, plan=None, metrics=None,
+               profile=None))
+    def test_main_grid_then_load_geometry(self, parse_mock, init_mock,
+                                          load_mock):
+        app.main()
+
+        load_mock.assert_called_once_with("/test/detector.json")
+        self.assertEqual(load_mock.return_value,
+                         init_mock.call_args[1]["geometry"])
+
+    @patch(VDSGenerator_patch_path)
+    @patch(app_patch_path + '.parse_args',
+           return_value=MagicMock(
+               path="/test/path", prefix="image_", empty=False, files=None,
+               output=None, layout="frames", geometry=None,
+               extra_nodes=[["times", "timestamps"], ["ex", "ex", "stripes"]],
+               append=False, plan=None, metrics=None, profile=None))
+    def test_main_extra_nodes(self, parse_mock, init_mock):
+        app.main()
+
+        self.assertEqual([dict(source_node="times", target_node="timestamps"),
+                          dict(source_node="ex", target_node="ex",
+                               layout="stripes")],
+                         init_mock.call_args[1]["extra_nodes"])
+
+    @patch(app_patch_path + '.write_metrics')
+    @patch(VDSGenerator_patch_path)
+    @patch(app_patch_path + '.parse_args',
+           return_value=MagicMock(
+               path="/test/path", prefix="stripe_", empty=False, files=None,
+               geometry=None, extra_nodes=None, append=False, plan=None,
+               metrics="/test/vdsgen.prom", profile=None))
+    def test_main_metrics(self, parse_mock, init_mock, write_mock):
+        gen_mock = init_mock.return_value
+
+        app.main()
+
+        write_mock.assert_called_once_with(
+            gen_mock.generate_vds.return_value, "/test/vdsgen.prom",
+            labels=dict(output=gen_mock.output_file))
+
+    @patch(app_patch_path + '.profile_hook')
+    @patch(VDSGenerator_patch_path)
+    @patch(app_patch_path + '.parse_args',
+           return_value=MagicMock(
+               path="/test/path", prefix="stripe_", empty=False, files=None,
+               geometry=None, extra_nodes=None, append=False, plan=None,
+               metrics=None, profile="/test/vdsgen.folded"))
+    def test_main_profile(self, parse_mock, init_mock, profile_mock):
+        profiler_mock = profile_mock.return_value
+
+        app.main()
+
+        profile_mock.assert_called_once_with("/test/vdsgen.folded")
+        self.assertEqual([profiler_mock], init_mock.call_args[1]["hooks"])
+        profiler_mock.write.assert_called_once_with("/test/vdsgen.folded")
+
+
+class StartupTest(unittest.TestCase):
+
+    def test_import_then_h5py_not_imported(self):
+        # In a new interpreter, as h5py is already imported by other tests
+        code = "import sys; import vdsgen.app; " \
+               "sys.exit(int('h5py' in sys.modules or 'numpy' in sys.modules))"
+        root = os.path.join(os.path.dirname(__file__), "..")
+
+        self.assertEqual(0, subprocess.call([sys.executable, "-c", code],
+                                            cwd=root))
@@ -0,0 +1,195 @@
+import unittest
+
+from pkg_resources import require
+require("mock")
+from mock import MagicMock, patch, mock_open
+
+from vdsgen import batch
+
+batch_patch_path = "vdsgen.batch"
+VDSGenerator_patch_path = batch_patch_path + ".VDSGenerator"
+
+
+class ReadManifestTest(unittest.TestCase):
+
+    def test_read_json_list(self):
+        content = '[{"path": "/scan_1", "prefix": "stripe_"},' \
+                  ' {"path": "/scan_2", "prefix": "stripe_"}]'
+
+        with patch('__builtin__.open', mock_open(read_data=content)):
+            jobs = batch.read_manifest("/test/manifest.json")
+
+        self.assertEqual([dict(path="/scan_1", prefix="stripe_"),
+                          dict(path="/scan_2", prefix="stripe_")], jobs)
+
+    def test_read_json_lines(self):
+        content = '{"path": "/scan_1", "prefix": "stripe_"}\n\n' \
+                  '{"path": "/scan_2", "files": ["a_1.h5", "a_2.h5"]}\n'
+
+        with patch('__builtin__.open', mock_open(read_data=content)):
+            jobs = batch.read_manifest("/test/manifest.jsonl")
+
+        self.assertEqual([dict(path="/scan_1", prefix="stripe_"),
+                          dict(path="/scan_2", files=["a_1.h5", "a_2.h5"])],
+                         jobs)
+
+    @patch('csv.DictReader',
+           return_value=[dict(path="/scan_1", prefix="stripe_", files="",
+                              stripe_spacing="3", append="true")])
+    def test_read_csv(self, reader_mock):
+        with patch('__builtin__.open', mock_open()):
+            jobs = batch.read_manifest("/test/manifest.csv")
+
+        self.assertEqual([dict(path="/scan_1", prefix="stripe_",
+                               stripe_spacing=3, append=True)], jobs)
+
+    def test_parse_csv_row(self):
+        row = dict(path="/scan_1", files="a_1.h5 a_2.h5", shape="3 256 2048",
+                   data_type="int16", output=" ", module_spacing="127",
+                   compact="no", extra_nodes="times:timestamps ex:ex:frames")
+
+        job = batch.parse_csv_row(row)
+
+        self.assertEqual(dict(path="/scan_1", files=["a_1.h5", "a_2.h5"],
+                              shape=[3, 256, 2048], data_type="int16",
+                              module_spacing=127, compact=False,
+                              extra_nodes=[
+                                  dict(source_node="times",
+                                       target_node="timestamps"),
+                                  dict(source_node="ex", target_node="ex",
+                                       layout="frames")]), job)
+
+
+class ValidateJobTest(unittest.TestCase):
+
+    def test_valid(self):
+        batch.validate_job(dict(path="/scan_1", prefix="stripe_"))
+
+    def test_unknown_argument_then_error(self):
+        with self.assertRaises(ValueError) as e:
+            batch.validate_job(dict(path="/scan_1", prefix="stripe_",
+                                    workers=4, colour="red"))
+
+        self.assertEqual("Unknown arguments colour, workers",
+                         e.exception.message)
+
+    def test_no_path_then_error(self):
+        with self.assertRaises(ValueError):
+            batch.validate_job(dict(prefix="stripe_"))
+
+    def test_prefix_and_files_then_error(self):
+        with self.assertRaises(ValueError):
+            batch.validate_job(dict(path="/scan_1", prefix="stripe_",
+                                    files=["a_1.h5", "a_2.h5"]))
+
+
+class RunJobTest(unittest.TestCase):
+
+    @patch(VDSGenerator_patch_path)
+    def test_run_job(self, init_mock):
+        gen_mock = init_mock.return_value
+
+        result = batch.run_job(dict(path="/scan_1", files=["a_1.h5"],
+                                    shape=[3, 256, 2048], data_type="int16"))
+
+        init_mock.assert_called_once_with(
+            path="/scan_1", files=["a_1.h5"],
+            source=dict(shape=(3, 256, 2048), dtype="int16"))
+        gen_mock.generate_vds.assert_called_once_with()
+        self.assertEqual((True, gen_mock.output_file), result)
+
+    @patch(VDSGenerator_patch_path)
+    def test_run_job_append(self, init_mock):
+        gen_mock = init_mock.return_value
+
+        batch.run_job(dict(path="/scan_1", prefix="stripe_", append=True,
+                           layout="frames"))
+
+        init_mock.assert_called_once_with(path="/scan_1", prefix="stripe_",
+                                          append=True, layout="frames")
+        gen_mock.append_vds.assert_called_once_with()
+        gen_mock.generate_vds.assert_not_called()
+
+    @patch(batch_patch_path + '.load_geometry')
+    @patch(VDSGenerator_patch_path)
+    def test_run_job_geometry_file(self, init_mock, load_mock):
+        batch.run_job(dict(path="/scan_1", prefix="module_", layout="grid",
+                           geometry="/scan_1/detector.json"))
+
+        load_mock.assert_called_once_with("/scan_1/detector.json")
+        init_mock.assert_called_once_with(path="/scan_1", prefix="module_",
+                                          layout="grid",
+                                          geometry=load_mock.return_value)
+
+    @patch(VDSGenerator_patch_path, side_effect=IOError("No files"))
+    def test_run_job_error_then_failure(self, _):
+        result = batch.run_job(dict(path="/scan_1", prefix="stripe_"))
+
+        self.assertEqual((False, "IOError: No files"), result)
+
+
+class RunBatchTest(unittest.TestCase):
+
+    @patch(batch_patch_path + '.Pool')
+    def test_run_batch(self, pool_init_mock):
+        pool_mock = pool_init_mock.return_value
+        pool_mock.imap.return_value = [(True, "/scan_1/vds.h5"),
+                                       (False, "IOError: No files")]
+        jobs = [dict(path="/scan_1"), dict(path="/scan_2")]
+
+        results = batch.run_batch(jobs, processes=8)
+
+        pool_init_mock.assert_called_once_with(2)
+        pool_mock.imap.assert_called_once_with(batch.run_job, jobs)
+        pool_mock.close.assert_called_once_with()
+        pool_mock.join.assert_called_once_with()
+        self.assertEqual(pool_mock.imap.return_value, results)
+
+
+class MainTest(unittest.TestCase):
+
+    jobs = [dict(path="/scan_1", prefix="stripe_"),
+            dict(path="/scan_2", prefix="stripe_")]
+
+    @patch(batch_patch_path + '.run_batch',
+           return_value=[(True, "/scan_1/vds.h5"), (True, "/scan_2/vds.h5")])
+    @patch(batch_patch_path + '.read_manifest', return_value=jobs)
+    @patch(batch_patch_path + '.parse_args',
+           return_value=MagicMock(manifest="/test/manifest.json",
+                                  processes=4, validate=False))
+    def test_main(self, parse_mock, read_mock, run_mock):
+        result = batch.main()
+
+        read_mock.assert_called_once_with("/test/manifest.json")
+        run_mock.assert_called_once_with(self.jobs, 4)
+        self.assertEqual(0, result)
+
+    @patch(batch_patch_path + '.run_batch',
+           return_value=[(True, "/scan_1/vds.h5"), (False, "IOError")])
+    @patch(batch_patch_path + '.read_manifest', return_value=jobs)
+    @patch(batch_patch_path + '.parse_args',
+           return_value=MagicMock(manifest="/test/manifest.json",
+                                  processes=4, validate=False))
+    def test_main_failed_job(self, parse_mock, read_mock, run_mock):
+        self.assertEqual(1, batch.main())
+
+    @patch(batch_patch_path + '.run_batch')
+    @patch(batch_patch_path + '.read_manifest',
+           return_value=[dict(prefix="stripe_")])
+    @patch(batch_patch_path + '.parse_args',
+           return_value=MagicMock(manifest="/test/manifest.json",
+                                  processes=4, validate=False))
+    def test_main_invalid_then_no_run(self, parse_mock, read_mock, run_mock):
+        self.assertEqual(1, batch.main())
+
+        run_mock.assert_not_called()
+
+    @patch(batch_patch_path + '.run_batch')
+    @patch(batch_patch_path + '.read_manifest', return_value=jobs)
+    @patch(batch_patch_path + '.parse_args',
+           return_value=MagicMock(manifest="/test/manifest.json",
+                                  processes=4, validate=True))
+    def test_main_validate_then_no_run(self, parse_mock, read_mock, run_mock):
+        self.assertEqual(0, batch.main())
+
+        run_mock.assert_not_called()
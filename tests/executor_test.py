@@ -0,0 +1,115 @@
+import time
+import unittest
+
+from pkg_resources import require
+require("mock")
+from mock import MagicMock, patch
+
+from vdsgen import hooks
+from vdsgen.executor import VDSExecutor, VDSJob, GenerationCancelled, \
+    GenerationTimeout
+
+executor_patch_path = "vdsgen.executor"
+VDSGenerator_patch_path = executor_patch_path + ".VDSGenerator"
+
+
+class VDSJobTest(unittest.TestCase):
+
+    def test_cancel_then_error_before_next_event(self):
+        job = VDSJob()
+        job.before(hooks.PLAN, output_file="/test/vds.h5")
+
+        job.cancel()
+
+        with self.assertRaises(GenerationCancelled):
+            job.before(hooks.WRITE, output_file="/test/vds.h5")
+
+    @patch('time.time', side_effect=[100.0, 105.0, 111.0])
+    def test_deadline_then_timeout(self, _):
+        job = VDSJob(timeout=10)
+
+        job.before(hooks.PLAN, output_file="/test/vds.h5")
+        with self.assertRaises(GenerationTimeout):
+            job.before(hooks.WRITE, output_file="/test/vds.h5")
+
+    @patch(VDSGenerator_patch_path)
+    def test_run(self, gen_mock):
+        profiler = MagicMock()
+        callback = MagicMock()
+        job = VDSJob()
+        job.add_done_callback(callback)
+
+        job.run("/test/path", False, dict(prefix="stripe_",
+                                          hooks=[profiler]))
+
+        gen_mock.assert_called_once_with("/test/path", prefix="stripe_",
+                                         hooks=[job, profiler], append=False)
+        self.assertTrue(job.done())
+        self.assertEqual(gen_mock.return_value.generate_vds.return_value,
+                         job.get())
+        callback.assert_called_once_with(job)
+
+    @patch(VDSGenerator_patch_path)
+    def test_run_append(self, gen_mock):
+        job = VDSJob()
+
+        job.run("/test/path", True, dict(prefix="stripe_"))
+
+        gen_mock.assert_called_once_with("/test/path", prefix="stripe_",
+                                         hooks=[job], append=True)
+        gen_mock.return_value.append_vds.assert_called_once_with()
+        gen_mock.return_value.generate_vds.assert_not_called()
+
+    @patch(VDSGenerator_patch_path)
+    def test_run_error(self, gen_mock):
+        gen_mock.return_value.generate_vds.side_effect = IOError("No files")
+        job = VDSJob()
+
+        job.run("/test/path", False, dict(prefix="stripe_"))
+
+        self.assertFalse(job.cancelled())
+        with self.assertRaises(IOError):
+            job.get()
+
+    @patch(VDSGenerator_patch_path)
+    def test_cancelled_before_start_then_not_generated(self, gen_mock):
+        job = VDSJob()
+        job.cancel()
+
+        job.run("/test/path", False, dict(prefix="stripe_"))
+
+        gen_mock.assert_not_called()
+        self.assertTrue(job.cancelled())
+
+    @patch(VDSGenerator_patch_path)
+    def test_callback_error_then_logged(self, _):
+        job = VDSJob()
+        job.logger = MagicMock()
+        job.run("/test/path", False, dict())
+
+        job.add_done_callback(MagicMock(side_effect=ValueError("Bad")))
+
+        job.logger.exception.assert_called_once_with(
+            "Error in done callback of VDS job")
+
+    def test_get_not_done_then_timeout(self):
+        with self.assertRaises(GenerationTimeout):
+            VDSJob().get(0.01)
+
+
+class VDSExecutorTest(unittest.TestCase):
+
+    @patch(VDSGenerator_patch_path)
+    def test_submit(self, gen_mock):
+        gen_mock.return_value.generate_vds.side_effect = \
+            lambda: time.sleep(0.01) or dict(timings=dict(), counters=dict())
+
+        with VDSExecutor(threads=2) as executor:
+            jobs = [executor.submit("/test/scan_{}".format(idx),
+                                    prefix="stripe_")
+                    for idx in range(3)]
+
+        self.assertTrue(all(job.done() for job in jobs))
+        self.assertEqual([dict(timings=dict(), counters=dict())] * 3,
+                         [job.get() for job in jobs])
+        self.assertEqual(3, gen_mock.call_count)
@@ -0,0 +1,115 @@
+import unittest
+
+from pkg_resources import require
+require("mock")
+from mock import patch, mock_open
+
+from vdsgen import geometry
+
+geometry_patch_path = "vdsgen.geometry"
+
+
+class LoadGeometryTest(unittest.TestCase):
+
+    def test_load_geometry(self):
+        open_mock = mock_open(read_data='{"rows": 2, "columns": 4}')
+
+        with patch('__builtin__.open', open_mock):
+            description = geometry.load_geometry("/test/detector.json")
+
+        open_mock.assert_called_once_with("/test/detector.json", "r")
+        self.assertEqual(dict(rows=2, columns=4), description)
+
+
+class AxisPositionsTest(unittest.TestCase):
+
+    def test_single_gap(self):
+        self.assertEqual([0, 266, 532],
+                         geometry.axis_positions(3, 256, 10))
+
+    def test_gap_list(self):
+        self.assertEqual([0, 266, 622],
+                         geometry.axis_positions(3, 256, [10, 100]))
+
+    def test_wrong_number_of_gaps_then_error(self):
+        with self.assertRaises(ValueError):
+            geometry.axis_positions(3, 256, [10])
+
+
+class GridOffsetsTest(unittest.TestCase):
+
+    def test_grid_offsets_row_first(self):
+        offsets = geometry.grid_offsets(2, 3, 256, 1024,
+                                        row_gap=10, column_gap=[5, 20])
+
+        self.assertEqual([(0, 0), (0, 1029), (0, 2073),
+                          (266, 0), (266, 1029), (266, 2073)], offsets)
+
+
+class ParseGeometryTest(unittest.TestCase):
+
+    def test_grid(self):
+        offsets = geometry.parse_geometry(
+            dict(rows=2, columns=1, row_gap=10), 2, 256, 1024)
+
+        self.assertEqual([(0, 0), (266, 0)], offsets)
+
+    def test_offsets(self):
+        offsets = geometry.parse_geometry(
+            dict(offsets=[[0, 1024], [0, 0]]), 2, 256, 1024)
+
+        self.assertEqual([(0, 1024), (0, 0)], offsets)
+
+    def test_no_tiles_then_error(self):
+        with self.assertRaises(ValueError):
+            geometry.parse_geometry(dict(rows=2), 2, 256, 1024)
+
+    def test_wrong_number_of_tiles_then_error(self):
+        with self.assertRaises(ValueError) as e:
+            geometry.parse_geometry(dict(rows=2, columns=2), 3, 256, 1024)
+
+        self.assertEqual("Geometry has 4 tiles for 3 sources",
+                         e.exception.message)
+
+    def test_negative_offset_then_error(self):
+        with self.assertRaises(ValueError):
+            geometry.parse_geometry(dict(offsets=[[0, 0], [-10, 0]]),
+                                    2, 256, 1024)
+
+    @patch(geometry_patch_path + '.check_overlaps')
+    def test_checks_overlaps(self, check_mock):
+        geometry.parse_geometry(dict(offsets=[[0, 0], [256, 0]]),
+                                2, 256, 1024)
+
+        check_mock.assert_called_once_with([(0, 0), (256, 0)], 256, 1024)
+
+
+class CheckOverlapsTest(unittest.TestCase):
+
+    def test_touching_then_no_error(self):
+        geometry.check_overlaps([(0, 0), (0, 1024), (256, 0), (256, 1024)],
+                                256, 1024)
+
+    def test_overlap_then_error(self):
+        with self.assertRaises(ValueError) as e:
+            geometry.check_overlaps([(0, 0), (512, 0), (200, 1000)],
+                                    256, 1024)
+
+        self.assertEqual("Tiles at (0, 0) and (200, 1000) overlap",
+                         e.exception.message)
+
+
+class CompactOffsetsTest(unittest.TestCase):
+
+    def test_compact_offsets(self):
+        offsets = geometry.compact_offsets(
+            [(0, 1034), (0, 0), (300, 0), (300, 1034)], 256, 1024)
+
+        self.assertEqual([(0, 1024), (0, 0), (256, 0), (256, 1024)], offsets)
+
+
+class GeometryShapeTest(unittest.TestCase):
+
+    def test_geometry_shape(self):
+        self.assertEqual((522, 2058), geometry.geometry_shape(
+            [(0, 0), (0, 1034), (266, 0), (266, 1034)], 256, 1024))
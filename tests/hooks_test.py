@@ -0,0 +1,85 @@
+import signal
+import unittest
+
+from pkg_resources import require
+require("mock")
+from mock import MagicMock, patch, call, mock_open
+
+from vdsgen import hooks
+from vdsgen.hooks import ProfileHook, SampleHook
+
+hooks_patch_path = "vdsgen.hooks"
+
+
+class ProfileHookTest(unittest.TestCase):
+
+    def test_nested_events_then_profile_outermost(self):
+        hook = ProfileHook()
+        hook.profile = MagicMock()
+
+        hook.before(hooks.READ_METADATA, files=["a_1.h5"])
+        hook.before(hooks.GRAB_METADATA, file_path="a_1.h5")
+        hook.after(hooks.GRAB_METADATA, file_path="a_1.h5")
+        hook.after(hooks.READ_METADATA, files=["a_1.h5"])
+
+        hook.profile.enable.assert_called_once_with()
+        hook.profile.disable.assert_called_once_with()
+
+    def test_write(self):
+        hook = ProfileHook()
+        hook.profile = MagicMock()
+
+        hook.write("/test/vdsgen.prof")
+
+        hook.profile.dump_stats.assert_called_once_with("/test/vdsgen.prof")
+
+
+class SampleHookTest(unittest.TestCase):
+
+    @patch('signal.setitimer')
+    @patch('signal.signal', return_value="default")
+    def test_nested_events_then_sample_outermost(self, signal_mock,
+                                                 timer_mock):
+        hook = SampleHook(interval=0.01)
+
+        hook.before(hooks.PLAN, output_file="/test/vds.h5")
+        hook.before(hooks.CREATE_MAP, file_path="a_1.h5",
+                    target_index=(slice(None),))
+        hook.after(hooks.CREATE_MAP, file_path="a_1.h5",
+                   target_index=(slice(None),))
+        hook.after(hooks.PLAN, output_file="/test/vds.h5")
+
+        signal_mock.assert_has_calls([
+            call(signal.SIGPROF, hook.sample),
+            call(signal.SIGPROF, "default")])
+        timer_mock.assert_has_calls([
+            call(signal.ITIMER_PROF, 0.01, 0.01),
+            call(signal.ITIMER_PROF, 0)])
+
+    def test_sample_then_write_folded(self):
+        hook = SampleHook()
+        outer = MagicMock(f_back=None)
+        outer.f_code.co_filename = "/vdsgen/vdsgenerator.py"
+        outer.f_code.co_name = "plan_vds"
+        inner = MagicMock(f_back=outer)
+        inner.f_code.co_filename = "/vdsgen/plan.py"
+        inner.f_code.co_name = "add_mapping"
+
+        hook.sample(signal.SIGPROF, inner)
+        hook.sample(signal.SIGPROF, inner)
+        hook.sample(signal.SIGPROF, outer)
+        with patch('__builtin__.open', mock_open()) as open_mock:
+            hook.write("/test/vdsgen.folded")
+
+        open_mock().write.assert_has_calls([
+            call("vdsgenerator.py:plan_vds 1\n"),
+            call("vdsgenerator.py:plan_vds;plan.py:add_mapping 2\n")])
+
+
+class ProfileHookFactoryTest(unittest.TestCase):
+
+    def test_profile_hook(self):
+        self.assertIsInstance(hooks.profile_hook("/test/run.folded"),
+                              SampleHook)
+        self.assertIsInstance(hooks.profile_hook("/test/run.prof"),
+                              ProfileHook)
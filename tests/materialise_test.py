@@ -0,0 +1,178 @@
+import unittest
+
+from pkg_resources import require
+require("mock")
+from mock import MagicMock, patch, call
+
+import numpy as np
+
+from vdsgen import materialise
+
+materialise_patch_path = "vdsgen.materialise"
+h5py_patch_path = "h5py"
+
+
+class BlockTest(unittest.TestCase):
+
+    def test_default_chunks(self):
+        self.assertEqual((1, 256, 2048),
+                         materialise.default_chunks((10, 256, 2048), 2))
+        self.assertEqual((10,), materialise.default_chunks((10,), 8))
+
+    def test_block_frames(self):
+        # 1MB frames, 7 blocks in memory with 3 workers
+        frames = materialise.block_frames((100, 512, 1024), 2, (2, 512, 1024),
+                                          64, 3)
+
+        self.assertEqual(8, frames)
+
+    def test_block_frames_one_worker(self):
+        frames = materialise.block_frames((100, 512, 1024), 2, (1, 512, 1024),
+                                          64, 1)
+
+        self.assertEqual(64, frames)
+
+    def test_block_frames_limited_by_frames(self):
+        frames = materialise.block_frames((10, 512, 1024), 2, (1, 512, 1024),
+                                          64, 1)
+
+        self.assertEqual(10, frames)
+
+    @patch(materialise_patch_path + '.logger')
+    def test_block_frames_memory_too_small_then_one_chunk(self, logger_mock):
+        frames = materialise.block_frames((100, 512, 1024), 2, (4, 512, 1024),
+                                          1, 4)
+
+        self.assertEqual(4, frames)
+        self.assertEqual(1, logger_mock.warning.call_count)
+
+    def test_frame_blocks(self):
+        self.assertEqual([(0, 4), (4, 8), (8, 10)],
+                         materialise.frame_blocks(10, 4))
+
+
+class ReadBlocksTest(unittest.TestCase):
+
+    @patch(h5py_patch_path + '.File')
+    def test_read_blocks_one_worker(self, h5file_mock):
+        dataset_mock = h5file_mock.return_value.__enter__.return_value\
+            .__getitem__.return_value
+
+        blocks = list(materialise.read_blocks("/test/vds.h5", "full_frame",
+                                              [(0, 4), (4, 6)], 1))
+
+        h5file_mock.assert_called_once_with("/test/vds.h5", "r")
+        dataset_mock.__getitem__.assert_has_calls([call(slice(0, 4)),
+                                                   call(slice(4, 6))])
+        self.assertEqual([(0, 4), (4, 6)], [block for block, _ in blocks])
+
+    @patch(materialise_patch_path + '.Pool')
+    def test_read_blocks_pool(self, pool_init_mock):
+        pool_mock = pool_init_mock.return_value
+        results = [MagicMock() for _ in range(5)]
+        pool_mock.apply_async.side_effect = results
+        blocks = [(idx, idx + 1) for idx in range(5)]
+
+        read = materialise.read_blocks("/test/vds.h5", "full_frame", blocks,
+                                       2)
+        first = next(read)
+
+        pool_init_mock.assert_called_once_with(
+            2, materialise._open_dataset, ("/test/vds.h5", "full_frame"))
+        # Only two blocks per worker are submitted ahead of the writer
+        self.assertEqual(4, pool_mock.apply_async.call_count)
+        self.assertEqual(((0, 1), results[0].get.return_value), first)
+
+        rest = list(read)
+
+        self.assertEqual(blocks[1:], [block for block, _ in rest])
+        pool_mock.apply_async.assert_called_with(materialise._read_block,
+                                                 ((4, 5),))
+        pool_mock.close.assert_called_once_with()
+        pool_mock.join.assert_called_once_with()
+
+
+class MaterialiseVDSTest(unittest.TestCase):
+
+    def setUp(self):
+        self.vds_dataset = MagicMock(shape=(6, 256, 2048), dtype="uint16",
+                                     fillvalue=1)
+        self.vds_dataset.attrs.items.return_value = [("rdcc_nslots", 521),
+                                                     ("units", "counts")]
+
+    @patch('os.path.isfile', return_value=False)
+    @patch(materialise_patch_path + '.read_blocks')
+    @patch(h5py_patch_path + '.File')
+    def test_materialise(self, h5file_mock, read_mock, _):
+        vds_mock, output_mock = MagicMock(), MagicMock()
+        h5file_mock.return_value.__enter__.side_effect = [vds_mock,
+                                                          output_mock]
+        vds_mock.get.return_value = self.vds_dataset
+        output_mock.get.return_value = None
+        target_mock = output_mock.create_dataset.return_value
+        data = np.zeros((3, 256, 2048), dtype="uint16")
+        read_mock.return_value = [((0, 3), data), ((3, 6), data)]
+
+        result = materialise.materialise_vds(
+            "/test/vds.h5", "/test/out.h5", compression="gzip",
+            compression_opts=4, shuffle=True, workers=4, memory=1024)
+
+        h5file_mock.assert_has_calls([
+            call("/test/vds.h5", "r"),
+            call("/test/out.h5", "w", libver="latest")], any_order=True)
+        output_mock.create_dataset.assert_called_once_with(
+            "full_frame", shape=(6, 256, 2048), dtype="uint16",
+            chunks=(1, 256, 2048), compression="gzip", compression_opts=4,
+            shuffle=True, fillvalue=1)
+        target_mock.attrs.update.assert_called_once_with(
+            dict(units="counts"))
+        read_mock.assert_called_once_with("/test/vds.h5", "full_frame",
+                                          [(0, 6)], 4)
+        target_mock.__setitem__.assert_has_calls([
+            call(slice(0, 3), data), call(slice(3, 6), data)])
+        self.assertEqual(6, result["frames"])
+        self.assertEqual(6 * 256 * 2048 * 2, result["bytes"])
+
+    @patch(h5py_patch_path + '.File')
+    def test_no_node_then_error(self, h5file_mock):
+        h5file_mock.return_value.__enter__.return_value.get.return_value = \
+            None
+
+        with self.assertRaises(IOError):
+            materialise.materialise_vds("/test/vds.h5", "/test/out.h5")
+
+    @patch('os.path.isfile', return_value=True)
+    @patch(h5py_patch_path + '.File')
+    def test_output_node_exists_then_error(self, h5file_mock, _):
+        vds_mock, output_mock = MagicMock(), MagicMock()
+        h5file_mock.return_value.__enter__.side_effect = [vds_mock,
+                                                          output_mock]
+        vds_mock.get.return_value = self.vds_dataset
+
+        with self.assertRaises(IOError):
+            materialise.materialise_vds("/test/vds.h5", "/test/out.h5",
+                                        output_node="data")
+
+        output_mock.create_dataset.assert_not_called()
+
+    def test_into_itself_then_error(self):
+        with self.assertRaises(ValueError):
+            materialise.materialise_vds("/test/vds.h5", "/test/../test/vds.h5")
+
+
+class MainTest(unittest.TestCase):
+
+    @patch(materialise_patch_path + '.materialise_vds')
+    @patch(materialise_patch_path + '.parse_args',
+           return_value=MagicMock(vds_file="/test/vds.h5",
+                                  output="/test/out.h5", node="full_frame",
+                                  output_node=None, chunks=[4, 256, 2048],
+                                  compression="lzf", compression_opts=None,
+                                  shuffle=False, workers=8, memory=2048))
+    def test_main(self, parse_mock, materialise_mock):
+        materialise.main()
+
+        materialise_mock.assert_called_once_with(
+            "/test/vds.h5", "/test/out.h5", node="full_frame",
+            output_node=None, chunks=[4, 256, 2048], compression="lzf",
+            compression_opts=None, shuffle=False, workers=8, memory=2048)
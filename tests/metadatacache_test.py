@@ -0,0 +1,146 @@
+import unittest
+
+from pkg_resources import require
+require("mock")
+from mock import patch, mock_open
+from collections import OrderedDict
+
+import numpy as np
+
+from vdsgen.metadatacache import MetadataCache
+
+cache_patch_path = "vdsgen.metadatacache"
+MetadataCache_patch_path = cache_patch_path + ".MetadataCache"
+
+
+class MetadataCacheTester(MetadataCache):
+
+    """A version of MetadataCache without initialisation."""
+
+    def __init__(self, **kwargs):
+        for attribute, value in kwargs.items():
+            self.__setattr__(attribute, value)
+
+
+class MetadataCacheInitTest(unittest.TestCase):
+
+    @patch(MetadataCache_patch_path + '.load')
+    def test_init(self, load_mock):
+        cache = MetadataCache("/test/cache.json", max_entries=5)
+
+        load_mock.assert_called_once_with()
+        self.assertEqual("/test/cache.json", cache.cache_file)
+        self.assertEqual(5, cache.max_entries)
+        self.assertEqual(load_mock.return_value, cache.entries)
+
+
+class LoadSaveTest(unittest.TestCase):
+
+    entry = dict(path="/test/stripe_1.h5", node="data", size=10, mtime=1.5,
+                 frames=[3], height=256, width=2048, dtype="<u2")
+
+    @patch('os.path.isfile', return_value=False)
+    def test_load_no_file(self, _):
+        cache = MetadataCacheTester(cache_file="/test/cache.json")
+
+        self.assertEqual(OrderedDict(), cache.load())
+
+    @patch('os.path.isfile', return_value=True)
+    @patch('json.load')
+    def test_load(self, json_mock, _):
+        cache = MetadataCacheTester(cache_file="/test/cache.json")
+        json_mock.return_value = [self.entry]
+
+        with patch('__builtin__.open', mock_open()):
+            entries = cache.load()
+
+        self.assertEqual(OrderedDict([(("/test/stripe_1.h5", "data"),
+                                       self.entry)]), entries)
+
+    @patch('os.path.isfile', return_value=True)
+    @patch('json.load', side_effect=ValueError)
+    def test_load_invalid_then_empty(self, _, _2):
+        cache = MetadataCacheTester(cache_file="/test/cache.json")
+
+        with patch('__builtin__.open', mock_open()):
+            entries = cache.load()
+
+        self.assertEqual(OrderedDict(), entries)
+
+    @patch('os.path.isfile', return_value=True)
+    @patch('json.load', return_value=dict(path="/test/stripe_1.h5"))
+    def test_load_not_list_then_empty(self, _, _2):
+        cache = MetadataCacheTester(cache_file="/test/cache.json")
+
+        with patch('__builtin__.open', mock_open()):
+            entries = cache.load()
+
+        self.assertEqual(OrderedDict(), entries)
+
+    @patch('os.path.isfile', return_value=True)
+    @patch('json.load')
+    def test_load_invalid_entry_then_empty(self, json_mock, _):
+        cache = MetadataCacheTester(cache_file="/test/cache.json")
+        json_mock.return_value = [self.entry, dict(path="/test/stripe_2.h5",
+                                                   node="data")]
+
+        with patch('__builtin__.open', mock_open()):
+            entries = cache.load()
+
+        self.assertEqual(OrderedDict(), entries)
+
+    @patch('os.getpid', return_value=42)
+    @patch('os.rename')
+    @patch('json.dump')
+    def test_save(self, dump_mock, rename_mock, _):
+        entries = OrderedDict([(("/test/stripe_1.h5", "data"), self.entry)])
+        cache = MetadataCacheTester(cache_file="/test/cache.json",
+                                    entries=entries)
+        open_mock = mock_open()
+
+        with patch('__builtin__.open', open_mock):
+            cache.save()
+
+        open_mock.assert_called_once_with("/test/cache.json.42.tmp", "w")
+        dump_mock.assert_called_once_with([self.entry], open_mock())
+        rename_mock.assert_called_once_with("/test/cache.json.42.tmp",
+                                            "/test/cache.json")
+
+
+class GetPutTest(unittest.TestCase):
+
+    metadata = dict(frames=(3,), height=256, width=2048,
+                    dtype=np.dtype("uint16"), chunks=(1, 256, 2048))
+
+    def setUp(self):
+        self.cache = MetadataCacheTester(cache_file="/test/cache.json",
+                                         entries=OrderedDict(),
+                                         max_entries=2)
+
+    @patch(MetadataCache_patch_path + '.identify', return_value=(10, 1.5))
+    def test_put_then_get(self, identify_mock):
+        self.cache.put("/test/stripe_1.h5", "data", self.metadata)
+
+        self.assertEqual(self.metadata,
+                         self.cache.get("/test/stripe_1.h5", "data"))
+        self.assertIsNone(self.cache.get("/test/stripe_1.h5", "other"))
+
+    @patch(MetadataCache_patch_path + '.identify',
+           side_effect=[(10, 1.5), (10, 2.5)])
+    def test_get_changed_file_then_none(self, identify_mock):
+        self.cache.put("/test/stripe_1.h5", "data", self.metadata)
+
+        self.assertIsNone(self.cache.get("/test/stripe_1.h5", "data"))
+        self.assertEqual(0, len(self.cache.entries))
+
+    @patch(MetadataCache_patch_path + '.identify', return_value=(10, 1.5))
+    def test_put_full_then_evict_least_recently_used(self, identify_mock):
+        self.cache.put("/test/stripe_1.h5", "data", self.metadata)
+        self.cache.put("/test/stripe_2.h5", "data", self.metadata)
+        self.cache.get("/test/stripe_1.h5", "data")
+
+        self.cache.put("/test/stripe_3.h5", "data", self.metadata)
+
+        self.assertEqual([("/test/stripe_1.h5", "data"),
+                          ("/test/stripe_3.h5", "data")],
+                         list(self.cache.entries.keys()))
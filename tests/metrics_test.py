@@ -0,0 +1,88 @@
+import json
+import unittest
+
+from pkg_resources import require
+require("mock")
+from mock import patch, mock_open
+
+from vdsgen import metrics
+from vdsgen.metrics import Metrics
+
+metrics_patch_path = "vdsgen.metrics"
+
+
+class MetricsTest(unittest.TestCase):
+
+    @patch('time.time', side_effect=[10.0, 12.5, 20.0, 21.0])
+    def test_timer(self, _):
+        run_metrics = Metrics()
+
+        with run_metrics.timer("metadata"):
+            pass
+        with run_metrics.timer("metadata"):
+            pass
+
+        self.assertEqual(dict(metadata=3.5), run_metrics.timings)
+
+    @patch('time.time', side_effect=[10.0, 12.5])
+    def test_timer_error_then_recorded(self, _):
+        run_metrics = Metrics()
+
+        with self.assertRaises(IOError):
+            with run_metrics.timer("write"):
+                raise IOError("Write failed")
+
+        self.assertEqual(dict(write=2.5), run_metrics.timings)
+
+    def test_count(self):
+        run_metrics = Metrics()
+
+        run_metrics.count("file_opens")
+        run_metrics.count("file_opens", 2)
+        run_metrics.count("maps", 6)
+
+        self.assertEqual(dict(timings=dict(),
+                              counters=dict(file_opens=3, maps=6)),
+                         run_metrics.to_dict())
+
+
+class WriteMetricsTest(unittest.TestCase):
+
+    run_metrics = dict(timings=dict(discovery=0.5),
+                       counters=dict(file_opens=3))
+
+    @patch('time.time', return_value=1500000000.0)
+    def test_format_prometheus(self, _):
+        text = metrics.format_prometheus(self.run_metrics,
+                                         dict(output='/a/"b".h5'))
+
+        self.assertEqual(
+            '# HELP vdsgen_phase_seconds Time taken by each phase of VDS '
+            'generation\n'
+            '# TYPE vdsgen_phase_seconds gauge\n'
+            'vdsgen_phase_seconds{output="/a/\\"b\\".h5",phase="discovery"} '
+            '0.5\n'
+            '# TYPE vdsgen_file_opens gauge\n'
+            'vdsgen_file_opens{output="/a/\\"b\\".h5"} 3\n'
+            '# TYPE vdsgen_last_run_timestamp_seconds gauge\n'
+            'vdsgen_last_run_timestamp_seconds{output="/a/\\"b\\".h5"} '
+            '1500000000.0\n', text)
+
+    @patch('os.getpid', return_value=123)
+    @patch('os.rename')
+    def test_write_prometheus_then_renamed(self, rename_mock, _):
+        with patch('__builtin__.open', mock_open()) as open_mock:
+            metrics.write_metrics(self.run_metrics, "/test/vdsgen.prom")
+
+        open_mock.assert_called_once_with("/test/vdsgen.prom.123.tmp", "w")
+        rename_mock.assert_called_once_with("/test/vdsgen.prom.123.tmp",
+                                            "/test/vdsgen.prom")
+
+    def test_write_json(self):
+        with patch('__builtin__.open', mock_open()) as open_mock:
+            metrics.write_metrics(self.run_metrics, "/test/metrics.json")
+
+        open_mock.assert_called_once_with("/test/metrics.json", "w")
+        written = "".join(args[0] for args, _
+                          in open_mock().write.call_args_list)
+        self.assertEqual(self.run_metrics, json.loads(written))
@@ -0,0 +1,372 @@
+import json
+import unittest
+
+from pkg_resources import require
+require("mock")
+from mock import MagicMock, patch, call, mock_open
+
+import numpy as np
+import h5py
+
+from vdsgen import plan
+from vdsgen.plan import VDSPlan, Mapping
+
+plan_patch_path = "vdsgen.plan"
+h5py_patch_path = "h5py"
+
+
+class IndexTest(unittest.TestCase):
+
+    def test_encode_decode(self):
+        index = (slice(0, 10, 3), slice(None), slice(5, 8))
+
+        encoded = plan.encode_index(index)
+
+        self.assertEqual([[0, 10, 3], [None, None, None], [5, 8, None]],
+                         encoded)
+        self.assertEqual(index, plan.decode_index(encoded))
+
+    def test_none(self):
+        self.assertIsNone(plan.encode_index(None))
+        self.assertIsNone(plan.decode_index(None))
+
+
+class PrintfTest(unittest.TestCase):
+
+    def test_is_printf(self):
+        self.assertTrue(plan.is_printf("/test/image_%b.h5"))
+        self.assertFalse(plan.is_printf("/test/image_%%b.h5"))
+        self.assertFalse(plan.is_printf("/test/image_1.h5"))
+
+    def test_format_printf(self):
+        self.assertEqual("/test/100%_12.h5",
+                         plan.format_printf("/test/100%%_%b.h5", 12))
+
+
+class SelectIndexTest(unittest.TestCase):
+
+    def test_select_unlimited(self):
+        space_mock = MagicMock(shape=(2, 256, 2048))
+
+        plan.select_index(space_mock,
+                          (slice(1, None, 3), slice(10, 20), slice(None)),
+                          (None, 256, 2048))
+
+        space_mock.select_hyperslab.assert_called_once_with(
+            (1, 10, 0), (h5py.h5s.UNLIMITED, 1, 1), (3, 1, 1),
+            block=(1, 10, 2048))
+
+    def test_select_unlimited_blocks(self):
+        space_mock = MagicMock(shape=(6, 256, 2048))
+
+        plan.select_index(space_mock,
+                          (slice(0, None, 3), slice(None), slice(None)),
+                          (None, 256, 2048), block_size=3)
+
+        space_mock.select_hyperslab.assert_called_once_with(
+            (0, 0, 0), (h5py.h5s.UNLIMITED, 1, 1), (3, 1, 1),
+            block=(3, 256, 2048))
+
+    def test_select_step(self):
+        space_mock = MagicMock(shape=(6, 256, 2048))
+
+        plan.select_index(space_mock,
+                          (slice(1, 6, 2), slice(None), slice(None)),
+                          (6, 256, 2048))
+
+        space_mock.select_hyperslab.assert_called_once_with(
+            (1, 0, 0), (3, 1, 1), (2, 1, 1), block=(1, 256, 2048))
+
+
+class VDSPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plan = VDSPlan("/test/vds.h5", "full_frame", (6, 256, 2048),
+                            np.dtype("uint16"),
+                            attributes=dict(rdcc_nslots=521))
+        self.plan.add_mapping("/test/stripe_1.h5", "data", (3, 256, 2048),
+                              (slice(0, 3), slice(None), slice(None)))
+        self.plan.add_mapping("/test/stripe_2.h5", "data", (3, 256, 2048),
+                              (slice(3, 6), slice(None), slice(None)),
+                              source_index=(slice(0, 3), slice(None),
+                                            slice(None)))
+
+    def test_init(self):
+        self.assertEqual("<u2", self.plan.dtype)
+        self.assertEqual(0x1, self.plan.fill_value)
+        self.assertEqual(Mapping("/test/stripe_1.h5", "data", (3, 256, 2048),
+                                 (slice(0, 3), slice(None), slice(None))),
+                         self.plan.mappings[0])
+
+    def test_to_dict_from_dict(self):
+        # Through JSON, to check the dict is serialisable
+        plan_dict = json.loads(json.dumps(self.plan.to_dict()))
+
+        self.assertEqual(self.plan, VDSPlan.from_dict(plan_dict))
+
+    def test_to_dict_from_dict_unlimited(self):
+        self.plan.maxshape = (None, 256, 2048)
+
+        plan_dict = json.loads(json.dumps(self.plan.to_dict()))
+
+        self.assertEqual([None, 256, 2048], plan_dict["maxshape"])
+        self.assertEqual(self.plan, VDSPlan.from_dict(plan_dict))
+
+    def test_not_equal(self):
+        other = VDSPlan.from_dict(self.plan.to_dict())
+        other.target_node = "compact"
+
+        self.assertNotEqual(self.plan, other)
+
+    @patch(h5py_patch_path + '.VirtualMap')
+    @patch(h5py_patch_path + '.VirtualSource')
+    @patch(h5py_patch_path + '.VirtualTarget')
+    def test_create_maps(self, target_mock, source_mock, map_mock):
+        map_list = self.plan.create_maps()
+
+        target_mock.assert_called_once_with("/test/vds.h5", "full_frame",
+                                            shape=(6, 256, 2048))
+        source_mock.assert_has_calls([
+            call("/test/stripe_1.h5", "data", shape=(3, 256, 2048)),
+            call("/test/stripe_2.h5", "data", shape=(3, 256, 2048))],
+            any_order=True)
+        source_mock.return_value.__getitem__.assert_called_once_with(
+            (slice(0, 3), slice(None), slice(None)))
+        target_mock.return_value.__getitem__.assert_has_calls([
+            call((slice(0, 3), slice(None), slice(None))),
+            call((slice(3, 6), slice(None), slice(None)))])
+        map_mock.assert_has_calls([
+            call(source_mock.return_value,
+                 target_mock.return_value.__getitem__.return_value,
+                 dtype="<u2"),
+            call(source_mock.return_value.__getitem__.return_value,
+                 target_mock.return_value.__getitem__.return_value,
+                 dtype="<u2")])
+        self.assertEqual([map_mock.return_value] * 2, map_list)
+
+    @patch(plan_patch_path + '.VDSPlan.create_maps')
+    def test_materialise_sub_group(self, create_mock):
+        file_mock = MagicMock()
+        file_mock.get.return_value = None
+        self.plan.target_node = "/entry/detector/data"
+
+        self.plan.materialise(file_mock)
+
+        file_mock.create_group.assert_called_once_with("/entry/detector")
+
+    @patch(plan_patch_path + '.VDSPlan.create_maps')
+    def test_materialise(self, create_mock):
+        file_mock = MagicMock()
+
+        self.plan.materialise(file_mock)
+
+        file_mock.create_virtual_dataset.assert_called_once_with(
+            VMlist=create_mock.return_value, fillvalue=0x1)
+        file_mock.__getitem__.assert_called_once_with("full_frame")
+        file_mock.__getitem__.return_value.attrs.update\
+            .assert_called_once_with(dict(rdcc_nslots=521))
+
+    @patch(plan_patch_path + '.VDSPlan.create_unlimited')
+    def test_materialise_unlimited(self, create_mock):
+        file_mock = MagicMock()
+        self.plan.maxshape = (None, 256, 2048)
+
+        self.plan.materialise(file_mock)
+
+        create_mock.assert_called_once_with(file_mock)
+        file_mock.create_virtual_dataset.assert_not_called()
+
+    @patch(h5py_patch_path + '.h5d.create')
+    def test_create_unlimited(self, create_mock):
+        vds_plan = VDSPlan("/test/vds.h5", "full_frame", (4, 16, 8), "uint16",
+                           maxshape=(None, 16, 8))
+        for idx in range(2):
+            vds_plan.add_mapping("/test/stripe_{}.h5".format(idx + 1), "data",
+                                 (2, 16, 8), (slice(idx, None, 2),
+                                              slice(None), slice(None)))
+        file_mock = MagicMock()
+
+        vds_plan.create_unlimited(file_mock)
+
+        (file_id, name, _, space), kwargs = create_mock.call_args
+        dcpl = kwargs["dcpl"]
+        self.assertEqual(file_mock.id, file_id)
+        self.assertEqual("full_frame", name)
+        self.assertEqual((h5py.h5s.UNLIMITED, 16, 8),
+                         space.get_simple_extent_dims(True))
+        self.assertEqual(2, dcpl.get_virtual_count())
+        self.assertEqual("/test/stripe_2.h5", dcpl.get_virtual_filename(1))
+        self.assertEqual(
+            ((1, 0, 0), (2, 1, 1), (h5py.h5s.UNLIMITED, 1, 1), (1, 16, 8)),
+            dcpl.get_virtual_vspace(1).get_regular_hyperslab())
+        self.assertEqual(
+            ((0, 0, 0), (1, 1, 1), (h5py.h5s.UNLIMITED, 1, 1), (1, 16, 8)),
+            dcpl.get_virtual_srcspace(1).get_regular_hyperslab())
+
+    @patch(h5py_patch_path + '.h5d.create')
+    def test_create_unlimited_printf(self, create_mock):
+        vds_plan = VDSPlan("/test/vds.h5", "full_frame", (4, 16, 8), "uint16",
+                           maxshape=(None, 16, 8))
+        vds_plan.add_mapping("/test/image_%b.h5", "data", (2, 16, 8),
+                             (slice(0, None, 2), slice(None), slice(None)))
+
+        vds_plan.create_unlimited(MagicMock())
+
+        dcpl = create_mock.call_args[1]["dcpl"]
+        self.assertEqual("/test/image_%b.h5", dcpl.get_virtual_filename(0))
+        self.assertEqual(
+            ((0, 0, 0), (2, 1, 1), (h5py.h5s.UNLIMITED, 1, 1), (2, 16, 8)),
+            dcpl.get_virtual_vspace(0).get_regular_hyperslab())
+        source_space = dcpl.get_virtual_srcspace(0)
+        self.assertEqual((2, 16, 8), source_space.shape)
+        self.assertEqual(2 * 16 * 8, source_space.get_select_npoints())
+
+    def test_expand_printf(self):
+        vds_plan = VDSPlan("/test/vds.h5", "full_frame", (6, 16, 8), "uint16",
+                           maxshape=(None, 16, 8))
+        vds_plan.add_mapping("/test/image_%b.h5", "data", (2, 16, 8),
+                             (slice(0, None, 2), slice(None), slice(None)))
+
+        expanded = vds_plan.expand_printf()
+
+        self.assertEqual([
+            Mapping("/test/image_{}.h5".format(idx), "data", (2, 16, 8),
+                    (slice(2 * idx, 2 * idx + 2), slice(None), slice(None)))
+            for idx in range(3)], expanded.mappings)
+        self.assertEqual(1, len(vds_plan.mappings))
+
+
+class SubstituteTest(unittest.TestCase):
+
+    def test_substitute(self):
+        vds_plan = VDSPlan("/scan_1/vds.h5", "full_frame", (6, 256, 2048),
+                           "uint16", attributes=dict(rdcc_nslots=521))
+        vds_plan.add_mapping("/scan_1/stripe_1.h5", "data", (3, 256, 2048),
+                             (slice(0, 3), slice(None), slice(None)))
+
+        new_plan = vds_plan.substitute([(r"scan_\d+", "scan_2"),
+                                        ("stripe_", "module_")])
+
+        self.assertEqual("/scan_2/vds.h5", new_plan.output_file)
+        self.assertEqual("/scan_2/module_1.h5", new_plan.mappings[0].file)
+        self.assertEqual(vds_plan.mappings[0].target_index,
+                         new_plan.mappings[0].target_index)
+        self.assertEqual(vds_plan.attributes, new_plan.attributes)
+        self.assertEqual("/scan_1/stripe_1.h5", vds_plan.mappings[0].file)
+
+
+class FromDatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dataset_mock = MagicMock(shape=(6, 256, 2048), dtype="uint16",
+                                      maxshape=(6, 256, 2048),
+                                      fillvalue=np.uint16(1))
+        self.dataset_mock.name = "/full_frame"
+        self.dataset_mock.file.filename = "/test/vds.h5"
+        self.dataset_mock.attrs.items.return_value = [
+            ("rdcc_nslots", np.int64(521))]
+        self.dcpl_mock = self.dataset_mock.id.get_create_plist.return_value
+        self.dcpl_mock.get_layout.return_value = h5py.h5d.VIRTUAL
+        self.dcpl_mock.get_virtual_count.return_value = 1
+        self.dcpl_mock.get_virtual_filename.return_value = "stripe_1.h5"
+        self.dcpl_mock.get_virtual_dsetname.return_value = "data"
+        self.dcpl_mock.get_virtual_vspace.return_value.get_select_bounds\
+            .return_value = ((3, 0, 0), (5, 255, 2047))
+
+    def test_from_dataset(self):
+        source_space = self.dcpl_mock.get_virtual_srcspace.return_value
+        source_space.shape = (4, 256, 2048)
+        source_space.get_select_type.return_value = h5py.h5s.SEL_HYPERSLABS
+        source_space.is_regular_hyperslab.return_value = False
+        source_space.get_select_bounds.return_value = ((0, 0, 0),
+                                                       (2, 255, 2047))
+
+        vds_plan = VDSPlan.from_dataset(self.dataset_mock)
+
+        self.assertEqual("/test/vds.h5", vds_plan.output_file)
+        self.assertEqual("/full_frame", vds_plan.target_node)
+        self.assertEqual(1, vds_plan.fill_value)
+        self.assertEqual(dict(rdcc_nslots=521), vds_plan.attributes)
+        self.assertEqual([Mapping(
+            "stripe_1.h5", "data", (4, 256, 2048),
+            (slice(3, 6), slice(0, 256), slice(0, 2048)),
+            (slice(0, 3), slice(0, 256), slice(0, 2048)))],
+            vds_plan.mappings)
+
+    def test_from_dataset_unlimited(self):
+        self.dataset_mock.maxshape = (None, 256, 2048)
+        target_space = self.dcpl_mock.get_virtual_vspace.return_value
+        target_space.get_select_type.return_value = h5py.h5s.SEL_HYPERSLABS
+        target_space.get_regular_hyperslab.return_value = (
+            (1, 0, 0), (2, 1, 1), (h5py.h5s.UNLIMITED, 1, 1), (1, 256, 2048))
+        source_space = self.dcpl_mock.get_virtual_srcspace.return_value
+        source_space.shape = (0, 0, 0)
+        source_space.get_select_type.return_value = h5py.h5s.SEL_HYPERSLABS
+        source_space.get_regular_hyperslab.return_value = (
+            (0, 0, 0), (1, 1, 1), (h5py.h5s.UNLIMITED, 1, 1), (1, 256, 2048))
+
+        vds_plan = VDSPlan.from_dataset(self.dataset_mock)
+
+        self.assertEqual((None, 256, 2048), vds_plan.maxshape)
+        self.assertEqual([Mapping(
+            "stripe_1.h5", "data", (3, 256, 2048),
+            (slice(1, None, 2), slice(0, 256), slice(0, 2048)),
+            (slice(0, None), slice(0, 256), slice(0, 2048)))],
+            vds_plan.mappings)
+
+    def test_not_virtual_then_error(self):
+        self.dcpl_mock.get_layout.return_value = h5py.h5d.CHUNKED
+
+        with self.assertRaises(IOError):
+            VDSPlan.from_dataset(self.dataset_mock)
+
+
+class MaterialisePlansTest(unittest.TestCase):
+
+    @patch('os.path.isfile', side_effect=[False, True])
+    @patch(h5py_patch_path + '.File')
+    def test_materialise_plans(self, h5file_mock, _):
+        plans = [MagicMock(output_file="/test/a.h5", target_node="data"),
+                 MagicMock(output_file="/test/b.h5", target_node="data"),
+                 MagicMock(output_file="/test/a.h5", target_node="compact")]
+        vds_file_mock = h5file_mock.return_value.__enter__.return_value
+        vds_file_mock.get.return_value = None
+
+        plan.materialise_plans(plans)
+
+        h5file_mock.assert_has_calls([
+            call("/test/a.h5", "w", libver="latest"),
+            call("/test/b.h5", "a", libver="latest")], any_order=True)
+        self.assertEqual(2, h5file_mock.call_count)
+        for plan_mock in plans:
+            plan_mock.materialise.assert_called_once_with(vds_file_mock)
+
+    @patch('os.path.isfile', return_value=True)
+    @patch(h5py_patch_path + '.File')
+    def test_node_exists_then_error(self, h5file_mock, _):
+        vds_file_mock = h5file_mock.return_value.__enter__.return_value
+        vds_file_mock.get.return_value = "Dataset"
+
+        with self.assertRaises(IOError):
+            plan.materialise_plans([MagicMock(output_file="/test/a.h5",
+                                              target_node="data")])
+
+
+class SaveLoadPlansTest(unittest.TestCase):
+
+    def test_save_then_load(self):
+        vds_plan = VDSPlan("/test/vds.h5", "full_frame", (3, 256, 2048),
+                           "uint16")
+        vds_plan.add_mapping("/test/stripe_1.h5", "data", (3, 256, 2048),
+                             (slice(None), slice(0, 256), slice(None)))
+        open_mock = mock_open()
+
+        with patch('__builtin__.open', open_mock):
+            plan.save_plans([vds_plan], "/test/plan.json")
+        written = "".join(args[0] for args, _
+                          in open_mock().write.call_args_list)
+        with patch('__builtin__.open', mock_open(read_data=written)):
+            plans = plan.load_plans("/test/plan.json")
+
+        open_mock.assert_any_call("/test/plan.json", "w")
+        self.assertEqual([vds_plan], plans)
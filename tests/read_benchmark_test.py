@@ -0,0 +1,71 @@
+import os
+import sys
+import unittest
+
+from pkg_resources import require
+require("mock")
+from mock import MagicMock, patch
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "benchmarks"))
+import read_benchmark
+from vdsgen.plan import Mapping
+
+VDSGenerator_patch_path = "read_benchmark.VDSGenerator"
+
+
+class ReadBenchmarkTest(unittest.TestCase):
+
+    def setUp(self):
+        # Two stripes of 4 rows with a gap of 2 rows, the first truncated to
+        # 2 of its 3 frames
+        self.maps = [
+            Mapping("/test/path/stripe_1.h5", "data", (3, 4, 8),
+                    (slice(0, 2), slice(0, 4), slice(0, 8)),
+                    (slice(0, 2), slice(0, 4), slice(0, 8))),
+            Mapping("/test/path/stripe_2.h5", "data", (2, 4, 8),
+                    (slice(0, 2), slice(6, 10), slice(0, 8)))]
+        self.sources = {
+            ("/test/path/stripe_1.h5", "data"): np.ones((3, 4, 8), "uint8"),
+            ("/test/path/stripe_2.h5", "data"): np.ones((2, 4, 8), "uint8")}
+
+    @patch(VDSGenerator_patch_path + '.read_vds_maps')
+    def test_resolve_maps(self, read_mock):
+        read_mock.return_value = [
+            Mapping("stripe_1.h5", "data", (3, 4, 8),
+                    (slice(0, 2), slice(0, 4), slice(0, 8)))]
+        dataset = MagicMock()
+
+        maps = read_benchmark.resolve_maps("/test/path/vds.h5", dataset)
+
+        read_mock.assert_called_once_with(dataset)
+        self.assertEqual("/test/path/stripe_1.h5", maps[0].file)
+        self.assertEqual(read_mock.return_value[0].target_index,
+                         maps[0].target_index)
+
+    def test_read_direct(self):
+        # All rows of the first frame, across the gap
+        total = read_benchmark.read_direct(
+            self.sources, self.maps,
+            (slice(0, 1), slice(0, 10), slice(0, 8)))
+
+        self.assertEqual(2 * 4 * 8, total)
+
+    def test_read_direct_truncated_source(self):
+        # Frames beyond the truncated selection of the first source
+        total = read_benchmark.read_direct(
+            self.sources, self.maps,
+            (slice(0, 3), slice(0, 4), slice(0, 8)))
+
+        self.assertEqual(2 * 4 * 8, total)
+
+    def test_read_patterns(self):
+        patterns = read_benchmark.read_patterns((2, 10, 8), self.maps, 2, 2,
+                                                2)
+
+        self.assertEqual(["frame_range", "full_scan", "roi_across_gap",
+                          "roi_in_source", "single_frame"],
+                         sorted(patterns.keys()))
+        self.assertEqual(2, len(patterns["full_scan"]))
@@ -0,0 +1,98 @@
+import unittest
+
+from pkg_resources import require
+require("mock")
+from mock import MagicMock, patch
+
+from vdsgen import template
+from vdsgen.plan import VDSPlan
+
+template_patch_path = "vdsgen.template"
+
+
+class LoadTemplateTest(unittest.TestCase):
+
+    @patch(template_patch_path + '.load_plans')
+    def test_load_template_plan(self, load_mock):
+        plans = template.load_template("/test/plan.json")
+
+        load_mock.assert_called_once_with("/test/plan.json")
+        self.assertEqual(load_mock.return_value, plans)
+
+    @patch(template_patch_path + '.read_plans')
+    def test_load_template_vds_default_node(self, read_mock):
+        plans = template.load_template("/test/vds.h5")
+
+        read_mock.assert_called_once_with("/test/vds.h5", ["full_frame"])
+        self.assertEqual(read_mock.return_value, plans)
+
+    @patch(template_patch_path + '.read_plans')
+    def test_load_template_vds_nodes(self, read_mock):
+        template.load_template("/test/vds.h5", ["full_frame", "compact"])
+
+        read_mock.assert_called_once_with("/test/vds.h5",
+                                          ["full_frame", "compact"])
+
+
+class GenerateFromTemplateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plan = VDSPlan("/scan_1/stripe_vds.h5", "full_frame",
+                            (3, 256, 2048), "uint16")
+        self.plan.add_mapping("/scan_1/stripe_1.h5", "data", (3, 256, 2048),
+                              (slice(None), slice(None), slice(None)))
+
+    @patch(template_patch_path + '.materialise_plans')
+    @patch(template_patch_path + '.load_template')
+    def test_generate(self, load_mock, materialise_mock):
+        load_mock.return_value = [self.plan]
+
+        plans = template.generate_from_template("/scan_1/stripe_vds.h5",
+                                                [("scan_1", "scan_2")])
+
+        load_mock.assert_called_once_with("/scan_1/stripe_vds.h5", None)
+        self.assertEqual("/scan_2/stripe_vds.h5", plans[0].output_file)
+        self.assertEqual("/scan_2/stripe_1.h5", plans[0].mappings[0].file)
+        materialise_mock.assert_called_once_with(plans)
+
+    @patch(template_patch_path + '.materialise_plans')
+    @patch(template_patch_path + '.load_template')
+    def test_generate_output(self, load_mock, materialise_mock):
+        load_mock.return_value = [self.plan]
+
+        plans = template.generate_from_template(
+            "/scan_1/plan.json", [("scan_1", "scan_2")],
+            output_file="/out/vds.h5")
+
+        self.assertEqual("/out/vds.h5", plans[0].output_file)
+
+    @patch('os.path.isfile', return_value=False)
+    @patch(template_patch_path + '.materialise_plans')
+    @patch(template_patch_path + '.load_template')
+    def test_generate_check_missing_then_error(self, load_mock,
+                                               materialise_mock, _):
+        load_mock.return_value = [self.plan]
+
+        with self.assertRaises(IOError) as e:
+            template.generate_from_template("/scan_1/stripe_vds.h5",
+                                            [("scan_1", "scan_2")],
+                                            check=True)
+
+        self.assertEqual("Source files do not exist: /scan_2/stripe_1.h5",
+                         e.exception.message)
+        materialise_mock.assert_not_called()
+
+
+class MainTest(unittest.TestCase):
+
+    @patch(template_patch_path + '.generate_from_template')
+    @patch(template_patch_path + '.parse_args',
+           return_value=MagicMock(template="/scan_1/stripe_vds.h5",
+                                  substitutions=[["scan_1", "scan_2"]],
+                                  output=None, nodes=None, check=False))
+    def test_main(self, parse_mock, generate_mock):
+        template.main()
+
+        generate_mock.assert_called_once_with(
+            "/scan_1/stripe_vds.h5", [("scan_1", "scan_2")],
+            output_file=None, nodes=None, check=False)
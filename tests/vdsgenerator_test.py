@@ -6,8 +6,12 @@ from pkg_resources import require
 require("mock")
 from mock import MagicMock, patch, call
 
+import h5py
+
 from vdsgen import vdsgenerator
 from vdsgen.vdsgenerator import VDSGenerator
+from vdsgen.plan import Mapping
+from vdsgen.metrics import Metrics
 
 vdsgen_patch_path = "vdsgen.vdsgenerator"
 VDSGenerator_patch_path = vdsgen_patch_path + ".VDSGenerator"
@@ -26,6 +30,7 @@ class VDSGeneratorTester(VDSGenerator):
     """
 
     def __init__(self, **kwargs):
+        self.metrics = Metrics()
         for attribute, value in kwargs.items():
             self.__setattr__(attribute, value)
 
@@ -59,7 +64,41 @@ class VDSGeneratorInitTest(unittest.TestCase):
         self.assertEqual("full_frame", gen.target_node)
         self.assertEqual(10, gen.stripe_spacing)
         self.assertEqual(10, gen.module_spacing)
+        self.assertEqual(1, gen.workers)
         self.assertEqual(gen.CREATE, gen.mode)
+        self.assertEqual(["discovery", "metadata"],
+                         gen.metrics.timings.keys())
+        self.assertEqual(dict(files_scanned=3), gen.metrics.counters)
+
+    @patch(VDSGenerator_patch_path + '.process_source_datasets')
+    @patch(VDSGenerator_patch_path + '.find_unmapped',
+           return_value=["/test/path/stripe_3.hdf5"])
+    @patch(VDSGenerator_patch_path + '.find_files',
+           return_value=["/test/path/stripe_1.hdf5",
+                         "/test/path/stripe_2.hdf5",
+                         "/test/path/stripe_3.hdf5"])
+    def test_append_then_only_unmapped_read(self, find_mock, unmapped_mock,
+                                            process_mock):
+        gen = VDSGenerator("/test/path", prefix="stripe_", output="vds.h5",
+                           layout="frames", append=True)
+
+        unmapped_mock.assert_called_once_with(find_mock.return_value)
+        self.assertEqual(["/test/path/stripe_3.hdf5"], gen.datasets)
+        self.assertEqual("/test/path/vds.h5", gen.output_file)
+        process_mock.assert_called_once_with()
+
+    @patch(VDSGenerator_patch_path + '.process_source_datasets')
+    @patch(VDSGenerator_patch_path + '.find_unmapped', return_value=[])
+    @patch(VDSGenerator_patch_path + '.find_files',
+           return_value=["/test/path/stripe_1.hdf5",
+                         "/test/path/stripe_2.hdf5"])
+    def test_append_all_mapped_then_no_metadata(self, _, _2, process_mock):
+        gen = VDSGenerator("/test/path", prefix="stripe_", layout="frames",
+                           append=True)
+
+        process_mock.assert_not_called()
+        self.assertEqual([], gen.datasets)
+        self.assertIsNone(gen.source_metadata)
 
     def test_generate_vds_given_args(self):
         files = ["stripe_1.h5", "stripe_2.h5"]
@@ -74,7 +113,8 @@ class VDSGeneratorInitTest(unittest.TestCase):
                            source=source_dict,
                            source_node="entry/data/data",
                            target_node="entry/detector/detector1",
-                           stripe_spacing=3, module_spacing=127)
+                           stripe_spacing=3, module_spacing=127,
+                           workers=8)
 
         self.assertEqual("/test/path", gen.path)
         self.assertEqual("stripe_", gen.prefix)
@@ -85,6 +125,7 @@ class VDSGeneratorInitTest(unittest.TestCase):
         self.assertEqual("entry/detector/detector1", gen.target_node)
         self.assertEqual(3, gen.stripe_spacing)
         self.assertEqual(127, gen.module_spacing)
+        self.assertEqual(8, gen.workers)
         self.assertEqual(gen.CREATE, gen.mode)
 
     def test_generate_vds_prefix_and_files_then_error(self):
@@ -100,6 +141,64 @@ class VDSGeneratorInitTest(unittest.TestCase):
                          target_node="entry/detector/detector1",
                          stripe_spacing=3, module_spacing=127)
 
+    def test_generate_vds_compact_node_is_target_node_then_error(self):
+
+        with self.assertRaises(ValueError):
+            VDSGenerator("/test/path", files=["stripe_1.h5", "stripe_2.h5"],
+                         source=dict(shape=(3, 256, 2048), dtype="int16"),
+                         target_node="entry/data",
+                         compact_node="/entry/data")
+
+    def test_generate_vds_invalid_layout_then_error(self):
+
+        with self.assertRaises(ValueError):
+            VDSGenerator("/test/path", files=["stripe_1.h5", "stripe_2.h5"],
+                         source=dict(shape=(3, 256, 2048), dtype="int16"),
+                         layout="diagonal")
+
+    def test_generate_vds_grid_without_geometry_then_error(self):
+
+        with self.assertRaises(ValueError):
+            VDSGenerator("/test/path", files=["stripe_1.h5", "stripe_2.h5"],
+                         source=dict(shape=(3, 256, 2048), dtype="int16"),
+                         layout="grid")
+
+    def test_generate_vds_invalid_frame_policy_then_error(self):
+
+        with self.assertRaises(ValueError):
+            VDSGenerator("/test/path", files=["stripe_1.h5", "stripe_2.h5"],
+                         source=dict(shape=(3, 256, 2048), dtype="int16"),
+                         frame_policy="ignore")
+
+    def test_generate_vds_live_frames_then_error(self):
+
+        with self.assertRaises(ValueError):
+            VDSGenerator("/test/path", files=["stripe_1.h5", "stripe_2.h5"],
+                         source=dict(shape=(3, 256, 2048), dtype="int16"),
+                         layout="frames", live=True)
+
+    def test_generate_vds_given_extra_nodes(self):
+        gen = VDSGenerator(
+            "/test/path", files=["stripe_1.h5", "stripe_2.h5"],
+            source=dict(shape=(3, 256, 2048), dtype="int16"),
+            layout="frames",
+            extra_nodes=[dict(source_node="times", target_node="timestamps",
+                              shape=(3,), dtype="float64")])
+
+        self.assertEqual("frames", gen.extra_nodes[0]["layout"])
+        self.assertEqual(
+            vdsgenerator.Source(frames=(3,), height=None, width=None,
+                                dtype="float64"),
+            gen.extra_metadata["times"])
+
+    def test_generate_vds_extra_node_without_shape_then_error(self):
+
+        with self.assertRaises(ValueError):
+            VDSGenerator("/test/path", files=["stripe_1.h5", "stripe_2.h5"],
+                         source=dict(shape=(3, 256, 2048), dtype="int16"),
+                         extra_nodes=[dict(source_node="times",
+                                           target_node="timestamps")])
+
     @patch('os.path.isfile', return_value=False)
     def test_generate_vds_no_source_or_files_then_error(self, _):
 
@@ -114,6 +213,7 @@ class VDSGeneratorInitTest(unittest.TestCase):
                          e.exception.message)
 
 
+@patch(vdsgen_patch_path + '.scandir', None)
 class FindFilesTest(unittest.TestCase):
 
     def setUp(self):
@@ -143,6 +243,27 @@ class FindFilesTest(unittest.TestCase):
 
         self.assertEqual(expected_files, files)
 
+    @patch('os.listdir',
+           return_value=["stripe_10.h5", "stripe_2.h5", "stripe_1.h5",
+                         "other_3.h5", "stripe_.h5"])
+    def test_given_numbers_then_numeric_order(self, _):
+        expected_files = ["/test/path/stripe_1.h5", "/test/path/stripe_2.h5",
+                          "/test/path/stripe_10.h5"]
+
+        files = self.gen.find_files()
+
+        self.assertEqual(expected_files, files)
+
+    @patch(VDSGenerator_patch_path + '.logger')
+    @patch('os.listdir',
+           return_value=["stripe_1.h5", "stripe_2.h5", "stripe_5.h5"])
+    def test_given_gaps_then_warning(self, _, logger_mock):
+        self.gen.find_files()
+
+        logger_mock.warning.assert_called_once_with(
+            "Files with prefix %s are missing %s indexes: %s", "stripe_", 2,
+            "3, 4")
+
     @patch('os.listdir', return_value=["stripe_1.h5"])
     def test_given_one_file_then_error(self, _):
 
@@ -156,6 +277,56 @@ class FindFilesTest(unittest.TestCase):
             self.gen.find_files()
 
 
+class DiscoveryFunctionsTest(unittest.TestCase):
+
+    @patch(vdsgen_patch_path + '.scandir')
+    def test_list_directory_scandir(self, scandir_mock):
+        entry_1, entry_2 = MagicMock(), MagicMock()
+        entry_1.name, entry_2.name = "stripe_1.h5", "stripe_2.h5"
+        scandir_mock.return_value = [entry_1, entry_2]
+
+        names = list(vdsgenerator.list_directory("/test/path"))
+
+        scandir_mock.assert_called_once_with("/test/path")
+        self.assertEqual(["stripe_1.h5", "stripe_2.h5"], names)
+
+    @patch(vdsgen_patch_path + '.list_directory',
+           return_value=["stripe_2.h5", "stripe_10.h5", "stripe_1.h5"])
+    def test_scan_files(self, _):
+        files = vdsgenerator.scan_files("/test/path", "stripe_")
+
+        self.assertEqual([(1, "/test/path/stripe_1.h5"),
+                          (2, "/test/path/stripe_2.h5"),
+                          (10, "/test/path/stripe_10.h5")], files)
+
+    def test_find_missing_indexes(self):
+        self.assertEqual([2, 5, 6],
+                         vdsgenerator.find_missing_indexes([0, 1, 3, 4, 7]))
+        self.assertEqual([], vdsgenerator.find_missing_indexes([1, 1, 2]))
+
+    @patch('os.path.isfile', side_effect=[True, False])
+    def test_find_missing_files_few_then_isfile(self, isfile_mock):
+        missing = vdsgenerator.find_missing_files(["/test/a_1.h5",
+                                                   "/test/a_2.h5"])
+
+        self.assertEqual(["/test/a_2.h5"], missing)
+        self.assertEqual(2, isfile_mock.call_count)
+
+    @patch('os.path.isfile')
+    @patch(vdsgen_patch_path + '.list_directory')
+    def test_find_missing_files_many_then_list_folder(self, list_mock,
+                                                      isfile_mock):
+        files = ["/test/a_{}.h5".format(idx) for idx in range(200)]
+        list_mock.return_value = iter(
+            ["a_{}.h5".format(idx) for idx in range(200) if idx != 150])
+
+        missing = vdsgenerator.find_missing_files(files)
+
+        list_mock.assert_called_once_with("/test")
+        isfile_mock.assert_not_called()
+        self.assertEqual(["/test/a_150.h5"], missing)
+
+
 class SimpleFunctionsTest(unittest.TestCase):
 
     def test_generate_vds_name(self):
@@ -168,22 +339,42 @@ class SimpleFunctionsTest(unittest.TestCase):
 
         self.assertEqual(expected_name, vds_name)
 
-    mock_data = dict(data=MagicMock(shape=(3, 256, 2048), dtype="uint16"))
-
-    @patch(h5py_patch_path + '.File', return_value=mock_data)
+    @patch(h5py_patch_path + '.File')
     def test_grab_metadata(self, h5file_mock):
         gen = VDSGeneratorTester(source_node="data")
-        expected_data = dict(frames=(3,), height=256, width=2048, dtype="uint16")
+        file_mock = h5file_mock.return_value.__enter__.return_value
+        file_mock.__getitem__.side_effect = dict(
+            data=MagicMock(shape=(3, 256, 2048), dtype="uint16",
+                           chunks=(1, 256, 2048))).__getitem__
+        file_mock.id.get_mdc_size.return_value = (2097152, 20971, 1400, 6)
+        expected_data = (dict(data=dict(frames=(3,), height=256, width=2048,
+                                        dtype="uint16",
+                                        chunks=(1, 256, 2048))), 1400)
 
         meta_data = gen.grab_metadata("/test/path/stripe.hdf5")
 
         h5file_mock.assert_called_once_with("/test/path/stripe.hdf5", "r")
+        h5file_mock.return_value.__exit__.assert_called_once_with(
+            None, None, None)
         self.assertEqual(expected_data, meta_data)
 
+    @patch(h5py_patch_path + '.File')
+    def test_grab_metadata_live(self, h5file_mock):
+        gen = VDSGeneratorTester(source_node="data", live=True)
+        file_mock = h5file_mock.return_value.__enter__.return_value
+        file_mock.__getitem__.return_value = MagicMock(shape=(3, 256, 2048))
+
+        gen.grab_metadata("/test/path/stripe.hdf5")
+
+        h5file_mock.assert_called_once_with("/test/path/stripe.hdf5", "r",
+                                            swmr=True)
+
     @patch(VDSGenerator_patch_path + '.grab_metadata',
-           return_value=dict(frames=(3,), height=256, width=2048, dtype="uint16"))
+           return_value=(dict(data=dict(frames=(3,), height=256, width=2048,
+                                        dtype="uint16")), 1400))
     def test_process_source_datasets_given_valid_data(self, grab_mock):
-        gen = VDSGeneratorTester(datasets=["stripe_1.h5", "stripe_2.h5"])
+        gen = VDSGeneratorTester(datasets=["stripe_1.h5", "stripe_2.h5"],
+                                 workers=1)
         expected_source = vdsgenerator.Source(frames=(3,), height=256,
                                               width=2048,
                                               dtype="uint16")
@@ -192,18 +383,191 @@ class SimpleFunctionsTest(unittest.TestCase):
 
         grab_mock.assert_has_calls([call("stripe_1.h5"), call("stripe_2.h5")])
         self.assertEqual(expected_source, source)
+        self.assertEqual(dict(file_opens=2, metadata_bytes=2800),
+                         gen.metrics.counters)
 
     @patch(VDSGenerator_patch_path + '.grab_metadata',
-           side_effect=[dict(frames=3, height=256, width=2048, dtype="uint16"),
-                        dict(frames=4, height=256, width=2048,
-                             dtype="uint16")])
+           side_effect=[(dict(data=dict(frames=3, height=256, width=2048,
+                                        dtype="uint16")), 0),
+                        (dict(data=dict(frames=4, height=256, width=2048,
+                                        dtype="uint16")), 0),
+                        (dict(data=dict(frames=3, height=256, width=2048,
+                                        dtype="int32")), 0)])
     def test_process_source_datasets_given_mismatched_data(self, grab_mock):
-        gen = VDSGeneratorTester(datasets=["stripe_1.h5", "stripe_2.h5"])
+        gen = VDSGeneratorTester(datasets=["stripe_1.h5", "stripe_2.h5",
+                                           "stripe_3.h5"], workers=1)
 
-        with self.assertRaises(ValueError):
+        with self.assertRaises(ValueError) as e:
             gen.process_source_datasets()
 
-        grab_mock.assert_has_calls([call("stripe_1.h5"), call("stripe_2.h5")])
+        grab_mock.assert_has_calls([call("stripe_1.h5"), call("stripe_2.h5"),
+                                    call("stripe_3.h5")])
+        self.assertEqual("Files have mismatched metadata:\n"
+                         "stripe_2.h5: frames 4 != 3\n"
+                         "stripe_3.h5: dtype int32 != uint16",
+                         e.exception.message)
+
+    @patch(VDSGenerator_patch_path + '.grab_metadata',
+           side_effect=[(dict(data=dict(frames=(3, 5), height=256,
+                                        width=2048, dtype="uint16")), 0),
+                        (dict(data=dict(frames=(2, 5), height=256,
+                                        width=2048, dtype="uint16")), 0)])
+    def test_process_source_datasets_live_given_growing_data(self, _):
+        gen = VDSGeneratorTester(datasets=["stripe_1.h5", "stripe_2.h5"],
+                                 workers=1, live=True)
+        expected_source = vdsgenerator.Source(frames=(3, 5), height=256,
+                                              width=2048, dtype="uint16")
+
+        source = gen.process_source_datasets()
+
+        self.assertEqual(expected_source, source)
+
+    @patch(VDSGenerator_patch_path + '.logger')
+    @patch(VDSGenerator_patch_path + '.grab_metadata',
+           side_effect=[(dict(data=dict(frames=(3, 5), height=256,
+                                        width=2048, dtype="uint16")), 0),
+                        (dict(data=dict(frames=(2, 5), height=256,
+                                        width=2048, dtype="uint16")), 0)])
+    def test_process_source_datasets_truncate(self, _, logger_mock):
+        gen = VDSGeneratorTester(datasets=["stripe_1.h5", "stripe_2.h5"],
+                                 workers=1, frame_policy="truncate")
+        expected_source = vdsgenerator.Source(frames=(2, 5), height=256,
+                                              width=2048, dtype="uint16")
+
+        source = gen.process_source_datasets()
+
+        self.assertEqual(expected_source, source)
+        self.assertEqual(dict(data={"stripe_1.h5": 3, "stripe_2.h5": 2}),
+                         gen.source_frames)
+        logger_mock.warning.assert_called_once_with(
+            "Sources%s have %s to %s frames - mapping %s frames of each "
+            "(%s)", "", 2, 3, 2, "truncate")
+
+    @patch(VDSGenerator_patch_path + '.grab_metadata',
+           side_effect=[(dict(data=dict(frames=(3,), height=256, width=2048,
+                                        dtype="uint16")), 0),
+                        (dict(data=dict(frames=(2,), height=256, width=2048,
+                                        dtype="uint16")), 0)])
+    def test_process_source_datasets_pad(self, _):
+        gen = VDSGeneratorTester(datasets=["stripe_1.h5", "stripe_2.h5"],
+                                 workers=1, frame_policy="pad")
+
+        source = gen.process_source_datasets()
+
+        self.assertEqual((3,), source.frames)
+
+    @patch(VDSGenerator_patch_path + '.logger')
+    @patch(VDSGenerator_patch_path + '.grab_metadata',
+           side_effect=[(dict(data=dict(frames=(3,), height=256, width=2048,
+                                        dtype="uint16",
+                                        chunks=(1, 256, 2048))), 0),
+                        (dict(data=dict(frames=(3,), height=256, width=2048,
+                                        dtype="uint16", chunks=None)), 0)])
+    def test_process_source_datasets_given_mismatched_chunks(self, _,
+                                                             logger_mock):
+        gen = VDSGeneratorTester(datasets=["stripe_1.h5", "stripe_2.h5"],
+                                 workers=1)
+        expected_source = vdsgenerator.Source(frames=(3,), height=256,
+                                              width=2048, dtype="uint16",
+                                              chunks=(1, 256, 2048))
+
+        source = gen.process_source_datasets()
+
+        logger_mock.warning.assert_called_once_with(
+            "%s has chunks %s, but %s has %s", "stripe_2.h5", None,
+            "stripe_1.h5", (1, 256, 2048))
+        self.assertEqual(expected_source, source)
+
+    @patch(vdsgen_patch_path + '.Pool')
+    def test_process_source_datasets_given_workers(self, pool_init_mock):
+        pool_mock = pool_init_mock.return_value
+        pool_mock.map.return_value = [
+            (dict(data=dict(frames=(3,), height=256, width=2048,
+                            dtype="uint16")), 1400)] * 2
+        gen = VDSGeneratorTester(datasets=["stripe_1.h5", "stripe_2.h5"],
+                                 source_node="data", workers=4)
+        expected_source = vdsgenerator.Source(frames=(3,), height=256,
+                                              width=2048, dtype="uint16")
+
+        source = gen.process_source_datasets()
+
+        pool_init_mock.assert_called_once_with(2)
+        pool_mock.map.assert_called_once_with(
+            vdsgenerator._read_metadata,
+            [("stripe_1.h5", ["data"], False),
+             ("stripe_2.h5", ["data"], False)])
+        pool_mock.close.assert_called_once_with()
+        pool_mock.join.assert_called_once_with()
+        self.assertEqual(expected_source, source)
+
+    @patch(VDSGenerator_patch_path + '.read_source_metadata',
+           return_value=[dict(data=dict(frames=(3,), height=256, width=2048,
+                                        dtype="uint16"))])
+    @patch(vdsgen_patch_path + '.MetadataCache')
+    def test_process_source_datasets_given_cache(self, cache_init_mock,
+                                                 read_mock):
+        cache_mock = cache_init_mock.return_value
+        cache_mock.get.side_effect = [
+            dict(frames=(3,), height=256, width=2048, dtype="uint16"), None]
+        gen = VDSGeneratorTester(datasets=["stripe_1.h5", "stripe_2.h5"],
+                                 source_node="data", workers=1,
+                                 cache_file="/test/cache.json", cache_size=10)
+        expected_source = vdsgenerator.Source(frames=(3,), height=256,
+                                              width=2048, dtype="uint16")
+
+        source = gen.process_source_datasets()
+
+        cache_init_mock.assert_called_once_with("/test/cache.json", 10)
+        cache_mock.get.assert_has_calls([call("stripe_1.h5", "data"),
+                                         call("stripe_2.h5", "data")])
+        read_mock.assert_called_once_with(["stripe_2.h5"])
+        self.assertEqual(1, gen.metrics.counters["cache_hits"])
+        cache_mock.put.assert_called_once_with(
+            "stripe_2.h5", "data", read_mock.return_value[0]["data"])
+        cache_mock.save.assert_called_once_with()
+        self.assertEqual(expected_source, source)
+
+    @patch(VDSGenerator_patch_path + '.read_source_metadata')
+    @patch(vdsgen_patch_path + '.MetadataCache')
+    def test_process_source_datasets_all_cached_then_no_read(
+            self, cache_init_mock, read_mock):
+        cache_mock = cache_init_mock.return_value
+        cache_mock.get.return_value = dict(frames=(3,), height=256,
+                                           width=2048, dtype="uint16")
+        gen = VDSGeneratorTester(datasets=["stripe_1.h5", "stripe_2.h5"],
+                                 source_node="data", workers=1,
+                                 cache_file="/test/cache.json", cache_size=10)
+
+        gen.process_source_datasets()
+
+        read_mock.assert_not_called()
+        cache_mock.save.assert_not_called()
+
+    @patch(VDSGenerator_patch_path + '.grab_metadata',
+           side_effect=[(dict(data=dict(frames=(3,), height=256, width=2048,
+                                        dtype="uint16"),
+                              times=dict(frames=(3,), height=None, width=None,
+                                         dtype="float64")), 0),
+                        (dict(data=dict(frames=(3,), height=256, width=2048,
+                                        dtype="uint16"),
+                              times=dict(frames=(4,), height=None, width=None,
+                                         dtype="float64")), 0)])
+    def test_process_source_datasets_given_extra_nodes(self, grab_mock):
+        gen = VDSGeneratorTester(
+            datasets=["stripe_1.h5", "stripe_2.h5"], workers=1,
+            extra_nodes=[dict(source_node="times", target_node="timestamps",
+                              layout="frames")])
+
+        with self.assertRaises(ValueError) as e:
+            gen.process_source_datasets()
+
+        self.assertEqual(2, grab_mock.call_count)
+        self.assertEqual("Files have mismatched metadata:\n"
+                         "stripe_2.h5 times: frames (4,) != (3,)",
+                         e.exception.message)
+
+    def test_parse_shape_per_frame_values(self):
+        self.assertEqual(((3,), None, None), VDSGenerator.parse_shape((3,)))
 
     def test_construct_vds_metadata(self):
         gen = VDSGeneratorTester(datasets=[""] * 6, stripe_spacing=10,
@@ -217,6 +581,176 @@ class SimpleFunctionsTest(unittest.TestCase):
 
         self.assertEqual(expected_vds, vds)
 
+    def test_construct_vds_metadata_frames(self):
+        gen = VDSGeneratorTester(datasets=[""] * 4, layout="frames")
+        source = vdsgenerator.Source(frames=(3, 5), height=256, width=2048,
+                                     dtype="uint16")
+        expected_vds = vdsgenerator.VDS(shape=(12, 5, 256, 2048),
+                                        spacing=[0] * 4)
+
+        vds = gen.construct_vds_metadata(source)
+
+        self.assertEqual(expected_vds, vds)
+
+    def test_construct_vds_metadata_frames_no_frame_axis(self):
+        gen = VDSGeneratorTester(datasets=[""] * 4, layout="frames")
+        source = vdsgenerator.Source(frames=(), height=256, width=2048,
+                                     dtype="uint16")
+        expected_vds = vdsgenerator.VDS(shape=(4, 256, 2048),
+                                        spacing=[0] * 4)
+
+        vds = gen.construct_vds_metadata(source)
+
+        self.assertEqual(expected_vds, vds)
+
+    def test_construct_vds_metadata_per_frame_values(self):
+        gen = VDSGeneratorTester(datasets=[""] * 4)
+        source = vdsgenerator.Source(frames=(3,), height=None, width=None,
+                                     dtype="float64")
+
+        vds = gen.construct_vds_metadata(source, layout="interleave")
+
+        self.assertEqual(vdsgenerator.VDS(shape=(12,), spacing=[0] * 4), vds)
+        with self.assertRaises(ValueError):
+            gen.construct_vds_metadata(source)
+
+    @patch(h5py_patch_path + '.VirtualMap')
+    @patch(h5py_patch_path + '.VirtualSource')
+    @patch(h5py_patch_path + '.VirtualTarget')
+    def test_create_vds_maps_frames(self, target_mock, source_mock, map_mock):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["source"] * 3, name="vds.hdf5",
+                                 layout="frames")
+        source = vdsgenerator.Source(frames=(3,), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(15, 256, 2048), spacing=[0] * 2)
+
+        map_list = gen.create_vds_maps(source, vds,
+                                       datasets=["source_4", "source_5"],
+                                       offset=9)
+
+        target_mock.assert_called_once_with("/test/path/vds.hdf5",
+                                            "full_frame",
+                                            shape=(15, 256, 2048))
+        source_mock.assert_has_calls([
+            call("source_4", "data", shape=(3, 256, 2048)),
+            call("source_5", "data", shape=(3, 256, 2048))])
+        target_mock.return_value.__getitem__.assert_has_calls([
+            call((slice(9, 12), slice(None), slice(None))),
+            call((slice(12, 15), slice(None), slice(None)))])
+        self.assertEqual([map_mock.return_value] * 2, map_list)
+
+    def test_construct_vds_metadata_interleave(self):
+        gen = VDSGeneratorTester(datasets=[""] * 4, layout="interleave")
+        source = vdsgenerator.Source(frames=(3,), height=256, width=2048,
+                                     dtype="uint16")
+        expected_vds = vdsgenerator.VDS(shape=(12, 256, 2048),
+                                        spacing=[0] * 4)
+
+        vds = gen.construct_vds_metadata(source)
+
+        self.assertEqual(expected_vds, vds)
+
+    @patch(h5py_patch_path + '.VirtualMap')
+    @patch(h5py_patch_path + '.VirtualSource')
+    @patch(h5py_patch_path + '.VirtualTarget')
+    def test_create_vds_maps_interleave(self, target_mock, source_mock,
+                                        map_mock):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["source_1", "source_2", "source_3"],
+                                 name="vds.hdf5", layout="interleave")
+        source = vdsgenerator.Source(frames=(4,), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(12, 256, 2048), spacing=[0] * 3)
+
+        map_list = gen.create_vds_maps(source, vds)
+
+        target_mock.return_value.__getitem__.assert_has_calls([
+            call((slice(0, 10, 3), slice(None), slice(None))),
+            call((slice(1, 11, 3), slice(None), slice(None))),
+            call((slice(2, 12, 3), slice(None), slice(None)))])
+        self.assertEqual([map_mock.return_value] * 3, map_list)
+
+    def test_construct_vds_metadata_grid(self):
+        gen = VDSGeneratorTester(
+            datasets=[""] * 4, layout="grid",
+            geometry=dict(rows=2, columns=2, row_gap=10, column_gap=20))
+        source = vdsgenerator.Source(frames=(3,), height=256, width=1024,
+                                     dtype="uint16")
+        expected_vds = vdsgenerator.VDS(
+            shape=(3, 522, 2068), spacing=[0] * 4,
+            offsets=[(0, 0), (0, 1044), (266, 0), (266, 1044)])
+
+        vds = gen.construct_vds_metadata(source)
+
+        self.assertEqual(expected_vds, vds)
+
+    def test_construct_vds_metadata_grid_compact(self):
+        gen = VDSGeneratorTester(
+            datasets=[""] * 4, layout="grid",
+            geometry=dict(rows=2, columns=2, row_gap=10, column_gap=20))
+        source = vdsgenerator.Source(frames=(3,), height=256, width=1024,
+                                     dtype="uint16")
+        expected_vds = vdsgenerator.VDS(
+            shape=(3, 512, 2048), spacing=[0] * 4,
+            offsets=[(0, 0), (0, 1024), (256, 0), (256, 1024)])
+
+        vds = gen.construct_vds_metadata(source, compact=True)
+
+        self.assertEqual(expected_vds, vds)
+
+    def test_construct_vds_metadata_compact(self):
+        gen = VDSGeneratorTester(datasets=[""] * 6, stripe_spacing=10,
+                                 module_spacing=100, compact=True)
+        source = vdsgenerator.Source(frames=(3,), height=256, width=2048,
+                                     dtype="uint16")
+        expected_vds = vdsgenerator.VDS(shape=(3, 1536, 2048),
+                                        spacing=[0] * 6)
+
+        vds = gen.construct_vds_metadata(source)
+
+        self.assertEqual(expected_vds, vds)
+
+    @patch(h5py_patch_path + '.VirtualMap')
+    @patch(h5py_patch_path + '.VirtualSource')
+    @patch(h5py_patch_path + '.VirtualTarget')
+    def test_create_vds_maps_target_node(self, target_mock, source_mock,
+                                         map_mock):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["source_1", "source_2"],
+                                 name="vds.hdf5", layout="frames")
+        source = vdsgenerator.Source(frames=(3,), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(6, 256, 2048), spacing=[0] * 2)
+
+        gen.create_vds_maps(source, vds, target_node="compact")
+
+        target_mock.assert_called_once_with("/test/path/vds.hdf5", "compact",
+                                            shape=(6, 256, 2048))
+
+    @patch(h5py_patch_path + '.VirtualMap')
+    @patch(h5py_patch_path + '.VirtualSource')
+    @patch(h5py_patch_path + '.VirtualTarget')
+    def test_create_vds_maps_grid(self, target_mock, source_mock, map_mock):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["module_1", "module_2"],
+                                 name="vds.hdf5", layout="grid")
+        source = vdsgenerator.Source(frames=(3,), height=256, width=1024,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(3, 256, 2058), spacing=[0] * 2,
+                               offsets=[(0, 1034), (0, 0)])
+
+        map_list = gen.create_vds_maps(source, vds)
+
+        target_mock.return_value.__getitem__.assert_has_calls([
+            call((slice(None), slice(0, 256), slice(1034, 2058))),
+            call((slice(None), slice(0, 256), slice(0, 1024)))])
+        self.assertEqual([map_mock.return_value] * 2, map_list)
+
     @patch(h5py_patch_path + '.VirtualMap')
     @patch(h5py_patch_path + '.VirtualSource')
     @patch(h5py_patch_path + '.VirtualTarget')
@@ -244,6 +778,47 @@ class SimpleFunctionsTest(unittest.TestCase):
         self.assertEqual([map_mock.return_value]*6, map_list)
 
 
+class CheckChunkingTest(unittest.TestCase):
+
+    def test_next_prime(self):
+        self.assertEqual(2, vdsgenerator.next_prime(0))
+        self.assertEqual(521, vdsgenerator.next_prime(521))
+        self.assertEqual(1201, vdsgenerator.next_prime(1200))
+
+    def test_not_chunked_then_empty(self):
+        gen = VDSGeneratorTester(layout="stripes")
+        source = vdsgenerator.Source(frames=(3,), height=256, width=2048,
+                                     dtype="uint16")
+
+        self.assertEqual(dict(), gen.check_chunking(source))
+
+    @patch(VDSGenerator_patch_path + '.logger')
+    def test_frame_chunks(self, logger_mock):
+        gen = VDSGeneratorTester(layout="stripes")
+        source = vdsgenerator.Source(frames=(30,), height=256, width=2048,
+                                     dtype="uint16", chunks=(1, 256, 2048))
+
+        chunk_cache = gen.check_chunking(source)
+
+        logger_mock.warning.assert_not_called()
+        self.assertEqual(dict(rdcc_nbytes=1024 ** 2, rdcc_nslots=521),
+                         chunk_cache)
+
+    @patch(VDSGenerator_patch_path + '.logger')
+    def test_multi_frame_chunks_then_warning(self, logger_mock):
+        gen = VDSGeneratorTester(layout="frames")
+        source = vdsgenerator.Source(frames=(30,), height=256, width=2048,
+                                     dtype="uint16", chunks=(4, 128, 512))
+
+        chunk_cache = gen.check_chunking(source)
+
+        self.assertEqual(2, logger_mock.warning.call_count)
+        # 2 x 4 chunks of 4 x 128 x 512 x 2 bytes cover one frame
+        self.assertEqual(dict(rdcc_nbytes=8 * 4 * 128 * 512 * 2,
+                              rdcc_nslots=vdsgenerator.next_prime(800)),
+                         chunk_cache)
+
+
 class ValidateNodeTest(unittest.TestCase):
 
     def setUp(self):
@@ -273,6 +848,69 @@ class ValidateNodeTest(unittest.TestCase):
 
         self.file_mock.create_group.assert_called_once_with("/entry/detector")
 
+    def test_validate_node_given_node(self):
+        gen = VDSGeneratorTester(target_node="full_frame")
+        self.file_mock.get.return_value = None
+
+        gen.validate_node(self.file_mock, "entry/compact/data")
+
+        self.file_mock.create_group.assert_called_once_with("entry/compact")
+
+
+class HooksTest(unittest.TestCase):
+
+    def test_hook_order(self):
+        events = []
+        first, second = MagicMock(), MagicMock()
+        first.before.side_effect = lambda event, **_: events.append("1+")
+        first.after.side_effect = lambda event, **_: events.append("1-")
+        second.before.side_effect = lambda event, **_: events.append("2+")
+        second.after.side_effect = lambda event, **_: events.append("2-")
+        gen = VDSGeneratorTester(hooks=[first])
+        gen.add_hook(second)
+
+        with self.assertRaises(IOError):
+            with gen.hook("write", output_file="/test/vds.h5"):
+                events.append("write")
+                raise IOError("Write failed")
+
+        self.assertEqual(["1+", "2+", "write", "2-", "1-"], events)
+        first.before.assert_called_once_with("write",
+                                             output_file="/test/vds.h5")
+
+    @patch(VDSGenerator_patch_path + '.grab_metadata', return_value=(
+        dict(data=dict(frames=(3,), height=256, width=2048)), 0))
+    def test_read_source_metadata_hooks(self, _):
+        hook = MagicMock()
+        gen = VDSGeneratorTester(hooks=[hook], workers=1)
+
+        gen.read_source_metadata(["stripe_1.h5", "stripe_2.h5"])
+
+        hook.before.assert_has_calls([
+            call("read_metadata", files=["stripe_1.h5", "stripe_2.h5"]),
+            call("grab_metadata", file_path="stripe_1.h5"),
+            call("grab_metadata", file_path="stripe_2.h5")])
+        self.assertEqual(3, hook.after.call_count)
+
+    def test_create_vds_plan_hooks(self):
+        hook = MagicMock()
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["source_1", "source_2"],
+                                 name="vds.hdf5", layout="frames",
+                                 hooks=[hook])
+        source = vdsgenerator.Source(frames=(3,), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(6, 256, 2048), spacing=[0] * 2)
+
+        gen.create_vds_plan(source, vds)
+
+        hook.after.assert_has_calls([
+            call("create_map", file_path="source_1",
+                 target_index=(slice(0, 3), slice(None), slice(None))),
+            call("create_map", file_path="source_2",
+                 target_index=(slice(3, 6), slice(None), slice(None)))])
+
 
 class GenerateVDSTest(unittest.TestCase):
 
@@ -281,49 +919,92 @@ class GenerateVDSTest(unittest.TestCase):
     @patch('os.path.isfile', return_value=False)
     @patch(VDSGenerator_patch_path + '.validate_node')
     @patch(h5py_patch_path + '.File', return_value=file_mock)
-    @patch(VDSGenerator_patch_path + '.create_vds_maps')
-    @patch(VDSGenerator_patch_path + '.construct_vds_metadata')
-    def test_generate_vds_create(self, construct_mock, create_mock,
-                                 h5file_mock, validate_mock, isfile_mock):
-        source_mock = MagicMock()
+    @patch(VDSGenerator_patch_path + '.plan_vds')
+    def test_generate_vds_create(self, plan_mock, h5file_mock, validate_mock,
+                                 isfile_mock):
         gen = VDSGeneratorTester(path="/test/path", prefix="stripe_",
                                  output_file="/test/path/vds.hdf5",
                                  name="vds.hdf5",
                                  target_node="full_frame", source_node="data",
                                  datasets=["stripe_1.hdf5", "stripe_2.hdf5",
-                                           "stripe_3.hdf5"],
-                                 source_metadata=source_mock)
+                                           "stripe_3.hdf5"])
+        vds_plan = MagicMock(target_node="full_frame")
+        plan_mock.return_value = [vds_plan]
         self.file_mock.reset_mock()
         vds_file_mock = self.file_mock.__enter__.return_value
-        vds_file_mock.get.return_value = None
 
-        gen.generate_vds()
+        metrics = gen.generate_vds()
 
         isfile_mock.assert_called_once_with("/test/path/vds.hdf5")
-        construct_mock.assert_called_once_with(source_mock)
-        create_mock.assert_called_once_with(source_mock,
-                                            construct_mock.return_value)
-        validate_mock.assert_called_once_with(vds_file_mock)
+        plan_mock.assert_called_once_with()
         h5file_mock.assert_called_once_with(
             "/test/path/vds.hdf5", "w", libver="latest")
-        vds_file_mock.create_virtual_dataset.assert_called_once_with(
-            VMlist=create_mock.return_value, fillvalue=0x1)
+        validate_mock.assert_called_once_with(vds_file_mock, "full_frame")
+        vds_plan.materialise.assert_called_once_with(vds_file_mock)
+        self.assertEqual(["write"], metrics["timings"].keys())
+        self.assertEqual(dict(file_opens=1), metrics["counters"])
+
+    @patch('os.path.isfile')
+    @patch(h5py_patch_path + '.File')
+    @patch(VDSGenerator_patch_path + '.plan_vds')
+    def test_generate_vds_in_memory(self, plan_mock, h5file_mock,
+                                    isfile_mock):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5")
+        vds_plan = MagicMock(target_node="full_frame")
+        plan_mock.return_value = [vds_plan]
+
+        vds = gen.generate_vds_in_memory()
+
+        isfile_mock.assert_not_called()
+        h5file_mock.assert_called_once_with(
+            "/test/path/vds.hdf5", "w", driver="core", backing_store=False)
+        vds_plan.materialise.assert_called_once_with(
+            h5file_mock.return_value)
+        self.assertEqual(h5file_mock.return_value, vds)
+        vds.close.assert_not_called()
+        self.assertEqual(["write"], gen.metrics.timings.keys())
+
+    @patch(h5py_patch_path + '.File')
+    @patch(VDSGenerator_patch_path + '.plan_vds', return_value=[])
+    def test_generate_vds_in_memory_file_image(self, _, h5file_mock):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5")
+        vds_mock = h5file_mock.return_value
+        vds_mock.id.get_file_image.return_value = "\x89HDF"
+
+        image = gen.generate_vds_in_memory(file_image=True)
+
+        vds_mock.flush.assert_called_once_with()
+        vds_mock.close.assert_called_once_with()
+        self.assertEqual("\x89HDF", image)
+
+    @patch(h5py_patch_path + '.File')
+    @patch(VDSGenerator_patch_path + '.plan_vds')
+    def test_generate_vds_in_memory_error_then_closed(self, plan_mock,
+                                                      h5file_mock):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5")
+        vds_plan = MagicMock()
+        vds_plan.materialise.side_effect = IOError("Bad plan")
+        plan_mock.return_value = [vds_plan]
+
+        with self.assertRaises(IOError):
+            gen.generate_vds_in_memory()
+
+        h5file_mock.return_value.close.assert_called_once_with()
 
     @patch('os.path.isfile', return_value=True)
     @patch(VDSGenerator_patch_path + '.validate_node')
     @patch(h5py_patch_path + '.File', return_value=file_mock)
-    @patch(VDSGenerator_patch_path + '.create_vds_maps')
-    @patch(VDSGenerator_patch_path + '.construct_vds_metadata')
-    def test_generate_vds_append(self, construct_mock, create_mock,
-                                 h5file_mock, validate_mock, isfile_mock):
-        source_mock = MagicMock()
+    @patch(VDSGenerator_patch_path + '.plan_vds')
+    def test_generate_vds_append(self, plan_mock, h5file_mock, validate_mock,
+                                 isfile_mock):
         gen = VDSGeneratorTester(path="/test/path", prefix="stripe_",
                                  output_file="/test/path/vds.hdf5",
                                  name="vds.hdf5",
                                  target_node="full_frame", source_node="data",
                                  datasets=["stripe_1.hdf5", "stripe_2.hdf5",
-                                           "stripe_3.hdf5"],
-                                 source_metadata=source_mock)
+                                           "stripe_3.hdf5"])
+        vds_plan = MagicMock(target_node="full_frame")
+        plan_mock.return_value = [vds_plan]
         self.file_mock.reset_mock()
         vds_file_mock = self.file_mock.__enter__.return_value
         vds_file_mock.get.return_value = None
@@ -331,15 +1012,28 @@ class GenerateVDSTest(unittest.TestCase):
         gen.generate_vds()
 
         isfile_mock.assert_called_once_with("/test/path/vds.hdf5")
-        construct_mock.assert_called_once_with(source_mock)
-        create_mock.assert_called_once_with(source_mock,
-                                            construct_mock.return_value)
-        validate_mock.assert_called_once_with(vds_file_mock)
         h5file_mock.assert_has_calls([
             call("/test/path/vds.hdf5", "r", libver="latest"),
             call("/test/path/vds.hdf5", "a", libver="latest")])
-        vds_file_mock.create_virtual_dataset.assert_called_once_with(
-            VMlist=create_mock.return_value, fillvalue=0x1)
+        vds_plan.materialise.assert_called_once_with(vds_file_mock)
+
+    @patch('os.path.isfile', return_value=True)
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    def test_generate_vds_compact_node_exists_then_error(self, h5file_mock,
+                                                         isfile_mock):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame",
+                                 compact_node="compact")
+        self.file_mock.reset_mock()
+        vds_file_mock = self.file_mock.__enter__.return_value
+        vds_file_mock.get.side_effect = [None, "Dataset"]
+
+        with self.assertRaises(IOError) as e:
+            gen.generate_vds()
+
+        self.assertEqual("VDS /test/path/vds.hdf5 already has an entry for "
+                         "node compact", e.exception.message)
+        vds_file_mock.get.side_effect = None
 
     @patch('os.path.isfile', return_value=True)
     @patch(h5py_patch_path + '.File', return_value=file_mock)
@@ -359,3 +1053,535 @@ class GenerateVDSTest(unittest.TestCase):
 
         with self.assertRaises(IOError):
             gen.generate_vds()
+
+
+class PlanVDSTest(unittest.TestCase):
+
+    @patch(VDSGenerator_patch_path + '.check_chunking',
+           return_value=dict(rdcc_nbytes=1024 ** 2, rdcc_nslots=521))
+    @patch(VDSGenerator_patch_path + '.create_vds_plan')
+    @patch(VDSGenerator_patch_path + '.construct_vds_metadata')
+    def test_plan_vds(self, construct_mock, create_mock, check_mock):
+        source_mock = MagicMock()
+        gen = VDSGeneratorTester(source_metadata=source_mock,
+                                 output_file="/test/path/vds.hdf5",
+                                 extra_metadata=dict())
+        create_mock.return_value.attributes = dict()
+
+        create_mock.return_value.mappings = [MagicMock()] * 3
+
+        plans = gen.plan_vds()
+
+        construct_mock.assert_called_once_with(source_mock)
+        create_mock.assert_called_once_with(source_mock,
+                                            construct_mock.return_value)
+        check_mock.assert_called_once_with(source_mock)
+        self.assertEqual([create_mock.return_value], plans)
+        self.assertEqual(check_mock.return_value, plans[0].attributes)
+        self.assertIn("plan", gen.metrics.timings)
+        self.assertEqual(dict(maps=3), gen.metrics.counters)
+
+    @patch(VDSGenerator_patch_path + '.check_chunking', return_value=dict())
+    @patch(VDSGenerator_patch_path + '.create_vds_plan')
+    @patch(VDSGenerator_patch_path + '.construct_vds_metadata')
+    def test_plan_vds_compact_node(self, construct_mock, create_mock, _):
+        source_mock = MagicMock()
+        gen = VDSGeneratorTester(source_metadata=source_mock,
+                                 output_file="/test/path/vds.hdf5",
+                                 extra_metadata=dict(),
+                                 compact_node="compact")
+        spaced_data, compact_data = MagicMock(), MagicMock()
+        construct_mock.side_effect = [spaced_data, compact_data]
+
+        plans = gen.plan_vds()
+
+        construct_mock.assert_has_calls([
+            call(source_mock), call(source_mock, compact=True)])
+        create_mock.assert_has_calls([
+            call(source_mock, spaced_data),
+            call(source_mock, compact_data, target_node="compact")])
+        self.assertEqual(2, len(plans))
+
+    @patch(VDSGenerator_patch_path + '.check_chunking', return_value=dict())
+    @patch(VDSGenerator_patch_path + '.create_vds_plan')
+    @patch(VDSGenerator_patch_path + '.construct_vds_metadata')
+    def test_plan_vds_extra_nodes(self, construct_mock, create_mock,
+                                  check_mock):
+        source_mock, times_mock = MagicMock(), MagicMock()
+        gen = VDSGeneratorTester(
+            source_metadata=source_mock, output_file="/test/path/vds.hdf5",
+            extra_metadata=dict(times=times_mock),
+            extra_nodes=[dict(source_node="times", target_node="timestamps",
+                              layout="frames")])
+        data, times_data = MagicMock(), MagicMock()
+        construct_mock.side_effect = [data, times_data]
+
+        plans = gen.plan_vds()
+
+        construct_mock.assert_has_calls([
+            call(source_mock), call(times_mock, layout="frames")])
+        create_mock.assert_has_calls([
+            call(source_mock, data),
+            call(times_mock, times_data, target_node="timestamps",
+                 source_node="times", layout="frames")], any_order=True)
+        check_mock.assert_has_calls([call(source_mock),
+                                     call(times_mock, "frames")])
+        self.assertEqual(2, len(plans))
+
+    def test_create_vds_plan(self):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["source_1", "source_2"],
+                                 name="vds.hdf5", layout="frames")
+        source = vdsgenerator.Source(frames=(3,), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(6, 256, 2048), spacing=[0] * 2)
+
+        plan = gen.create_vds_plan(source, vds)
+
+        self.assertEqual("/test/path/vds.hdf5", plan.output_file)
+        self.assertEqual("full_frame", plan.target_node)
+        self.assertEqual((6, 256, 2048), plan.shape)
+        self.assertEqual("uint16", plan.dtype)
+        self.assertEqual([
+            Mapping("source_1", "data", (3, 256, 2048),
+                    (slice(0, 3), slice(None), slice(None))),
+            Mapping("source_2", "data", (3, 256, 2048),
+                    (slice(3, 6), slice(None), slice(None)))],
+            plan.mappings)
+
+    def test_printf_pattern(self):
+        self.assertEqual(
+            "/test/50%%/image_%b.h5",
+            vdsgenerator.printf_pattern(["/test/50%/image_0.h5",
+                                         "/test/50%/image_1.h5"]))
+
+    def test_printf_pattern_not_applicable_then_none(self):
+        for files in [["image_1.h5", "image_2.h5"],
+                      ["image_00.h5", "image_01.h5"],
+                      ["image_0.h5", "image_2.h5"],
+                      ["image_0.h5", "other_1.h5"],
+                      ["image_0.h5", "image.h5"]]:
+            self.assertIsNone(vdsgenerator.printf_pattern(files))
+
+    def test_create_vds_plan_printf(self):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["/test/path/image_0.h5",
+                                           "/test/path/image_1.h5"],
+                                 name="vds.hdf5", layout="frames",
+                                 printf_maps=True)
+        source = vdsgenerator.Source(frames=(3,), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(6, 256, 2048), spacing=[0] * 2)
+
+        plan = gen.create_vds_plan(source, vds)
+
+        self.assertEqual((6, 256, 2048), plan.shape)
+        self.assertEqual((None, 256, 2048), plan.maxshape)
+        self.assertEqual([
+            Mapping("/test/path/image_%b.h5", "data", (3, 256, 2048),
+                    (slice(0, None, 3), slice(None), slice(None)))],
+            plan.mappings)
+
+    def test_create_vds_plan_printf_not_applicable_then_each_file(self):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["/test/path/image_1.h5",
+                                           "/test/path/image_2.h5"],
+                                 name="vds.hdf5", layout="frames",
+                                 printf_maps=True)
+        source = vdsgenerator.Source(frames=(3,), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(6, 256, 2048), spacing=[0] * 2)
+
+        plan = gen.create_vds_plan(source, vds)
+
+        self.assertIsNone(plan.maxshape)
+        self.assertEqual(2, len(plan.mappings))
+
+    def test_create_vds_plan_truncate(self):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["source_1", "source_2"],
+                                 name="vds.hdf5", layout="frames",
+                                 frame_policy="truncate",
+                                 source_frames=dict(data=dict(source_1=3,
+                                                              source_2=2)))
+        source = vdsgenerator.Source(frames=(2,), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(4, 256, 2048), spacing=[0] * 2)
+
+        plan = gen.create_vds_plan(source, vds)
+
+        self.assertEqual(dict(frame_policy="truncate", source_frames=[3, 2]),
+                         plan.attributes)
+        self.assertEqual([
+            Mapping("source_1", "data", (3, 256, 2048),
+                    (slice(0, 2), slice(None), slice(None)),
+                    (slice(0, 2), slice(None), slice(None))),
+            Mapping("source_2", "data", (2, 256, 2048),
+                    (slice(2, 4), slice(None), slice(None)))],
+            plan.mappings)
+
+    def test_create_vds_plan_pad_stripes(self):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["source_1", "source_2"],
+                                 name="vds.hdf5", layout="stripes",
+                                 frame_policy="pad",
+                                 source_frames=dict(data=dict(source_1=3,
+                                                              source_2=2)))
+        source = vdsgenerator.Source(frames=(3,), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(3, 522, 2048), spacing=[10, 0])
+
+        plan = gen.create_vds_plan(source, vds)
+
+        self.assertEqual(dict(frame_policy="pad", source_frames=[3, 2]),
+                         plan.attributes)
+        self.assertEqual([
+            Mapping("source_1", "data", (3, 256, 2048),
+                    (slice(None), slice(0, 266), slice(None))),
+            Mapping("source_2", "data", (2, 256, 2048),
+                    (slice(0, 2), slice(266, 522), slice(None)))],
+            plan.mappings)
+
+    def test_create_vds_plan_pad_interleave(self):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["source_1", "source_2",
+                                           "source_3"],
+                                 name="vds.hdf5", layout="interleave",
+                                 frame_policy="pad",
+                                 source_frames=dict(data=dict(
+                                     source_1=3, source_2=2, source_3=0)))
+        source = vdsgenerator.Source(frames=(3,), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(9, 256, 2048), spacing=[0] * 3)
+
+        plan = gen.create_vds_plan(source, vds)
+
+        self.assertEqual([3, 2, 0], plan.attributes["source_frames"])
+        # The source with no frames is left out
+        self.assertEqual([(slice(0, 7, 3), slice(None), slice(None)),
+                          (slice(1, 5, 3), slice(None), slice(None))],
+                         [mapping.target_index for mapping in plan.mappings])
+
+    def test_create_vds_plan_live_stripes(self):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["source_1", "source_2"],
+                                 name="vds.hdf5", layout="stripes",
+                                 live=True)
+        source = vdsgenerator.Source(frames=(0,), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(0, 522, 2048), spacing=[10, 0])
+
+        plan = gen.create_vds_plan(source, vds)
+
+        self.assertEqual((None, 522, 2048), plan.maxshape)
+        self.assertEqual([
+            Mapping("source_1", "data", (0, 256, 2048),
+                    (slice(None), slice(0, 256), slice(None))),
+            Mapping("source_2", "data", (0, 256, 2048),
+                    (slice(None), slice(266, 522), slice(None)))],
+            plan.mappings)
+
+    def test_create_vds_plan_live_interleave(self):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["source_1", "source_2"],
+                                 name="vds.hdf5", layout="interleave",
+                                 live=True)
+        source = vdsgenerator.Source(frames=(3,), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(6, 256, 2048), spacing=[0] * 2)
+
+        plan = gen.create_vds_plan(source, vds)
+
+        self.assertEqual((None, 256, 2048), plan.maxshape)
+        self.assertEqual([(slice(0, None, 2), slice(None), slice(None)),
+                          (slice(1, None, 2), slice(None), slice(None))],
+                         [mapping.target_index for mapping in plan.mappings])
+
+    def test_create_vds_plan_live_no_frames_then_error(self):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["source_1", "source_2"],
+                                 name="vds.hdf5", layout="interleave",
+                                 live=True)
+        source = vdsgenerator.Source(frames=(), height=256, width=2048,
+                                     dtype="uint16")
+        vds = vdsgenerator.VDS(shape=(2, 256, 2048), spacing=[0] * 2)
+
+        with self.assertRaises(ValueError):
+            gen.create_vds_plan(source, vds)
+
+    def test_create_vds_plan_per_frame_values(self):
+        gen = VDSGeneratorTester(output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 datasets=["source_1", "source_2"],
+                                 name="vds.hdf5", layout="stripes")
+        source = vdsgenerator.Source(frames=(3,), height=None, width=None,
+                                     dtype="float64")
+        vds = vdsgenerator.VDS(shape=(6,), spacing=[0] * 2)
+
+        plan = gen.create_vds_plan(source, vds, target_node="timestamps",
+                                   source_node="times", layout="frames")
+
+        self.assertEqual("timestamps", plan.target_node)
+        self.assertEqual([
+            Mapping("source_1", "times", (3,), (slice(0, 3),)),
+            Mapping("source_2", "times", (3,), (slice(3, 6),))],
+            plan.mappings)
+
+
+class AppendVDSTest(unittest.TestCase):
+
+    file_mock = MagicMock()
+
+    def setUp(self):
+        isfile_patcher = patch('os.path.isfile', return_value=True)
+        self.isfile_mock = isfile_patcher.start()
+        self.addCleanup(isfile_patcher.stop)
+        self.file_mock.reset_mock()
+        self.vds_file_mock = self.file_mock.__enter__.return_value
+        self.dataset_mock = MagicMock(shape=(6, 256, 2048),
+                                      maxshape=(6, 256, 2048), dtype="uint16")
+        self.vds_file_mock.get.return_value = self.dataset_mock
+        self.gen = VDSGeneratorTester(
+            output_file="/test/path/vds.hdf5", name="vds.hdf5",
+            target_node="full_frame", source_node="data", layout="frames",
+            datasets=["/test/path/stripe_1.hdf5", "/test/path/stripe_2.hdf5",
+                      "/test/path/stripe_3.hdf5"],
+            source_metadata=vdsgenerator.Source(frames=(3,), height=256,
+                                                width=2048, dtype="uint16"))
+
+    @patch(VDSGenerator_patch_path + '.read_vds_maps',
+           return_value=[Mapping("/test/path/stripe_1.hdf5", "data",
+                                 (3, 256, 2048),
+                                 (slice(0, 3), slice(0, 256),
+                                  slice(0, 2048))),
+                         Mapping("/test/path/stripe_2.hdf5", "data",
+                                 (3, 256, 2048),
+                                 (slice(3, 6), slice(0, 256),
+                                  slice(0, 2048)))])
+    @patch(h5py_patch_path + '.VirtualMap')
+    @patch(h5py_patch_path + '.VirtualSource')
+    @patch(h5py_patch_path + '.VirtualTarget')
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    def test_append_vds(self, h5file_mock, target_mock, source_mock, map_mock,
+                        read_mock):
+        self.gen.append_vds()
+
+        h5file_mock.assert_called_once_with("/test/path/vds.hdf5", "a",
+                                            libver="latest")
+        read_mock.assert_called_once_with(self.dataset_mock)
+        target_mock.assert_called_once_with("/test/path/vds.hdf5",
+                                            "full_frame",
+                                            shape=(9, 256, 2048))
+        source_mock.assert_has_calls([
+            call("/test/path/stripe_1.hdf5", "data", shape=(3, 256, 2048)),
+            call("/test/path/stripe_2.hdf5", "data", shape=(3, 256, 2048)),
+            call("/test/path/stripe_3.hdf5", "data", shape=(3, 256, 2048))])
+        target_mock.return_value.__getitem__.assert_has_calls([
+            call((slice(0, 3), slice(0, 256), slice(0, 2048))),
+            call((slice(3, 6), slice(0, 256), slice(0, 2048))),
+            call((slice(6, 9), slice(None), slice(None)))])
+        self.vds_file_mock.__delitem__.assert_called_once_with("full_frame")
+        self.vds_file_mock.create_virtual_dataset.assert_called_once_with(
+            VMlist=[map_mock.return_value] * 3, fillvalue=0x1)
+
+    @patch(VDSGenerator_patch_path + '.read_vds_maps',
+           return_value=[Mapping("/test/path/stripe_1.hdf5", "data",
+                                 (3, 256, 2048),
+                                 (slice(0, 2), slice(0, 256),
+                                  slice(0, 2048)),
+                                 (slice(0, 2), slice(0, 256),
+                                  slice(0, 2048))),
+                         Mapping("/test/path/stripe_2.hdf5", "data",
+                                 (2, 256, 2048),
+                                 (slice(2, 4), slice(0, 256),
+                                  slice(0, 2048)))])
+    @patch(h5py_patch_path + '.VirtualMap')
+    @patch(h5py_patch_path + '.VirtualSource')
+    @patch(h5py_patch_path + '.VirtualTarget')
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    def test_append_vds_truncate(self, _, target_mock, source_mock, _2, _3):
+        self.dataset_mock.shape = (4, 256, 2048)
+        self.dataset_mock.attrs = dict(frame_policy="truncate",
+                                       source_frames=[3, 2])
+        self.gen.frame_policy = "truncate"
+        self.gen.source_frames = dict(data={
+            "/test/path/stripe_1.hdf5": 3, "/test/path/stripe_2.hdf5": 2,
+            "/test/path/stripe_3.hdf5": 4})
+        self.gen.source_metadata = vdsgenerator.Source(
+            frames=(2,), height=256, width=2048, dtype="uint16")
+
+        self.gen.append_vds()
+
+        target_mock.assert_called_once_with("/test/path/vds.hdf5",
+                                            "full_frame",
+                                            shape=(6, 256, 2048))
+        # The existing truncated map still selects its first two frames
+        source_mock.return_value.__getitem__.assert_has_calls([
+            call((slice(0, 2), slice(0, 256), slice(0, 2048))),
+            call((slice(0, 2), slice(None), slice(None)))])
+        self.assertEqual([
+            call("/test/path/stripe_1.hdf5", "data", shape=(3, 256, 2048)),
+            call("/test/path/stripe_2.hdf5", "data", shape=(2, 256, 2048)),
+            call("/test/path/stripe_3.hdf5", "data", shape=(4, 256, 2048))],
+            source_mock.call_args_list)
+        target_mock.return_value.__getitem__.assert_called_with(
+            (slice(4, 6), slice(None), slice(None)))
+        attributes = self.vds_file_mock.__getitem__.return_value.attrs
+        attributes.update.assert_called_once_with(
+            dict(frame_policy="truncate", source_frames=[3, 2, 4]))
+
+    @patch(VDSGenerator_patch_path + '.read_vds_maps',
+           return_value=[Mapping("/test/path/stripe_{}.hdf5".format(idx),
+                                 "data", (3, 256, 2048), ())
+                         for idx in range(1, 4)])
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    def test_append_vds_nothing_new_then_no_op(self, _, _2):
+        self.gen.append_vds()
+
+        self.vds_file_mock.create_virtual_dataset.assert_not_called()
+
+    @patch(VDSGenerator_patch_path + '.read_vds_maps',
+           return_value=[Mapping("/test/path/stripe_%b.hdf5", "data",
+                                 (3, 256, 2048),
+                                 (slice(0, None, 3), slice(0, 256),
+                                  slice(0, 2048)))])
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    def test_append_vds_printf_then_error(self, _, _2):
+        self.dataset_mock.maxshape = (None, 256, 2048)
+
+        with self.assertRaises(ValueError):
+            self.gen.append_vds()
+
+        self.vds_file_mock.__delitem__.assert_not_called()
+        self.vds_file_mock.create_virtual_dataset.assert_not_called()
+
+    @patch(VDSGenerator_patch_path + '.read_vds_maps',
+           return_value=[Mapping("/test/path/stripe_1.hdf5", "data",
+                                 (3, 256, 2048),
+                                 (slice(0, None), slice(0, 256),
+                                  slice(0, 2048)))])
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    def test_append_vds_unlimited_then_error(self, _, _2):
+        self.dataset_mock.maxshape = (None, 256, 2048)
+
+        with self.assertRaises(ValueError):
+            self.gen.append_vds()
+
+        self.vds_file_mock.__delitem__.assert_not_called()
+
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    def test_append_vds_no_file_then_error_and_not_created(self,
+                                                           h5file_mock):
+        self.isfile_mock.return_value = False
+
+        with self.assertRaises(IOError):
+            self.gen.append_vds()
+
+        h5file_mock.assert_not_called()
+
+    @patch(VDSGenerator_patch_path + '.read_vds_maps',
+           return_value=[Mapping("stripe_1.hdf5", "data", (3, 256, 2048),
+                                 (slice(0, 3), slice(0, 256),
+                                  slice(0, 2048)))])
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    def test_find_unmapped(self, h5file_mock, read_mock):
+        unmapped = self.gen.find_unmapped(self.gen.datasets)
+
+        h5file_mock.assert_called_once_with("/test/path/vds.hdf5", "r",
+                                            libver="latest")
+        read_mock.assert_called_once_with(self.dataset_mock)
+        # Relative to the VDS file
+        self.assertEqual(["/test/path/stripe_2.hdf5",
+                          "/test/path/stripe_3.hdf5"], unmapped)
+        self.assertEqual(1, self.gen.metrics.counters["file_opens"])
+
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    def test_find_unmapped_no_file_then_error(self, h5file_mock):
+        self.isfile_mock.return_value = False
+
+        with self.assertRaises(IOError):
+            self.gen.find_unmapped(self.gen.datasets)
+
+        h5file_mock.assert_not_called()
+
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    def test_append_vds_no_node_then_error(self, _):
+        self.vds_file_mock.get.return_value = None
+
+        with self.assertRaises(IOError):
+            self.gen.append_vds()
+
+    def test_append_vds_stripes_then_error(self):
+        self.gen.layout = "stripes"
+
+        with self.assertRaises(ValueError):
+            self.gen.append_vds()
+
+    def test_append_vds_extra_nodes_then_error(self):
+        self.gen.extra_nodes = [dict(source_node="times",
+                                     target_node="timestamps")]
+
+        with self.assertRaises(ValueError):
+            self.gen.append_vds()
+
+    def test_read_vds_maps(self):
+        dcpl_mock = self.dataset_mock.id.get_create_plist.return_value
+        dcpl_mock.get_layout.return_value = h5py.h5d.VIRTUAL
+        dcpl_mock.get_virtual_count.return_value = 1
+        dcpl_mock.get_virtual_filename.return_value = "stripe_1.hdf5"
+        dcpl_mock.get_virtual_dsetname.return_value = "data"
+        dcpl_mock.get_virtual_srcspace.return_value.shape = (3, 256, 2048)
+        dcpl_mock.get_virtual_vspace.return_value.get_select_bounds\
+            .return_value = ((3, 0, 0), (5, 255, 2047))
+
+        maps = self.gen.read_vds_maps(self.dataset_mock)
+
+        self.assertEqual([Mapping("stripe_1.hdf5", "data", (3, 256, 2048),
+                                  (slice(3, 6), slice(0, 256),
+                                   slice(0, 2048)))],
+                         maps)
+
+    def test_read_vds_maps_no_source_extent(self):
+        dcpl_mock = self.dataset_mock.id.get_create_plist.return_value
+        dcpl_mock.get_layout.return_value = h5py.h5d.VIRTUAL
+        dcpl_mock.get_virtual_count.return_value = 1
+        dcpl_mock.get_virtual_filename.return_value = "stripe_1.hdf5"
+        dcpl_mock.get_virtual_dsetname.return_value = "data"
+        dcpl_mock.get_virtual_srcspace.return_value.shape = ()
+        dcpl_mock.get_virtual_vspace.return_value.get_select_bounds\
+            .return_value = ((3, 0, 0), (5, 255, 2047))
+
+        maps = self.gen.read_vds_maps(self.dataset_mock)
+
+        self.assertEqual((3, 256, 2048), maps[0][2])
+
+    def test_read_vds_maps_strided(self):
+        dcpl_mock = self.dataset_mock.id.get_create_plist.return_value
+        dcpl_mock.get_layout.return_value = h5py.h5d.VIRTUAL
+        dcpl_mock.get_virtual_count.return_value = 1
+        dcpl_mock.get_virtual_filename.return_value = "stripe_2.hdf5"
+        dcpl_mock.get_virtual_dsetname.return_value = "data"
+        dcpl_mock.get_virtual_srcspace.return_value.shape = ()
+        vspace_mock = dcpl_mock.get_virtual_vspace.return_value
+        vspace_mock.get_select_bounds.return_value = ((1, 0, 0),
+                                                      (10, 255, 2047))
+        vspace_mock.get_select_type.return_value = h5py.h5s.SEL_HYPERSLABS
+        vspace_mock.is_regular_hyperslab.return_value = True
+        vspace_mock.get_regular_hyperslab.return_value = (
+            (1, 0, 0), (3, 1, 1), (4, 1, 1), (1, 256, 2048))
+
+        maps = self.gen.read_vds_maps(self.dataset_mock)
+
+        self.assertEqual([Mapping("stripe_2.hdf5", "data", (4, 256, 2048),
+                                  (slice(1, 11, 3), slice(0, 256),
+                                   slice(0, 2048)))],
+                         maps)
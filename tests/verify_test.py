@@ -0,0 +1,239 @@
+import random
+import unittest
+
+from pkg_resources import require
+require("mock")
+from mock import MagicMock, patch
+
+import numpy as np
+
+from vdsgen import verify
+from vdsgen.plan import VDSPlan, Mapping
+
+verify_patch_path = "vdsgen.verify"
+h5py_patch_path = "h5py"
+
+
+class SampleSelectionsTest(unittest.TestCase):
+
+    def test_frames(self):
+        mapping = Mapping("stripe_2.h5", "data", (3, 256, 2048),
+                          (slice(3, 6), slice(0, 256), slice(0, 2048)))
+
+        selections = verify.sample_selections(mapping, (6, 256, 2048), 5, 64,
+                                              random.Random(0))
+
+        self.assertEqual(5, len(selections))
+        for target, source in selections:
+            self.assertEqual(1, target[0].stop - target[0].start)
+            self.assertEqual(target[0].start - 3, source[0].start)
+            self.assertEqual(64, target[2].stop - target[2].start)
+            self.assertEqual(target[1:], source[1:])
+
+    def test_interleave(self):
+        mapping = Mapping("stripe_2.h5", "data", (3, 256, 2048),
+                          (slice(1, 6, 2), slice(0, 256), slice(0, 2048)))
+
+        for target, source in verify.sample_selections(
+                mapping, (6, 256, 2048), 5, 64, random.Random(0)):
+            self.assertEqual(target[0].start, 2 * source[0].start + 1)
+            self.assertEqual(2, target[0].step)
+
+    def test_region_larger_than_map(self):
+        mapping = Mapping("stripe_1.h5", "data", (3, 16, 32),
+                          (slice(None), slice(0, 16), slice(None)))
+
+        [(target, source)] = verify.sample_selections(
+            mapping, (3, 36, 32), 1, 64, random.Random(0))
+
+        self.assertEqual((slice(0, 16, 1), slice(0, 32, 1)), target[1:])
+
+    def test_empty_map_then_no_samples(self):
+        mapping = Mapping("stripe_1.h5", "data", (0, 16, 32),
+                          (slice(0, 0), slice(None), slice(None)))
+
+        self.assertEqual([], verify.sample_selections(
+            mapping, (0, 16, 32), 2, 64, random.Random(0)))
+
+
+class FindOutOfOrderTest(unittest.TestCase):
+
+    def test_in_order(self):
+        mappings = [Mapping("stripe_{}.h5".format(idx), "data", (3, 256, 8),
+                            (slice(None), slice(256 * idx, 256 * idx + 256),
+                             slice(None)))
+                    for idx in [2, 10, 1]]
+
+        self.assertEqual([], verify.find_out_of_order(mappings, (3, 768, 8)))
+
+    def test_swapped(self):
+        mappings = [
+            Mapping("stripe_1.h5", "data", (3, 256, 8),
+                    (slice(3, 6), slice(None), slice(None))),
+            Mapping("stripe_2.h5", "data", (3, 256, 8),
+                    (slice(0, 3), slice(None), slice(None)))]
+
+        self.assertEqual(["stripe_2.h5"],
+                         verify.find_out_of_order(mappings, (6, 256, 8)))
+
+    def test_grid_then_not_checked(self):
+        # Explicit geometry, with module 2 below module 1 and module 3 to the
+        # right of module 1
+        mappings = [
+            Mapping("mod_{}.h5".format(idx), "data", (3, 4, 8),
+                    (slice(None), slice(row, row + 4),
+                     slice(column, column + 8)))
+            for idx, (row, column) in enumerate([(0, 0), (6, 0), (0, 10),
+                                                 (6, 10)], 1)]
+
+        self.assertEqual([], verify.find_out_of_order(mappings, (3, 10, 18)))
+
+    def test_not_numbered_then_not_checked(self):
+        mappings = [
+            Mapping("a.h5", "data", (3,), (slice(3, 6),)),
+            Mapping("stripe_2.h5", "data", (3,), (slice(0, 3),))]
+
+        self.assertEqual([], verify.find_out_of_order(mappings, (6,)))
+
+
+class VerifyMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mapping = Mapping("stripe_2.h5", "data", (3, 4, 8),
+                               (slice(3, 6), slice(0, 4), slice(0, 8)))
+        self.data = np.arange(6 * 4 * 8, dtype="uint16").reshape((6, 4, 8))
+        self.dataset = MagicMock(shape=(6, 4, 8), dtype=np.dtype("uint16"))
+        self.dataset.__getitem__.side_effect = self.data.__getitem__
+
+    def mock_source(self, h5file_mock, data):
+        source_mock = h5file_mock.return_value.__enter__.return_value
+        source_dataset = source_mock.get.return_value
+        source_dataset.shape = data.shape
+        source_dataset.__getitem__.side_effect = data.__getitem__
+
+    @patch('os.path.isfile', return_value=True)
+    @patch(h5py_patch_path + '.File')
+    def test_match(self, h5file_mock, _):
+        self.mock_source(h5file_mock, self.data[3:6])
+
+        result = verify.verify_map(self.dataset, "/test/stripe_2.h5",
+                                   self.mapping, 3, 2, 0)
+
+        h5file_mock.assert_called_once_with("/test/stripe_2.h5", "r")
+        self.assertEqual(dict(file="stripe_2.h5", error=None, samples=3,
+                              mismatches=[]), result)
+
+    @patch('os.path.isfile', return_value=True)
+    @patch(h5py_patch_path + '.File')
+    def test_mismatch(self, h5file_mock, _):
+        # The VDS reads fill values where the source has data
+        self.mock_source(h5file_mock, self.data[3:6] + 1)
+
+        result = verify.verify_map(self.dataset, "/test/stripe_2.h5",
+                                   self.mapping, 2, 2, 0)
+
+        self.assertIsNone(result["error"])
+        self.assertEqual(2, len(result["mismatches"]))
+
+    @patch('os.path.isfile', return_value=False)
+    def test_missing_file(self, _):
+        result = verify.verify_map(self.dataset, "/test/stripe_2.h5",
+                                   self.mapping, 1, 2, 0)
+
+        self.assertEqual("File does not exist", result["error"])
+
+    @patch('os.path.isfile', return_value=True)
+    @patch(h5py_patch_path + '.File')
+    def test_wrong_shape(self, h5file_mock, _):
+        self.mock_source(h5file_mock, self.data[3:5])
+
+        result = verify.verify_map(self.dataset, "/test/stripe_2.h5",
+                                   self.mapping, 1, 2, 0)
+
+        self.assertEqual("Shape (2, 4, 8) != mapped shape (3, 4, 8)",
+                         result["error"])
+
+    @patch('os.path.isfile', return_value=True)
+    @patch(h5py_patch_path + '.File')
+    def test_missing_node(self, h5file_mock, _):
+        h5file_mock.return_value.__enter__.return_value.get.return_value = \
+            None
+
+        result = verify.verify_map(self.dataset, "/test/stripe_2.h5",
+                                   self.mapping, 1, 2, 0)
+
+        self.assertEqual("No node data", result["error"])
+
+
+class VerifyVDSTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plan = VDSPlan("/test/vds.h5", "full_frame", (6, 4, 8), "uint16")
+        self.plan.add_mapping("stripe_1.h5", "data", (3, 4, 8),
+                              (slice(0, 3), slice(0, 4), slice(0, 8)))
+        self.plan.add_mapping("stripe_2.h5", "data", (3, 4, 8),
+                              (slice(3, 6), slice(0, 4), slice(0, 8)))
+        self.results = [
+            dict(file="stripe_1.h5", error=None, samples=2, mismatches=[]),
+            dict(file="stripe_2.h5", error="File does not exist", samples=0,
+                 mismatches=[])]
+
+    @patch(verify_patch_path + '.Pool')
+    @patch(verify_patch_path + '.read_plans')
+    def test_verify_pool(self, read_mock, pool_init_mock):
+        read_mock.return_value = [self.plan]
+        pool_mock = pool_init_mock.return_value
+        pool_mock.map.return_value = self.results
+
+        report = verify.verify_vds("/test/vds.h5", samples=2, workers=4,
+                                   seed=0)
+
+        read_mock.assert_called_once_with("/test/vds.h5", ["full_frame"])
+        pool_init_mock.assert_called_once_with(
+            2, verify._open_dataset, ("/test/vds.h5", "full_frame"))
+        tasks = pool_mock.map.call_args[0][1]
+        self.assertEqual(["/test/stripe_1.h5", "/test/stripe_2.h5"],
+                         [task[0] for task in tasks])
+        self.assertEqual(dict(maps=2, samples=2, out_of_order=[],
+                              unresolved=[dict(file="stripe_2.h5",
+                                               error="File does not exist")],
+                              mismatches=[]), report)
+
+    @patch(verify_patch_path + '.verify_map')
+    @patch(h5py_patch_path + '.File')
+    @patch(verify_patch_path + '.read_plans')
+    def test_verify_sampled_maps(self, read_mock, h5file_mock, verify_mock):
+        read_mock.return_value = [self.plan]
+        verify_mock.return_value = dict(file="stripe_1.h5", error=None,
+                                        samples=1,
+                                        mismatches=[[[0, 1, 1]]])
+
+        report = verify.verify_vds("/test/vds.h5", maps=1, seed=0)
+
+        self.assertEqual(1, verify_mock.call_count)
+        self.assertEqual([dict(file="stripe_1.h5", target_index=[[0, 1, 1]])],
+                         report["mismatches"])
+
+
+class MainTest(unittest.TestCase):
+
+    @patch(verify_patch_path + '.verify_vds',
+           return_value=dict(maps=2, samples=2, unresolved=[],
+                             out_of_order=[], mismatches=[]))
+    @patch(verify_patch_path + '.parse_args',
+           return_value=MagicMock(vds_file="/test/vds.h5", node="full_frame",
+                                  samples=1, region=64, maps=None, workers=4,
+                                  seed=None))
+    def test_main(self, parse_mock, verify_mock):
+        self.assertEqual(0, verify.main())
+
+        verify_mock.assert_called_once_with(
+            "/test/vds.h5", node="full_frame", samples=1, region=64,
+            maps=None, workers=4, seed=None)
+
+    @patch(verify_patch_path + '.verify_vds',
+           return_value=dict(maps=2, samples=2, unresolved=[],
+                             out_of_order=["stripe_2.h5"], mismatches=[]))
+    @patch(verify_patch_path + '.parse_args')
+    def test_main_problems_then_failure(self, parse_mock, verify_mock):
+        self.assertEqual(1, verify.main())
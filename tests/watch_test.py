@@ -0,0 +1,340 @@
+import unittest
+
+from pkg_resources import require
+require("mock")
+from mock import MagicMock, patch, call
+
+from vdsgen import watch
+from vdsgen.watch import VDSWatcher
+
+watch_patch_path = "vdsgen.watch"
+VDSWatcher_patch_path = watch_patch_path + ".VDSWatcher"
+
+
+class VDSWatcherTester(VDSWatcher):
+
+    """A version of VDSWatcher without initialisation."""
+
+    def __init__(self, **kwargs):
+        for attribute, value in kwargs.items():
+            self.__setattr__(attribute, value)
+
+
+class VDSWatcherInitTest(unittest.TestCase):
+
+    def test_defaults(self):
+        watcher = VDSWatcher("/test/path", "stripe_", output="vds.h5")
+
+        self.assertEqual("/test/path", watcher.path)
+        self.assertEqual("stripe_", watcher.prefix)
+        self.assertIsNone(watcher.expected)
+        self.assertEqual(5.0, watcher.settle_time)
+        self.assertEqual(1.0, watcher.poll_interval)
+        self.assertIsNone(watcher.timeout)
+        self.assertFalse(watcher.once)
+        self.assertEqual(dict(output="vds.h5"), watcher.generator_args)
+
+    def test_expected_then_short_settle_time(self):
+        watcher = VDSWatcher("/test/path", "stripe_", expected=6)
+
+        self.assertEqual(6, watcher.expected)
+        self.assertEqual(1.0, watcher.settle_time)
+
+    def test_given_args(self):
+        watcher = VDSWatcher("/test/path", "stripe_", expected=6,
+                             settle_time=2.0, poll_interval=0.5, timeout=60,
+                             once=True)
+
+        self.assertEqual(2.0, watcher.settle_time)
+        self.assertEqual(0.5, watcher.poll_interval)
+        self.assertEqual(60, watcher.timeout)
+        self.assertTrue(watcher.once)
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.watcher = VDSWatcherTester(path="/test/path", prefix="stripe_",
+                                        _folder_mtime=None, _files=[])
+
+    @patch('os.stat')
+    @patch(watch_patch_path + '.find_files',
+           return_value=["/test/path/stripe_1.h5", "/test/path/stripe_2.h5"])
+    def test_snapshot(self, find_mock, stat_mock):
+        stat_mock.side_effect = [MagicMock(st_mtime=1.0),
+                                 MagicMock(st_size=10, st_mtime=2.0),
+                                 MagicMock(st_size=20, st_mtime=3.0)]
+
+        snapshot = self.watcher.snapshot()
+
+        find_mock.assert_called_once_with("/test/path", "stripe_")
+        self.assertEqual({"/test/path/stripe_1.h5": (10, 2.0),
+                          "/test/path/stripe_2.h5": (20, 3.0)}, snapshot)
+
+    @patch('os.stat', return_value=MagicMock(st_size=10, st_mtime=1.0))
+    @patch(watch_patch_path + '.find_files',
+           return_value=["/test/path/stripe_1.h5"])
+    def test_snapshot_folder_unchanged_then_not_listed(self, find_mock, _):
+        self.watcher.snapshot()
+        self.watcher.snapshot()
+
+        find_mock.assert_called_once_with("/test/path", "stripe_")
+
+    def test_is_complete_expected(self):
+        self.watcher.expected = 3
+
+        self.assertFalse(self.watcher.is_complete(dict(a=1, b=2)))
+        self.assertTrue(self.watcher.is_complete(dict(a=1, b=2, c=3)))
+
+    def test_is_complete_not_expected(self):
+        self.watcher.expected = None
+
+        self.assertFalse(self.watcher.is_complete(dict(a=1)))
+        self.assertTrue(self.watcher.is_complete(dict(a=1, b=2)))
+
+
+class WaitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.watcher = VDSWatcherTester(path="/test/path", prefix="stripe_",
+                                        expected=2, settle_time=2.0,
+                                        poll_interval=1.0, timeout=None)
+
+    @patch(VDSWatcher_patch_path + '.wait_for_change', return_value=True)
+    @patch('time.time', side_effect=[0.0] + [float(t) for t in range(10)])
+    @patch(VDSWatcher_patch_path + '.snapshot')
+    @patch(VDSWatcher_patch_path + '.create_notifier', return_value=None)
+    def test_wait_for_settled_set(self, _, snapshot_mock, _2, wait_mock):
+        snapshot_mock.side_effect = [
+            {"stripe_1.h5": (10, 1.0)},
+            {"stripe_1.h5": (10, 1.0), "stripe_2.h5": (10, 2.0)},
+            {"stripe_1.h5": (10, 1.0), "stripe_2.h5": (20, 3.0)},
+            {"stripe_1.h5": (10, 1.0), "stripe_2.h5": (20, 3.0)}]
+
+        snapshot = self.watcher.wait()
+
+        self.assertEqual(
+            {"stripe_1.h5": (10, 1.0), "stripe_2.h5": (20, 3.0)}, snapshot)
+        self.assertEqual(4, snapshot_mock.call_count)
+
+    @patch(VDSWatcher_patch_path + '.wait_for_change', return_value=True)
+    @patch('time.time', side_effect=[0.0] + [float(t) for t in range(10)])
+    @patch(VDSWatcher_patch_path + '.snapshot')
+    @patch(VDSWatcher_patch_path + '.create_notifier', return_value=None)
+    def test_wait_previous_set_then_wait_for_new(self, _, snapshot_mock, _2,
+                                                 wait_mock):
+        previous = {"stripe_1.h5": (10, 1.0), "stripe_2.h5": (10, 1.0)}
+        new = {"stripe_1.h5": (10, 4.0), "stripe_2.h5": (10, 1.0)}
+        snapshot_mock.side_effect = [previous, previous, previous, new, new]
+
+        snapshot = self.watcher.wait(previous)
+
+        self.assertEqual(new, snapshot)
+        self.assertEqual(5, snapshot_mock.call_count)
+        # Polls rather than spins while unchanged since the previous set
+        wait_mock.assert_has_calls([call(None, 1.0)] * 4)
+
+    @patch(VDSWatcher_patch_path + '.wait_for_change', return_value=True)
+    @patch('time.time', side_effect=[0.0] + [float(t) for t in range(10)])
+    @patch(VDSWatcher_patch_path + '.snapshot', return_value=dict())
+    @patch(VDSWatcher_patch_path + '.create_notifier', return_value=None)
+    def test_wait_timeout_then_error(self, _, _2, _3, _4):
+        self.watcher.timeout = 3
+
+        with self.assertRaises(IOError):
+            self.watcher.wait()
+
+    @patch('time.time', return_value=0.0)
+    @patch(VDSWatcher_patch_path + '.snapshot',
+           return_value={"stripe_1.h5": (10, 1.0)})
+    @patch(VDSWatcher_patch_path + '.create_notifier')
+    def test_wait_notifier_no_change_then_no_snapshot(self, notifier_mock,
+                                                      snapshot_mock, _):
+        notifier = notifier_mock.return_value
+        notifier.check_events.side_effect = [False, False, True]
+
+        def complete(*_):
+            # Second file appears after the event
+            snapshot_mock.return_value = {"stripe_1.h5": (10, 1.0),
+                                          "stripe_2.h5": (10, 1.0)}
+        notifier.process_events.side_effect = complete
+        self.watcher.settle_time = 0.0
+
+        snapshot = self.watcher.wait()
+
+        self.assertEqual(["stripe_1.h5", "stripe_2.h5"], sorted(snapshot))
+        self.assertEqual(2, snapshot_mock.call_count)
+        notifier.check_events.assert_has_calls([call(1000)] * 3)
+        notifier.stop.assert_called_once_with()
+
+
+class WaitForChangeTest(unittest.TestCase):
+
+    @patch('time.sleep')
+    def test_no_notifier_then_sleep(self, sleep_mock):
+        self.assertTrue(VDSWatcher.wait_for_change(None, 0.5))
+
+        sleep_mock.assert_called_once_with(0.5)
+
+    def test_notifier_no_events(self):
+        notifier = MagicMock()
+        notifier.check_events.return_value = False
+
+        self.assertFalse(VDSWatcher.wait_for_change(notifier, 0.5))
+
+        notifier.check_events.assert_called_once_with(500)
+        notifier.read_events.assert_not_called()
+
+
+class RunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.watcher = VDSWatcherTester(path="/test/path", prefix="stripe_",
+                                        timeout=60, once=False,
+                                        generator_args=dict(), _files=[],
+                                        _outputs=set())
+        self.first = dict(a=1)
+        self.second = dict(a=2)
+
+    @patch(VDSWatcher_patch_path + '.generate')
+    @patch(VDSWatcher_patch_path + '.wait')
+    def test_run_once(self, wait_mock, generate_mock):
+        wait_mock.return_value = self.first
+        self.watcher.once = True
+
+        gen = self.watcher.run()
+
+        wait_mock.assert_called_once_with(None)
+        generate_mock.assert_called_once_with(self.first)
+        self.assertEqual(generate_mock.return_value, gen)
+
+    @patch(VDSWatcher_patch_path + '.generate')
+    @patch(VDSWatcher_patch_path + '.wait')
+    def test_run_loops_until_timeout(self, wait_mock, generate_mock):
+        wait_mock.side_effect = [self.first, self.second, IOError()]
+        generate_mock.side_effect = ["gen_1", "gen_2"]
+
+        gen = self.watcher.run()
+
+        wait_mock.assert_has_calls(
+            [call(None), call(self.first), call(self.second)])
+        generate_mock.assert_has_calls([call(self.first), call(self.second)])
+        self.assertEqual("gen_2", gen)
+
+    @patch(VDSWatcher_patch_path + '.generate')
+    @patch(VDSWatcher_patch_path + '.wait')
+    def test_run_generate_error_then_keep_watching(self, wait_mock,
+                                                   generate_mock):
+        wait_mock.side_effect = [self.first, self.second, IOError()]
+        generate_mock.side_effect = [ValueError("Bad set"), "gen_2"]
+
+        gen = self.watcher.run()
+
+        generate_mock.assert_has_calls([call(self.first), call(self.second)])
+        self.assertEqual("gen_2", gen)
+
+    @patch(VDSWatcher_patch_path + '.generate',
+           side_effect=ValueError("Bad set"))
+    @patch(VDSWatcher_patch_path + '.wait')
+    def test_run_once_generate_error_then_error(self, wait_mock, _):
+        wait_mock.return_value = self.first
+        self.watcher.once = True
+
+        with self.assertRaises(ValueError):
+            self.watcher.run()
+
+    @patch('os.remove')
+    @patch('os.path.isfile', return_value=True)
+    @patch(watch_patch_path + '.VDSGenerator')
+    @patch(VDSWatcher_patch_path + '.wait')
+    def test_run_two_sets_then_replace_output(self, wait_mock, gen_init_mock,
+                                              isfile_mock, remove_mock):
+        self.watcher._files = ["/test/path/stripe_1.h5",
+                               "/test/path/stripe_2.h5"]
+        first = {"/test/path/stripe_1.h5": (10, 1.0),
+                 "/test/path/stripe_2.h5": (10, 1.0)}
+        second = {"/test/path/stripe_1.h5": (20, 2.0),
+                  "/test/path/stripe_2.h5": (20, 2.0)}
+        wait_mock.side_effect = [first, second, IOError()]
+        gen_mock = gen_init_mock.return_value
+        gen_mock.output_file = "/test/path/stripe_vds.h5"
+
+        self.watcher.run()
+
+        self.assertEqual(2, gen_mock.generate_vds.call_count)
+        # Only the VDS of the first set is replaced
+        remove_mock.assert_called_once_with("/test/path/stripe_vds.h5")
+
+    @patch('os.remove')
+    @patch(watch_patch_path + '.VDSGenerator')
+    def test_generate_existing_other_output_then_not_removed(
+            self, gen_init_mock, remove_mock):
+        gen_init_mock.return_value.output_file = "/test/path/stripe_vds.h5"
+
+        self.watcher.generate(dict())
+
+        remove_mock.assert_not_called()
+        self.assertEqual({"/test/path/stripe_vds.h5"}, self.watcher._outputs)
+
+    @patch(VDSWatcher_patch_path + '.generate')
+    @patch(VDSWatcher_patch_path + '.wait', side_effect=IOError())
+    def test_run_no_first_set_then_error(self, _, generate_mock):
+        with self.assertRaises(IOError):
+            self.watcher.run()
+
+        generate_mock.assert_not_called()
+
+    @patch(watch_patch_path + '.VDSGenerator')
+    def test_generate(self, gen_init_mock):
+        self.watcher.generator_args = dict(output="vds.h5")
+        self.watcher._files = ["/test/path/stripe_1.h5",
+                               "/test/path/stripe_2.h5"]
+
+        gen = self.watcher.generate({"/test/path/stripe_1.h5": (10, 1.0),
+                                     "/test/path/stripe_2.h5": (10, 1.0)})
+
+        gen_init_mock.assert_called_once_with(
+            "/test/path", files=["stripe_1.h5", "stripe_2.h5"],
+            output="vds.h5")
+        gen_init_mock.return_value.generate_vds.assert_called_once_with()
+        self.assertEqual(gen_init_mock.return_value, gen)
+
+    @patch(watch_patch_path + '.VDSGenerator')
+    def test_generate_ten_or_more_then_index_order(self, gen_init_mock):
+        # In the order of find_files - sorted would put stripe_10 first
+        self.watcher._files = ["/test/path/stripe_{}.h5".format(index)
+                               for index in range(1, 12)]
+        snapshot = dict((file_, (10, 1.0)) for file_ in self.watcher._files)
+        # Removed since the folder was listed
+        del snapshot["/test/path/stripe_5.h5"]
+        self.watcher.generator_args = dict()
+
+        self.watcher.generate(snapshot)
+
+        gen_init_mock.assert_called_once_with(
+            "/test/path", files=["stripe_1.h5", "stripe_2.h5", "stripe_3.h5",
+                                 "stripe_4.h5", "stripe_6.h5", "stripe_7.h5",
+                                 "stripe_8.h5", "stripe_9.h5", "stripe_10.h5",
+                                 "stripe_11.h5"])
+
+
+class MainTest(unittest.TestCase):
+
+    @patch(watch_patch_path + '.VDSWatcher')
+    @patch(watch_patch_path + '.parse_args',
+           return_value=MagicMock(
+               path="/test/path", prefix="stripe_", expected=6,
+               settle_time=None, poll_interval=1.0, timeout=None,
+               once=False, output=None, source_node="data",
+               target_node="full_frame", stripe_spacing=3,
+               module_spacing=127, layout="stripes", log_level=2))
+    def test_main(self, parse_mock, init_mock):
+        watch.main()
+
+        init_mock.assert_called_once_with(
+            "/test/path", "stripe_", expected=6, settle_time=None,
+            poll_interval=1.0, timeout=None, once=False, output=None,
+            source_node="data", target_node="full_frame",
+            stripe_spacing=3, module_spacing=127, layout="stripes",
+            log_level=2)
+        init_mock.return_value.run.assert_called_once_with()
@@ -2,6 +2,10 @@ import sys
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
 from vdsgenerator import VDSGenerator
+from geometry import load_geometry
+from plan import save_plans
+from metrics import write_metrics
+from hooks import profile_hook
 
 help_message = """
 -------------------------------------------------------------------------------
@@ -17,6 +21,60 @@ For example:
 You can create an empty VDS, for raw files that don't exist yet, with the -e
 flag; you will then need to provide --shape and --data_type, though defaults
 are provided for these.
+
+With --layout frames, sources are concatenated along the frame axis instead.
+New files can then be added to the end of an existing VDS with the -a flag:
+
+ > ../vdsgen/app.py /scratch/images -f image_3.hdf5 -o image_vds.hdf5 \\
+       --layout frames -a
+
+With --layout grid, sources are placed as tiles of a 2D grid described by a
+JSON --geometry file, either as a regular grid with gaps between tiles, e.g.
+{"rows": 2, "columns": 4, "row_gap": 30, "column_gap": 10}, or as explicit
+offsets of each source, e.g. {"offsets": [[0, 0], [0, 1034], [522, 0]]}:
+
+ > ../vdsgen/app.py /scratch/images -p module_ --layout grid \\
+       --geometry detector.json
+
+The spacing between stripes, modules and tiles can be left out with
+--compact, or a compact dataset can be created alongside the spaced one with
+--compact_node, for processing that only needs the real pixels.
+
+Other datasets in the source files, e.g. timestamps, can be mapped into the
+same VDS in the same pass with -x <source_node> <target_node> [<layout>]:
+
+ > ../vdsgen/app.py /scratch/images -p image_ --layout frames \\
+       -x timestamps timestamps -x exposure exposure
+
+Sources with different numbers of frames, e.g. after an aborted acquisition,
+raise an error unless --frame_policy is truncate, to map only the frames that
+every source has, or pad, to map every frame with fill value where a source
+has none. The policy and frames of each source are set as attributes.
+
+With --layout frames and --printf_maps, a series of sources numbered from 0,
+e.g. image_0.h5, image_1.h5, ..., is mapped with one printf-style map to
+image_%%b.h5 rather than one map per file, so the VDS stays small and grows as
+more files of the series are written. Other files are mapped one by one.
+
+To follow an acquisition live, create the VDS once at the start with --live.
+The frame axis is then unlimited and each source is mapped in full as it
+grows, so a SWMR reader of the VDS sees new frames without regenerating it.
+This works with stripes, interleave and grid layouts, but not frames:
+
+ > ../vdsgen/app.py /scratch/images -p stripe_ --live
+ > ../vdsgen/app.py /scratch/images -f stripe_1.h5 stripe_2.h5 -e --live \\
+       --shape 0 256 2048
+
+The maps can be written to a JSON file with --plan instead of creating the
+VDS, to inspect, compare or keep them:
+
+ > ../vdsgen/app.py /scratch/images -p stripe_ --plan stripe_plan.json
+
+The time taken by each phase and counters of the files, metadata and maps
+processed can be written with --metrics, as JSON or, for a file ending .prom,
+as a Prometheus node exporter textfile. The generation itself can be profiled
+with --profile, as cProfile stats or, for a file ending .folded, as sampled
+stacks for a flame graph.
 -------------------------------------------------------------------------------
 """
 
@@ -57,6 +115,42 @@ def parse_args():
         "-o", "--output", type=str, default=None, dest="output",
         help="Output file name. If None then generated as input file prefix "
              "with vds suffix.")
+    other_args.add_argument(
+        "--layout", type=str, dest="layout", default=VDSGenerator.layout,
+        choices=VDSGenerator.LAYOUTS,
+        help="Stack sources vertically as stripes, concatenate them along "
+             "the frame axis, interleave their frames or place them as tiles "
+             "of a 2D grid.")
+    other_args.add_argument(
+        "--geometry", type=str, dest="geometry", default=None,
+        help="JSON file describing the placement of tiles for grid layout.")
+    other_args.add_argument(
+        "--compact", action="store_true", dest="compact",
+        help="Leave out the spacing between stripes, modules and tiles.")
+    other_args.add_argument(
+        "--compact_node", type=str, dest="compact_node",
+        default=VDSGenerator.compact_node,
+        help="Data node in VDS file to also create a compact dataset at.")
+    other_args.add_argument(
+        "-a", "--append", action="store_true", dest="append",
+        help="Append sources to the end of an existing frames VDS.")
+    other_args.add_argument(
+        "--live", action="store_true", dest="live",
+        help="Create the VDS with an unlimited frame axis that follows "
+             "sources as they are written.")
+    other_args.add_argument(
+        "--frame_policy", type=str, dest="frame_policy",
+        default=VDSGenerator.frame_policy,
+        choices=VDSGenerator.FRAME_POLICIES,
+        help="How to handle sources with different numbers of frames.")
+    other_args.add_argument(
+        "--printf_maps", action="store_true", dest="printf_maps",
+        help="Map a series of sources numbered from 0 with one printf-style "
+             "map, for frames layout.")
+    other_args.add_argument(
+        "--plan", type=str, dest="plan", default=None,
+        help="Write the maps to a JSON plan file instead of creating the "
+             "VDS.")
     other_args.add_argument(
         "-s", "--stripe_spacing", type=int, dest="stripe_spacing",
         default=VDSGenerator.stripe_spacing,
@@ -72,6 +166,32 @@ def parse_args():
     other_args.add_argument(
         "--target_node", type=str, dest="target_node",
         default=VDSGenerator.target_node, help="Data node in VDS file.")
+    other_args.add_argument(
+        "-x", "--extra_node", type=str, nargs="+", action="append",
+        dest="extra_nodes", default=None,
+        metavar="SOURCE_NODE TARGET_NODE [LAYOUT]",
+        help="Other data node in source files to map to a data node in VDS "
+             "file, optionally with a different layout.")
+    other_args.add_argument(
+        "-w", "--workers", type=int, dest="workers",
+        default=VDSGenerator.workers,
+        help="Number of processes to read source file metadata with.")
+    other_args.add_argument(
+        "--cache", type=str, dest="cache_file",
+        default=VDSGenerator.cache_file,
+        help="File to cache source file metadata in between runs.")
+    other_args.add_argument(
+        "--cache_size", type=int, dest="cache_size",
+        default=VDSGenerator.cache_size,
+        help="Maximum number of entries in metadata cache.")
+    other_args.add_argument(
+        "--metrics", type=str, dest="metrics", default=None,
+        help="File to write timings and counters of the run to - "
+             "Prometheus textfile if it ends .prom, else JSON.")
+    other_args.add_argument(
+        "--profile", type=str, dest="profile", default=None,
+        help="File to write a profile of the run to - sampled stacks for a "
+             "flame graph if it ends .folded, else cProfile stats.")
     other_args.add_argument(
         "-l", "--log_level", type=int, dest="log_level",
         default=VDSGenerator.log_level,
@@ -84,8 +204,29 @@ def parse_args():
         parser.error(
             "To make an empty VDS you must explicitly define --files for the "
             "eventual raw datasets.")
-    if args.files is not None and len(args.files) < 2:
+    if args.append and args.layout != VDSGenerator.FRAMES:
+        parser.error("Can only append to a VDS with frames layout.")
+    if args.live and args.layout == VDSGenerator.FRAMES:
+        parser.error("Cannot make a live VDS with frames layout.")
+    if args.append and args.plan is not None:
+        parser.error("Cannot write a plan when appending.")
+    if args.layout == VDSGenerator.GRID and args.geometry is None:
+        parser.error("Must define --geometry for grid layout.")
+    if args.files is not None and len(args.files) < 2 and not args.append:
         parser.error("Must define at least two files to combine.")
+    if args.extra_nodes is not None:
+        if args.append:
+            parser.error("Cannot append with --extra_node.")
+        if args.empty:
+            parser.error("Cannot make an empty VDS with --extra_node.")
+        for extra_node in args.extra_nodes:
+            if len(extra_node) not in [2, 3]:
+                parser.error("--extra_node takes a source node, a target "
+                             "node and, optionally, a layout.")
+            if len(extra_node) == 3 and \
+                    extra_node[2] not in VDSGenerator.LAYOUTS:
+                parser.error("Invalid --extra_node layout {}.".format(
+                    extra_node[2]))
 
     return args
 
@@ -99,6 +240,24 @@ def main():
     else:
         source_metadata = None
 
+    if args.geometry is not None:
+        geometry = load_geometry(args.geometry)
+    else:
+        geometry = None
+
+    if args.extra_nodes is not None:
+        extra_nodes = [dict(zip(["source_node", "target_node", "layout"],
+                                extra_node))
+                       for extra_node in args.extra_nodes]
+    else:
+        extra_nodes = None
+
+    if args.profile is not None:
+        profiler = profile_hook(args.profile)
+        hooks = [profiler]
+    else:
+        hooks = None
+
     gen = VDSGenerator(args.path,
                        prefix=args.prefix, files=args.files,
                        output=args.output,
@@ -107,9 +266,34 @@ def main():
                        target_node=args.target_node,
                        stripe_spacing=args.stripe_spacing,
                        module_spacing=args.module_spacing,
-                       log_level=args.log_level)
+                       layout=args.layout,
+                       geometry=geometry,
+                       compact=args.compact,
+                       compact_node=args.compact_node,
+                       extra_nodes=extra_nodes,
+                       live=args.live,
+                       frame_policy=args.frame_policy,
+                       printf_maps=args.printf_maps,
+                       append=args.append,
+                       workers=args.workers,
+                       cache_file=args.cache_file,
+                       cache_size=args.cache_size,
+                       log_level=args.log_level,
+                       hooks=hooks)
+
+    if args.plan is not None:
+        save_plans(gen.plan_vds(), args.plan)
+        run_metrics = gen.metrics.to_dict()
+    elif args.append:
+        run_metrics = gen.append_vds()
+    else:
+        run_metrics = gen.generate_vds()
 
-    gen.generate_vds()
+    if args.metrics is not None:
+        write_metrics(run_metrics, args.metrics,
+                      labels=dict(output=gen.output_file))
+    if args.profile is not None:
+        profiler.write(args.profile)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,247 @@
+#!/bin/env dls-python
+"""A CLI tool for generating many virtual datasets from a manifest file."""
+
+import sys
+import csv
+import json
+import logging
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from multiprocessing import Pool, cpu_count
+
+from vdsgenerator import VDSGenerator
+from geometry import load_geometry
+
+help_message = """
+-------------------------------------------------------------------------------
+A script to create many virtual datasets in one process pool.
+
+The manifest is either a JSON list of jobs, JSON lines with one job per line,
+or a CSV file (.csv) with a header row. Each job takes the same arguments as
+VDSGenerator, plus 'append' to append to an existing VDS and 'shape' and
+'data_type' to create an empty VDS. Source metadata is read serially within
+each job, so 'workers' is not supported. 'geometry' is either a geometry
+description or the path of a JSON file containing one. 'extra_nodes' is a
+list of source_node, target_node and, optionally, layout dicts, or in CSV
+source:target[:layout] items. For example, as JSON lines:
+
+ {"path": "/scratch/scan_1", "prefix": "stripe_"}
+ {"path": "/scratch/scan_2", "files": ["a_1.h5", "a_2.h5"], "output": "a.h5"}
+
+or as CSV, where lists are space separated:
+
+ path,prefix,files,stripe_spacing
+ /scratch/scan_1,stripe_,,3
+ /scratch/scan_2,,a_1.h5 a_2.h5,
+-------------------------------------------------------------------------------
+"""
+
+# Arguments of VDSGenerator that can be given for each job
+GENERATOR_ARGS = ["path", "prefix", "files", "output", "source",
+                  "source_node", "target_node", "stripe_spacing",
+                  "module_spacing", "layout", "geometry", "compact",
+                  "compact_node", "extra_nodes", "live", "frame_policy",
+                  "printf_maps", "append", "cache_file", "cache_size",
+                  "log_level"]
+INT_ARGS = ["stripe_spacing", "module_spacing", "cache_size", "log_level"]
+# Additional arguments of each job
+JOB_ARGS = GENERATOR_ARGS + ["shape", "data_type"]
+
+logger = logging.getLogger("VDSBatch")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+def read_manifest(manifest_file):
+    """Read the jobs from a JSON, JSON lines or CSV manifest file.
+
+    Args:
+        manifest_file(str): Path to manifest file
+
+    Returns:
+        list(dict): Arguments of each job
+
+    """
+    with open(manifest_file, "r") as manifest:
+        if manifest_file.endswith(".csv"):
+            return [parse_csv_row(row) for row in csv.DictReader(manifest)]
+
+        content = manifest.read()
+
+    try:
+        jobs = json.loads(content)
+    except ValueError:
+        jobs = [json.loads(line) for line in content.splitlines()
+                if line.strip()]
+
+    if isinstance(jobs, dict):
+        jobs = [jobs]
+    return jobs
+
+
+def parse_csv_row(row):
+    """Convert the string values of a CSV manifest row into job arguments.
+
+    Empty cells are left out, so that VDSGenerator defaults are used.
+
+    Args:
+        row(dict): Column name and string value of each cell
+
+    Returns:
+        dict: Arguments of job
+
+    """
+    job = dict()
+    for name, value in row.items():
+        if value is None or value.strip() == "":
+            continue
+        value = value.strip()
+
+        if name in INT_ARGS:
+            value = int(value)
+        elif name == "files":
+            value = value.split()
+        elif name == "shape":
+            value = [int(dim) for dim in value.split()]
+        elif name == "extra_nodes":
+            value = [dict(zip(["source_node", "target_node", "layout"],
+                              item.split(":")))
+                     for item in value.split()]
+        elif name in ["append", "compact", "live", "printf_maps"]:
+            value = value.lower() in ["1", "true", "yes"]
+        job[name] = value
+
+    return job
+
+
+def validate_job(job):
+    """Check that the job has valid arguments.
+
+    Args:
+        job(dict): Arguments of job
+
+    Raises:
+        ValueError: If the job arguments are invalid
+
+    """
+    unknown = sorted(set(job.keys()) - set(JOB_ARGS))
+    if unknown:
+        raise ValueError("Unknown arguments {}".format(", ".join(unknown)))
+    if "path" not in job:
+        raise ValueError("Path is required")
+    if ("prefix" in job) == ("files" in job):
+        raise ValueError("One, and only one, of prefix or files required.")
+
+
+def run_job(job):
+    """Generate the VDS for a single job.
+
+    Any error is caught and returned, so that one failed job does not stop
+    the others.
+
+    Args:
+        job(dict): Arguments of job
+
+    Returns:
+        tuple(bool, str): Success and output file or error message
+
+    """
+    kwargs = dict((name, value) for name, value in job.items()
+                  if name in GENERATOR_ARGS)
+    if "shape" in job:
+        kwargs["source"] = dict(shape=tuple(job["shape"]),
+                                dtype=job.get("data_type", "uint16"))
+
+    try:
+        if isinstance(kwargs.get("geometry"), basestring):
+            kwargs["geometry"] = load_geometry(kwargs["geometry"])
+        gen = VDSGenerator(**kwargs)
+        if job.get("append", False):
+            gen.append_vds()
+        else:
+            gen.generate_vds()
+    except Exception as error:
+        return False, "{}: {}".format(type(error).__name__, error)
+
+    return True, gen.output_file
+
+
+def run_batch(jobs, processes=None):
+    """Run each job in a process pool.
+
+    Args:
+        jobs(list(dict)): Arguments of each job
+        processes(int): Number of processes - Default is number of CPUs
+
+    Returns:
+        list(tuple(bool, str)): Success and output file or error of each job
+
+    """
+    if processes is None:
+        processes = cpu_count()
+    processes = max(1, min(processes, len(jobs)))
+
+    logger.info("Running %s jobs with %s processes", len(jobs), processes)
+    results = []
+    pool = Pool(processes)
+    try:
+        for idx, result in enumerate(pool.imap(run_job, jobs)):
+            success, message = result
+            if success:
+                logger.info("Job %s succeeded: %s", idx, message)
+            else:
+                logger.error("Job %s (%s) failed: %s",
+                             idx, jobs[idx]["path"], message)
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(usage=help_message,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "manifest", type=str, help="JSON, JSON lines or CSV manifest file.")
+    parser.add_argument(
+        "-j", "--processes", type=int, default=None, dest="processes",
+        help="Number of jobs to run in parallel. If None then the number of "
+             "CPUs.")
+    parser.add_argument(
+        "--validate", action="store_true", dest="validate",
+        help="Only validate the manifest, don't generate anything.")
+
+    return parser.parse_args()
+
+
+def main():
+    """Run program."""
+    args = parse_args()
+
+    jobs = read_manifest(args.manifest)
+    errors = []
+    for idx, job in enumerate(jobs):
+        try:
+            validate_job(job)
+        except ValueError as error:
+            errors.append("Job {}: {}".format(idx, error))
+    if errors:
+        logger.error("Invalid manifest %s:\n%s",
+                     args.manifest, "\n".join(errors))
+        return 1
+    if args.validate:
+        logger.info("Manifest %s is valid with %s jobs",
+                    args.manifest, len(jobs))
+        return 0
+
+    results = run_batch(jobs, args.processes)
+    failed = len([success for success, _ in results if not success])
+    logger.info("%s jobs succeeded, %s failed", len(results) - failed, failed)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""Generate virtual datasets in threads, without blocking the caller.
+
+Control software with an event loop submits a generation to a VDSExecutor and
+carries on. The returned VDSJob can be waited on, cancelled, time out or call
+back when it is done - e.g. to hand the finished job back to an asyncio loop:
+
+    job = executor.submit("/scratch/images", prefix="stripe_", timeout=30)
+    job.add_done_callback(
+        lambda job_: loop.call_soon_threadsafe(on_vds_done, job_))
+
+"""
+
+import time
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+from vdsgenerator import VDSGenerator
+from hooks import Hook
+
+
+class GenerationCancelled(Exception):
+
+    """The generation was cancelled before it finished."""
+
+    pass
+
+
+class GenerationTimeout(GenerationCancelled):
+
+    """The generation was cancelled because it took longer than its timeout."""
+
+    pass
+
+
+class VDSJob(Hook):
+
+    """A VDS generation submitted to a VDSExecutor.
+
+    The job is a hook of its VDSGenerator, so a cancel or timeout takes effect
+    at the start of the next event - before each phase and each map. Once the
+    VDS file is being written, the generation runs to completion, so no
+    partial file is left.
+
+    """
+
+    logger = logging.getLogger("VDSJob")
+
+    def __init__(self, timeout=None):
+        """
+        Args:
+            timeout(float): Seconds from submission to cancel the generation
+                after, if it has not reached the write of the VDS
+
+        """
+        self.deadline = time.time() + timeout if timeout is not None \
+            else None
+        self.result = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def before(self, event, **details):
+        self.check(event)
+
+    def check(self, event):
+        """Raise if the job has been cancelled or has passed its deadline.
+
+        Args:
+            event(str): Name of event about to start
+
+        """
+        if self._cancel.is_set():
+            raise GenerationCancelled("Cancelled before {}".format(event))
+        if self.deadline is not None and time.time() > self.deadline:
+            raise GenerationTimeout("Timed out before {}".format(event))
+
+    def run(self, path, append, generator_args):
+        """Generate the VDS and then call the done callbacks.
+
+        Args:
+            path(str): Root folder to find raw files and create VDS
+            append(bool): Append to an existing frames VDS
+            generator_args(dict): Other arguments of VDSGenerator
+
+        """
+        generator_args = dict(generator_args)
+        # First, so that no other hook is left waiting for its after call
+        hooks = [self] + list(generator_args.pop("hooks", None) or [])
+        try:
+            self.check("start")
+            gen = VDSGenerator(path, hooks=hooks, append=append,
+                               **generator_args)
+            self.result = gen.append_vds() if append else gen.generate_vds()
+        except Exception as error:
+            self.error = error
+
+        with self._lock:
+            self._done.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            self.call(callback)
+
+    def call(self, callback):
+        """Call a done callback, logging rather than raising any error."""
+        try:
+            callback(self)
+        except Exception:
+            self.logger.exception("Error in done callback of VDS job")
+
+    def add_done_callback(self, callback):
+        """Call a function with the job when it is done.
+
+        The callback is called in the thread that ran the job, or straight
+        away if the job is already done.
+
+        Args:
+            callback(function): Function taking the job
+
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        self.call(callback)
+
+    def cancel(self):
+        """Cancel the job at the start of its next event."""
+        self._cancel.set()
+
+    def cancelled(self):
+        """Check if the job stopped because it was cancelled or timed out."""
+        return isinstance(self.error, GenerationCancelled)
+
+    def done(self):
+        """Check if the job has finished, successfully or not."""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for the job to finish.
+
+        Args:
+            timeout(float): Seconds to wait - Default is forever
+
+        Returns:
+            bool: Whether the job is done
+
+        """
+        return self._done.wait(timeout)
+
+    def get(self, timeout=None):
+        """Wait for the job to finish and return its metrics.
+
+        Args:
+            timeout(float): Seconds to wait - Default is forever
+
+        Returns:
+            dict: Seconds taken by each phase and counters of work done
+
+        Raises:
+            GenerationTimeout: If the job is not done within timeout
+            GenerationCancelled: If the job was cancelled or timed out
+            Exception: Any other error raised by the generation
+
+        """
+        if not self.wait(timeout):
+            raise GenerationTimeout("VDS job not done after {} "
+                                    "seconds".format(timeout))
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class VDSExecutor(object):
+
+    """A pool of threads to run VDS generations concurrently.
+
+    Threads spend much of a generation waiting on the file system, but h5py
+    only runs one call at a time, so HDF5 work of concurrent jobs is not in
+    parallel. Use workers to read source metadata in processes, or
+    vdsgen.batch for throughput rather than responsiveness.
+
+    """
+
+    # Default Values
+    threads = 4  # Number of generations to run at once
+
+    logger = logging.getLogger("VDSExecutor")
+
+    def __init__(self, threads=None):
+        """
+        Args:
+            threads(int): Number of generations to run at once
+
+        """
+        if threads is not None:
+            self.threads = threads
+        self.pool = ThreadPool(self.threads)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.shutdown()
+
+    def submit(self, path, timeout=None, append=False, **generator_args):
+        """Start generating a VDS in a thread of the pool.
+
+        Args:
+            path(str): Root folder to find raw files and create VDS
+            timeout(float): Seconds from submission to cancel the generation
+                after, if it has not reached the write of the VDS
+            append(bool): Append to an existing frames VDS
+            generator_args: Other arguments of VDSGenerator
+
+        Returns:
+            VDSJob: Job to wait for, cancel or add done callbacks to
+
+        """
+        job = VDSJob(timeout)
+        self.pool.apply_async(job.run, (path, append, generator_args))
+        self.logger.debug("Submitted VDS job for %s", path)
+        return job
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs.
+
+        Args:
+            wait(bool): Wait for submitted jobs to finish
+
+        """
+        self.pool.close()
+        if wait:
+            self.pool.join()
@@ -0,0 +1,171 @@
+"""Placement of source datasets as tiles of a 2D module grid."""
+
+import json
+
+
+def load_geometry(geometry_file):
+    """Load a geometry description from a JSON file.
+
+    Args:
+        geometry_file(str): Path to JSON file
+
+    Returns:
+        dict: Geometry description
+
+    """
+    with open(geometry_file, "r") as geometry:
+        return json.load(geometry)
+
+
+def axis_positions(count, size, gap):
+    """Calculate the start of each tile along one axis.
+
+    Args:
+        count(int): Number of tiles along the axis
+        size(int): Size of each tile along the axis
+        gap(int or list(int)): Gap between each pair of tiles - Either one
+            value for all gaps or a list of count - 1 values
+
+    Returns:
+        list(int): Start of each tile
+
+    """
+    if isinstance(gap, int):
+        gap = [gap] * (count - 1)
+    elif len(gap) != count - 1:
+        raise ValueError("Expected {expected} gaps between {count} tiles, "
+                         "got {gaps}".format(expected=count - 1, count=count,
+                                             gaps=len(gap)))
+
+    positions = [0]
+    for gap_ in gap:
+        positions.append(positions[-1] + size + gap_)
+    return positions
+
+
+def grid_offsets(rows, columns, height, width, row_gap=0, column_gap=0):
+    """Calculate the offset of each tile of a regular grid.
+
+    Tiles are ordered along each row first - source N is in row N // columns
+    and column N % columns.
+
+    Args:
+        rows(int): Number of rows of tiles
+        columns(int): Number of columns of tiles
+        height(int): Height of each tile
+        width(int): Width of each tile
+        row_gap(int or list(int)): Gap between rows
+        column_gap(int or list(int)): Gap between columns
+
+    Returns:
+        list(tuple(int, int)): Row and column offset of each tile
+
+    """
+    row_positions = axis_positions(rows, height, row_gap)
+    column_positions = axis_positions(columns, width, column_gap)
+    return [(row, column)
+            for row in row_positions for column in column_positions]
+
+
+def parse_geometry(geometry, sources, height, width):
+    """Calculate the offset of each source from a geometry description.
+
+    The description either gives explicit offsets, e.g.
+
+        {"offsets": [[0, 0], [0, 1034], [522, 0], [522, 1034]]}
+
+    or a regular grid, with optional gaps that are either one value or a
+    value between each pair of rows or columns, e.g.
+
+        {"rows": 2, "columns": 2, "row_gap": 10, "column_gap": 10}
+
+    Args:
+        geometry(dict): Geometry description
+        sources(int): Number of source datasets
+        height(int): Height of each source
+        width(int): Width of each source
+
+    Returns:
+        list(tuple(int, int)): Row and column offset of each source
+
+    """
+    if "offsets" in geometry:
+        offsets = [tuple(offset) for offset in geometry["offsets"]]
+    elif "rows" in geometry and "columns" in geometry:
+        offsets = grid_offsets(geometry["rows"], geometry["columns"],
+                               height, width,
+                               geometry.get("row_gap", 0),
+                               geometry.get("column_gap", 0))
+    else:
+        raise ValueError("Geometry must define offsets or rows and columns")
+
+    if len(offsets) != sources:
+        raise ValueError("Geometry has {tiles} tiles for {sources} "
+                         "sources".format(tiles=len(offsets), sources=sources))
+    if any(row < 0 or column < 0 for row, column in offsets):
+        raise ValueError("Geometry offsets must not be negative")
+    check_overlaps(offsets, height, width)
+
+    return offsets
+
+
+def check_overlaps(offsets, height, width):
+    """Check that no two tiles overlap.
+
+    Args:
+        offsets(list(tuple(int, int))): Row and column offset of each tile
+        height(int): Height of each tile
+        width(int): Width of each tile
+
+    Raises:
+        ValueError: If any two tiles overlap
+
+    """
+    ordered = sorted(offsets)
+    for idx, (row, column) in enumerate(ordered):
+        # Only tiles starting before the end of this one can overlap it
+        for other_row, other_column in ordered[idx + 1:]:
+            if other_row >= row + height:
+                break
+            if abs(other_column - column) < width:
+                raise ValueError(
+                    "Tiles at {} and {} overlap".format(
+                        (row, column), (other_row, other_column)))
+
+
+def compact_offsets(offsets, height, width):
+    """Remove the gaps between rows and columns of tiles.
+
+    Each distinct row and column offset is moved next to the previous one,
+    keeping the order of the tiles along each axis.
+
+    Args:
+        offsets(list(tuple(int, int))): Row and column offset of each tile
+        height(int): Height of each tile
+        width(int): Width of each tile
+
+    Returns:
+        list(tuple(int, int)): Row and column offset of each tile
+
+    """
+    rows = dict((row, idx * height) for idx, row
+                in enumerate(sorted(set(row for row, _ in offsets))))
+    columns = dict((column, idx * width) for idx, column
+                   in enumerate(sorted(set(column for _, column in offsets))))
+    return [(rows[row], columns[column]) for row, column in offsets]
+
+
+def geometry_shape(offsets, height, width):
+    """Calculate the height and width needed to fit every tile.
+
+    Args:
+        offsets(list(tuple(int, int))): Row and column offset of each tile
+        height(int): Height of each tile
+        width(int): Width of each tile
+
+    Returns:
+        tuple(int, int): Height and width
+
+    """
+    return (max(row for row, _ in offsets) + height,
+            max(column for _, column in offsets) + width)
@@ -0,0 +1,164 @@
+"""Callbacks before and after the phases of VDS generation."""
+
+import os
+import signal
+import logging
+from collections import Counter
+
+# Events of VDSGenerator - Details passed to the hooks of each event are:
+FIND_FILES = "find_files"  # path, prefix
+READ_METADATA = "read_metadata"  # files - All files, in serial or parallel
+GRAB_METADATA = "grab_metadata"  # file_path - Each file, if read in serial
+PLAN = "plan"  # output_file
+CREATE_MAP = "create_map"  # file_path, target_index - Each map of a plan
+WRITE = "write"  # output_file
+
+EVENTS = [FIND_FILES, READ_METADATA, GRAB_METADATA, PLAN, CREATE_MAP, WRITE]
+
+
+class Hook(object):
+
+    """Base class of callbacks before and after the events of VDSGenerator.
+
+    Subclasses override before and/or after. Events are nested, e.g. the
+    grab_metadata events of each file are within the read_metadata event, so
+    a hook can tell the outermost events apart by counting.
+
+    """
+
+    def before(self, event, **details):
+        """Called before an event.
+
+        Args:
+            event(str): Name of event
+            details: Details of event - see EVENTS
+
+        """
+        pass
+
+    def after(self, event, **details):
+        """Called after an event, even if it raised an exception.
+
+        Args:
+            event(str): Name of event
+            details: Details of event - see EVENTS
+
+        """
+        pass
+
+
+class ProfileHook(Hook):
+
+    """Profile the events of VDS generation with cProfile.
+
+    The profiler runs from the start to the end of each outermost event, so
+    the work of the generator is profiled without the code around it.
+
+    """
+
+    logger = logging.getLogger("ProfileHook")
+
+    def __init__(self):
+        import cProfile
+
+        self.profile = cProfile.Profile()
+        self.depth = 0
+
+    def before(self, event, **details):
+        self.depth += 1
+        if self.depth == 1:
+            self.profile.enable()
+
+    def after(self, event, **details):
+        self.depth -= 1
+        if self.depth == 0:
+            self.profile.disable()
+
+    def write(self, output_file):
+        """Write the profile in pstats format, e.g. for snakeviz.
+
+        Args:
+            output_file(str): Path to file
+
+        """
+        self.profile.dump_stats(output_file)
+        self.logger.info("Wrote profile to %s", output_file)
+
+
+class SampleHook(Hook):
+
+    """Sample the stack during the events of VDS generation.
+
+    The stack of the main thread is sampled every interval seconds of CPU
+    time, with SIGPROF, from the start to the end of each outermost event.
+    Work done in reader processes is not sampled.
+
+    """
+
+    # Default Values
+    interval = 0.001  # Seconds of CPU time between samples
+
+    logger = logging.getLogger("SampleHook")
+
+    def __init__(self, interval=None):
+        """
+        Args:
+            interval(float): Seconds of CPU time between samples
+
+        """
+        if interval is not None:
+            self.interval = interval
+        self.samples = Counter()
+        self.depth = 0
+        self._handler = None
+
+    def sample(self, _, frame):
+        """Record the stack of frame - the SIGPROF handler."""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("{}:{}".format(os.path.basename(code.co_filename),
+                                        code.co_name))
+            frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+
+    def before(self, event, **details):
+        self.depth += 1
+        if self.depth == 1:
+            self._handler = signal.signal(signal.SIGPROF, self.sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def after(self, event, **details):
+        self.depth -= 1
+        if self.depth == 0:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self._handler)
+
+    def write(self, output_file):
+        """Write the samples as folded stacks, e.g. for flamegraph.pl.
+
+        Args:
+            output_file(str): Path to file
+
+        """
+        with open(output_file, "w") as output:
+            for stack, count in sorted(self.samples.items()):
+                output.write("{} {}\n".format(stack, count))
+        self.logger.info("Wrote %s samples to %s",
+                         sum(self.samples.values()), output_file)
+
+
+def profile_hook(output_file):
+    """Create the hook to profile generation into a file.
+
+    Args:
+        output_file(str): Path to file - Sampled stacks if it ends .folded,
+            else a cProfile profile
+
+    Returns:
+        Hook: Profiling hook with a write method
+
+    """
+    if output_file.endswith(".folded"):
+        return SampleHook()
+    return ProfileHook()
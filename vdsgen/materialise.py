@@ -0,0 +1,297 @@
+#!/bin/env dls-python
+"""A CLI tool to copy the data of a virtual dataset into a real dataset."""
+
+import os
+import sys
+import time
+import logging
+import operator
+from collections import deque
+from multiprocessing import Pool
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from vdsgenerator import VDSGenerator
+
+help_message = """
+-------------------------------------------------------------------------------
+A script to materialise a virtual dataset into a self-contained file, e.g. for
+archiving or transfer.
+
+Blocks of frames are read through the VDS by a pool of reader processes and
+written, in order, to a chunked and optionally compressed dataset. Only a
+bounded number of blocks are held in memory at once, so datasets much larger
+than memory can be copied. For example:
+
+ > ../vdsgen/materialise.py /scratch/images/stripe_vds.h5 stripe.h5
+ > ../vdsgen/materialise.py /scratch/images/stripe_vds.h5 stripe.h5 \\
+       --compression gzip --compression_opts 4 --shuffle -w 8 -m 2048
+-------------------------------------------------------------------------------
+"""
+
+COMPRESSIONS = ["gzip", "lzf"]
+# Attributes written by VDSGenerator that only apply to reads of the sources
+SOURCE_ATTRIBUTES = ["rdcc_nbytes", "rdcc_nslots"]
+
+logger = logging.getLogger("VDSMaterialise")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+# The virtual dataset, opened once by each reader process of the pool
+_dataset = None
+
+
+def _open_dataset(vds_file, node):
+    """Open the virtual dataset - for use as a Pool initializer."""
+    import h5py as h5
+
+    global _dataset
+    _dataset = h5.File(vds_file, "r")[node]
+
+
+def _read_block(block):
+    """Read a block of frames of the dataset opened by _open_dataset."""
+    start, stop = block
+    return _dataset[start:stop]
+
+
+def default_chunks(shape, itemsize):
+    """Get the chunks of the materialised dataset if none are given.
+
+    Args:
+        shape(tuple(int)): Shape of dataset
+        itemsize(int): Bytes per element of dataset
+
+    Returns:
+        tuple(int): One frame per chunk or, for 1D datasets, up to 1MB
+
+    """
+    if len(shape) > 1:
+        return (1,) + tuple(shape[1:])
+    return (max(1, min(shape[0], 1024 ** 2 // itemsize)),)
+
+
+def block_frames(shape, itemsize, chunks, memory, workers):
+    """Get the number of frames to read and write in each block.
+
+    Each block is a whole number of chunks, so every chunk is written and
+    compressed once, and as large as possible while all of the blocks queued
+    for and returned by the readers fit in the memory limit.
+
+    Args:
+        shape(tuple(int)): Shape of dataset
+        itemsize(int): Bytes per element of dataset
+        chunks(tuple(int)): Chunks of materialised dataset
+        memory(int): Memory limit for blocks in MB
+        workers(int): Number of reader processes
+
+    Returns:
+        int: Frames per block
+
+    """
+    frame_bytes = reduce(operator.mul, shape[1:], 1) * itemsize
+    # Two blocks per reader in flight, plus the block being written
+    blocks_in_memory = 2 * workers + 1 if workers > 1 else 1
+    frames = memory * 1024 ** 2 // (blocks_in_memory * frame_bytes)
+
+    chunk_frames = chunks[0]
+    if frames < chunk_frames:
+        logger.warning("Memory limit %sMB is less than %s blocks of one "
+                       "chunk - using one chunk per block",
+                       memory, blocks_in_memory)
+        return chunk_frames
+    return min(frames // chunk_frames * chunk_frames, shape[0])
+
+
+def frame_blocks(frames, block_size):
+    """Split the frame axis into blocks.
+
+    Args:
+        frames(int): Length of frame axis
+        block_size(int): Frames per block
+
+    Returns:
+        list(tuple(int, int)): Start and stop frame of each block
+
+    """
+    return [(start, min(start + block_size, frames))
+            for start in range(0, frames, block_size)]
+
+
+def read_blocks(vds_file, node, blocks, workers):
+    """Read blocks of frames of a virtual dataset, in order.
+
+    With more than one worker, the blocks are read in a process pool with at
+    most two blocks per worker queued or waiting to be taken.
+
+    Args:
+        vds_file(str): Path to VDS file
+        node(str): Data node in VDS file
+        blocks(list(tuple(int, int))): Start and stop frame of each block
+        workers(int): Number of reader processes
+
+    Returns:
+        generator(tuple(tuple(int, int), numpy.ndarray)): Each block and its
+            data
+
+    """
+    import h5py as h5
+
+    if workers <= 1:
+        with h5.File(vds_file, "r") as vds:
+            dataset = vds[node]
+            for start, stop in blocks:
+                yield (start, stop), dataset[start:stop]
+        return
+
+    pool = Pool(workers, _open_dataset, (vds_file, node))
+    try:
+        pending = deque()
+        for block in blocks:
+            pending.append((block, pool.apply_async(_read_block, (block,))))
+            if len(pending) >= 2 * workers:
+                block_, result = pending.popleft()
+                yield block_, result.get()
+        while pending:
+            block_, result = pending.popleft()
+            yield block_, result.get()
+    finally:
+        pool.close()
+        pool.join()
+
+
+def materialise_vds(vds_file, output_file, node=None, output_node=None,
+                    chunks=None, compression=None, compression_opts=None,
+                    shuffle=False, workers=1, memory=1024):
+    """Copy the data of a virtual dataset into a chunked dataset.
+
+    Args:
+        vds_file(str): Path to VDS file
+        output_file(str): Path to file to create dataset in - It is appended
+            to if it exists
+        node(str): Data node in VDS file - Default is the VDSGenerator target
+            node
+        output_node(str): Data node in output file - Default is node
+        chunks(tuple(int)): Chunks of dataset - Default is one frame per
+            chunk
+        compression(str): Compression filter - gzip or lzf
+        compression_opts(int): Compression level of gzip
+        shuffle(bool): Apply the shuffle filter before compression
+        workers(int): Number of reader processes
+        memory(int): Memory limit for blocks of frames in MB
+
+    Returns:
+        dict: Frames, blocks, bytes and seconds taken to copy the data
+
+    """
+    import h5py as h5
+    import numpy as np
+
+    if node is None:
+        node = VDSGenerator.target_node
+    if output_node is None:
+        output_node = node
+    if os.path.abspath(vds_file) == os.path.abspath(output_file):
+        raise ValueError("Cannot materialise {} into itself".format(vds_file))
+
+    with h5.File(vds_file, "r") as vds:
+        dataset = vds.get(node)
+        if dataset is None:
+            raise IOError("VDS {file} has no node {node}".format(
+                file=vds_file, node=node))
+        shape = dataset.shape
+        dtype = dataset.dtype
+        fill_value = dataset.fillvalue
+        attributes = dict((name, value) for name, value
+                          in dataset.attrs.items()
+                          if name not in SOURCE_ATTRIBUTES)
+
+    if not shape or shape[0] == 0:
+        raise ValueError("Dataset {} has no frames to materialise".format(
+            node))
+    itemsize = np.dtype(dtype).itemsize
+    if chunks is None:
+        chunks = default_chunks(shape, itemsize)
+    chunks = tuple(chunks)
+    blocks = frame_blocks(shape[0], block_frames(shape, itemsize, chunks,
+                                                 memory, workers))
+    logger.info("Materialising %s %s of %s into %s %s with %s blocks of up "
+                "to %s frames", node, shape, vds_file, output_file,
+                output_node, len(blocks), blocks[0][1])
+
+    start_time = time.time()
+    mode = "a" if os.path.isfile(output_file) else "w"
+    with h5.File(output_file, mode, libver="latest") as output:
+        if output.get(output_node) is not None:
+            raise IOError("File {file} already has an entry for node "
+                          "{node}".format(file=output_file, node=output_node))
+        target = output.create_dataset(
+            output_node, shape=shape, dtype=dtype, chunks=chunks,
+            compression=compression, compression_opts=compression_opts,
+            shuffle=shuffle, fillvalue=fill_value)
+        target.attrs.update(attributes)
+
+        for (start, stop), data in read_blocks(vds_file, node, blocks,
+                                               workers):
+            target[start:stop] = data
+            logger.debug("Wrote frames %s to %s", start, stop)
+
+    seconds = time.time() - start_time
+    data_bytes = reduce(operator.mul, shape, 1) * itemsize
+    logger.info("Materialised %.1fMB in %.1fs (%.1fMB/s)",
+                data_bytes / 1024.0 ** 2, seconds,
+                data_bytes / 1024.0 ** 2 / max(seconds, 1e-9))
+    return dict(frames=shape[0], blocks=len(blocks), bytes=data_bytes,
+                seconds=seconds)
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(usage=help_message,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "vds_file", type=str, help="VDS file to materialise.")
+    parser.add_argument(
+        "output", type=str,
+        help="File to create dataset in. Appended to if it exists.")
+    parser.add_argument(
+        "-n", "--node", type=str, default=VDSGenerator.target_node,
+        dest="node", help="Data node in VDS file.")
+    parser.add_argument(
+        "--output_node", type=str, default=None, dest="output_node",
+        help="Data node in output file. If None then the same as --node.")
+    parser.add_argument(
+        "-c", "--chunks", type=int, nargs="*", default=None, dest="chunks",
+        help="Chunks of dataset. If None then one frame per chunk.")
+    parser.add_argument(
+        "--compression", type=str, default=None, dest="compression",
+        choices=COMPRESSIONS, help="Compression filter.")
+    parser.add_argument(
+        "--compression_opts", type=int, default=None,
+        dest="compression_opts", help="Compression level of gzip (0-9).")
+    parser.add_argument(
+        "--shuffle", action="store_true", dest="shuffle",
+        help="Apply the shuffle filter before compression.")
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1, dest="workers",
+        help="Number of processes to read blocks of frames with.")
+    parser.add_argument(
+        "-m", "--memory", type=int, default=1024, dest="memory",
+        help="Memory limit for blocks of frames in MB.")
+
+    return parser.parse_args()
+
+
+def main():
+    """Run program."""
+    args = parse_args()
+
+    materialise_vds(args.vds_file, args.output, node=args.node,
+                    output_node=args.output_node, chunks=args.chunks,
+                    compression=args.compression,
+                    compression_opts=args.compression_opts,
+                    shuffle=args.shuffle, workers=args.workers,
+                    memory=args.memory)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""A persistent cache of source dataset metadata."""
+
+import os
+import json
+import logging
+
+from collections import OrderedDict
+
+
+class MetadataCache(object):
+
+    """An on-disk cache of the metadata read from source HDF5 files.
+
+    Entries are keyed by file path and data node and are only valid while the
+    size and modification time of the file are unchanged. The cache holds at
+    most `max_entries` entries, evicting the least recently used first.
+
+    """
+
+    FIELDS = ["path", "node", "size", "mtime", "frames", "height", "width",
+              "dtype"]  # Fields every entry must have
+
+    # Default Values
+    max_entries = 10000  # Maximum number of entries to store
+
+    logger = logging.getLogger("MetadataCache")
+
+    def __init__(self, cache_file, max_entries=None):
+        """
+        Args:
+            cache_file(str): Path to JSON file to store cache in
+            max_entries(int): Maximum number of entries to store
+
+        """
+        self.cache_file = cache_file
+        if max_entries is not None:
+            self.max_entries = max_entries
+
+        self.entries = self.load()
+
+    def load(self):
+        """Load cache entries from cache file, if it exists and is valid.
+
+        A file that isn't a JSON list of valid entries is ignored, so every
+        lookup misses and the cache is rebuilt when it is saved.
+
+        Returns:
+            OrderedDict: Cache entries, least recently used first
+
+        """
+        entries = OrderedDict()
+        if not os.path.isfile(self.cache_file):
+            return entries
+
+        try:
+            with open(self.cache_file, "r") as cache:
+                stored = json.load(cache)
+            if not isinstance(stored, list):
+                raise ValueError("Cache is not a list")
+            for entry in stored:
+                if not isinstance(entry, dict) or \
+                        not all(field in entry for field in self.FIELDS):
+                    raise ValueError("Invalid entry {}".format(entry))
+                entries[(entry["path"], entry["node"])] = entry
+        except (ValueError, TypeError):
+            self.logger.warning("Ignoring invalid metadata cache %s",
+                                self.cache_file)
+            return OrderedDict()
+
+        self.logger.debug("Loaded %s entries from %s",
+                          len(entries), self.cache_file)
+        return entries
+
+    def save(self):
+        """Write the cache entries to the cache file.
+
+        The file is written to a temporary file first and renamed, so that
+        concurrent readers never see a partially written cache.
+
+        """
+        temp_file = "{}.{}.tmp".format(self.cache_file, os.getpid())
+        with open(temp_file, "w") as cache:
+            json.dump(list(self.entries.values()), cache)
+        os.rename(temp_file, self.cache_file)
+
+    @staticmethod
+    def identify(file_path):
+        """Get the size and modification time of the given file.
+
+        Args:
+            file_path(str): Path to file
+
+        Returns:
+            tuple: Size and modification time of file
+
+        """
+        stat = os.stat(file_path)
+        return stat.st_size, stat.st_mtime
+
+    def get(self, file_path, source_node):
+        """Get the cached metadata of a dataset, if it is still valid.
+
+        Args:
+            file_path(str): Path to HDF5 file
+            source_node(str): Data node in HDF5 file
+
+        Returns:
+            dict: Number of frames, height, width, data type and chunks of
+                dataset, or None if there is no valid entry
+
+        """
+        import numpy as np
+
+        key = (os.path.abspath(file_path), source_node)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        size, mtime = self.identify(file_path)
+        if entry["size"] != size or entry["mtime"] != mtime:
+            self.logger.debug("Cache entry for %s is stale", file_path)
+            del self.entries[key]
+            return None
+
+        # Move to the end to mark as most recently used
+        self.entries[key] = self.entries.pop(key)
+        chunks = entry.get("chunks")
+        return dict(frames=tuple(entry["frames"]), height=entry["height"],
+                    width=entry["width"], dtype=np.dtype(entry["dtype"]),
+                    chunks=tuple(chunks) if chunks is not None else None)
+
+    def put(self, file_path, source_node, metadata):
+        """Store the metadata of a dataset, evicting old entries if full.
+
+        Args:
+            file_path(str): Path to HDF5 file
+            source_node(str): Data node in HDF5 file
+            metadata(dict): Number of frames, height, width, data type and
+                chunks of dataset
+
+        """
+        import numpy as np
+
+        key = (os.path.abspath(file_path), source_node)
+        size, mtime = self.identify(file_path)
+
+        self.entries.pop(key, None)
+        self.entries[key] = dict(
+            path=key[0], node=source_node, size=size, mtime=mtime,
+            frames=list(metadata["frames"]), height=metadata["height"],
+            width=metadata["width"], dtype=np.dtype(metadata["dtype"]).str,
+            chunks=metadata.get("chunks"))
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
@@ -0,0 +1,140 @@
+"""Timings and counters of a VDS generation run."""
+
+import os
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+PROMETHEUS_PREFIX = "vdsgen"
+
+
+class Metrics(object):
+
+    """The time taken by each phase of a run and counters of work done."""
+
+    def __init__(self):
+        self.timings = OrderedDict()
+        self.counters = OrderedDict()
+
+    @contextmanager
+    def timer(self, phase):
+        """Add the time taken by the body of the with statement to a phase.
+
+        Args:
+            phase(str): Name of phase
+
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[phase] = \
+                self.timings.get(phase, 0.0) + time.time() - start
+
+    def count(self, name, value=1):
+        """Add to a counter.
+
+        Args:
+            name(str): Name of counter
+            value(int): Amount to add
+
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        """Convert the metrics into JSON serialisable data.
+
+        Returns:
+            dict: Seconds taken by each phase and value of each counter
+
+        """
+        return dict(timings=OrderedDict(self.timings),
+                    counters=OrderedDict(self.counters))
+
+
+def write_json(metrics, output_file):
+    """Write metrics to a JSON file.
+
+    Args:
+        metrics(dict): Output of Metrics.to_dict
+        output_file(str): Path to JSON file
+
+    """
+    with open(output_file, "w") as output:
+        json.dump(metrics, output, indent=1)
+
+
+def format_prometheus(metrics, labels=None):
+    """Format metrics in the Prometheus text exposition format.
+
+    Args:
+        metrics(dict): Output of Metrics.to_dict
+        labels(dict): Labels to add to every sample, e.g. the output file
+
+    Returns:
+        str: Text of metrics
+
+    """
+    labels = labels if labels is not None else dict()
+
+    def sample(name, value, extra_labels=None):
+        sample_labels = OrderedDict(sorted(labels.items()))
+        sample_labels.update(extra_labels or dict())
+        label_text = ",".join(
+            '{}="{}"'.format(label, str(label_value).replace("\\", "\\\\")
+                             .replace('"', '\\"'))
+            for label, label_value in sample_labels.items())
+        if label_text:
+            label_text = "{" + label_text + "}"
+        return "{}{} {}".format(name, label_text, value)
+
+    lines = []
+    name = PROMETHEUS_PREFIX + "_phase_seconds"
+    lines.append("# HELP {} Time taken by each phase of VDS "
+                 "generation".format(name))
+    lines.append("# TYPE {} gauge".format(name))
+    for phase, seconds in metrics["timings"].items():
+        lines.append(sample(name, seconds, dict(phase=phase)))
+    for counter, value in metrics["counters"].items():
+        name = "{}_{}".format(PROMETHEUS_PREFIX, counter)
+        lines.append("# TYPE {} gauge".format(name))
+        lines.append(sample(name, value))
+    name = PROMETHEUS_PREFIX + "_last_run_timestamp_seconds"
+    lines.append("# TYPE {} gauge".format(name))
+    lines.append(sample(name, time.time()))
+
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(metrics, output_file, labels=None):
+    """Write metrics to a Prometheus node exporter textfile.
+
+    The file is written to a temporary file and renamed, so the exporter
+    never reads a partial file.
+
+    Args:
+        metrics(dict): Output of Metrics.to_dict
+        output_file(str): Path to textfile, e.g. vdsgen.prom
+        labels(dict): Labels to add to every sample, e.g. the output file
+
+    """
+    temp_file = "{}.{}.tmp".format(output_file, os.getpid())
+    with open(temp_file, "w") as output:
+        output.write(format_prometheus(metrics, labels))
+    os.rename(temp_file, output_file)
+
+
+def write_metrics(metrics, output_file, labels=None):
+    """Write metrics as Prometheus text if output_file ends .prom, else JSON.
+
+    Args:
+        metrics(dict): Output of Metrics.to_dict
+        output_file(str): Path to file
+        labels(dict): Labels to add to every Prometheus sample
+
+    """
+    if output_file.endswith(".prom"):
+        write_prometheus(metrics, output_file, labels)
+    else:
+        write_json(metrics, output_file)
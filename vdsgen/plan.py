@@ -0,0 +1,588 @@
+"""A description of the maps of a virtual dataset, independent of HDF5."""
+
+import os
+import re
+import json
+import logging
+
+from collections import namedtuple
+
+# h5py is only imported to materialise a plan, so plans can be created,
+# stored and compared without it
+
+Mapping = namedtuple("Mapping", ["file", "node", "source_shape",
+                                 "target_index", "source_index"])
+Mapping.__new__.__defaults__ = (None,)  # Source index is None for all data
+
+
+def encode_index(index):
+    """Convert a tuple of slices into a JSON serialisable list.
+
+    Args:
+        index(tuple(slice)): Selection of dataset
+
+    Returns:
+        list(list): Start, stop and step of each slice
+
+    """
+    if index is None:
+        return None
+    return [[slice_.start, slice_.stop, slice_.step] for slice_ in index]
+
+
+def decode_index(index):
+    """Convert a list from encode_index back into a tuple of slices.
+
+    Args:
+        index(list(list)): Start, stop and step of each slice
+
+    Returns:
+        tuple(slice): Selection of dataset
+
+    """
+    if index is None:
+        return None
+    return tuple(slice(*slice_) for slice_ in index)
+
+
+def read_selection(space):
+    """Read the selection of a dataspace as a tuple of slices.
+
+    Regular hyperslabs of single element blocks, e.g. from interleave layout,
+    are read as slices with a step, anything else as its bounding box. An
+    unlimited selection, e.g. from live mode, is read with a stop of None
+    along its unlimited axis.
+
+    Args:
+        space(h5py.h5s.SpaceID): Dataspace with a selection
+
+    Returns:
+        tuple(slice): Selection
+
+    """
+    import h5py as h5
+
+    if space.get_select_type() == h5.h5s.SEL_HYPERSLABS and \
+            space.is_regular_hyperslab():
+        start, stride, count, block = space.get_regular_hyperslab()
+        if h5.h5s.UNLIMITED in count:
+            # Bounds of unlimited selections can't be read, so read the
+            # unlimited axis as a slice with no stop
+            return tuple(
+                slice(first, None, step if step > 1 else None)
+                if number == h5.h5s.UNLIMITED else slice(first, first + size)
+                for first, step, number, size
+                in zip(start, stride, count, block))
+
+    start, end = space.get_select_bounds()
+    index = [slice(lower, upper + 1) for lower, upper in zip(start, end)]
+    if space.get_select_type() == h5.h5s.SEL_HYPERSLABS and \
+            space.is_regular_hyperslab():
+        _, stride, _, block = space.get_regular_hyperslab()
+        for axis, (step, size) in enumerate(zip(stride, block)):
+            if step > 1 and size == 1:
+                index[axis] = slice(start[axis], end[axis] + 1, step)
+    return tuple(index)
+
+
+def select_index(space, index, maxshape, block_size=1):
+    """Select a tuple of slices in a dataspace.
+
+    A slice with a stop of None along an unlimited axis of maxshape selects
+    blocks of block_size every step from its start, however far the dataset
+    grows.
+
+    Args:
+        space(h5py.h5s.SpaceID): Dataspace to select in
+        index(tuple(slice)): Selection
+        maxshape(tuple(int)): Maximum shape of dataspace, None if unlimited
+        block_size(int): Length of each block along an unlimited axis
+
+    """
+    import h5py as h5
+
+    start, count, stride, block = [], [], [], []
+    for slice_, dim, max_dim in zip(index, space.shape, maxshape):
+        if max_dim is None and slice_.stop is None:
+            first, step = slice_.start or 0, slice_.step or 1
+            start.append(first)
+            count.append(h5.h5s.UNLIMITED)
+            stride.append(step)
+            block.append(block_size)
+            continue
+
+        first, stop, step = slice_.indices(dim)
+        start.append(first)
+        if step == 1:
+            count.append(1)
+            stride.append(1)
+            block.append(stop - first)
+        else:
+            count.append(len(xrange(first, stop, step)))
+            stride.append(step)
+            block.append(1)
+
+    space.select_hyperslab(tuple(start), tuple(count), tuple(stride),
+                           block=tuple(block))
+
+
+def is_printf(file_path):
+    """Check if a source file name is a printf-style pattern.
+
+    The %b in a pattern is replaced by HDF5 with the number of each block of
+    an unlimited target selection, from 0, so one map covers a whole series
+    of source files, each mapped in full to one block.
+
+    Args:
+        file_path(str): Source file name
+
+    Returns:
+        bool: Whether the name contains %b
+
+    """
+    return "%b" in file_path.replace("%%", "")
+
+
+def format_printf(file_path, block):
+    """Get the source file name of a block of a printf-style map.
+
+    Args:
+        file_path(str): Source file name pattern
+        block(int): Number of block
+
+    Returns:
+        str: Source file name
+
+    """
+    return "%".join(part.replace("%b", str(block))
+                    for part in file_path.split("%%"))
+
+
+def encode(text):
+    """Encode text as bytes for the low level h5py API."""
+    if isinstance(text, unicode):
+        return text.encode("utf-8")
+    return text
+
+
+def native(value):
+    """Convert numpy values to python values, so they can be saved as JSON.
+
+    Args:
+        value: Value to convert
+
+    Returns:
+        Python value
+
+    """
+    return value.tolist() if hasattr(value, "tolist") else value
+
+
+def save_plans(plans, plan_file):
+    """Write plans to a JSON file.
+
+    Args:
+        plans(list(VDSPlan)): Plans to write
+        plan_file(str): Path to JSON file
+
+    """
+    with open(plan_file, "w") as plan:
+        json.dump([plan_.to_dict() for plan_ in plans], plan,
+                  indent=1, sort_keys=True)
+
+
+def load_plans(plan_file):
+    """Read plans from a JSON file written by save_plans.
+
+    Args:
+        plan_file(str): Path to JSON file
+
+    Returns:
+        list(VDSPlan): Plans
+
+    """
+    with open(plan_file, "r") as plan:
+        return [VDSPlan.from_dict(plan_) for plan_ in json.load(plan)]
+
+
+def read_plans(vds_file, nodes):
+    """Read plans of existing virtual datasets.
+
+    Args:
+        vds_file(str): Path to VDS file
+        nodes(list(str)): Virtual datasets in VDS file to read
+
+    Returns:
+        list(VDSPlan): Plan of each dataset
+
+    """
+    import h5py as h5
+
+    with h5.File(vds_file, "r", libver="latest") as vds:
+        plans = []
+        for node in nodes:
+            dataset = vds.get(node)
+            if dataset is None:
+                raise IOError("VDS {file} has no node {node}".format(
+                    file=vds_file, node=node))
+            plans.append(VDSPlan.from_dataset(dataset))
+    return plans
+
+
+def materialise_plans(plans):
+    """Create the virtual datasets described by the plans.
+
+    Each VDS file is created, or opened to append to if it already exists,
+    once for all of its plans.
+
+    Args:
+        plans(list(VDSPlan)): Plans to create datasets for
+
+    """
+    import h5py as h5
+
+    output_files = []
+    for plan in plans:
+        if plan.output_file not in output_files:
+            output_files.append(plan.output_file)
+
+    for output_file in output_files:
+        mode = "a" if os.path.isfile(output_file) else "w"
+        with h5.File(output_file, mode, libver="latest") as vds:
+            for plan in plans:
+                if plan.output_file != output_file:
+                    continue
+                if vds.get(plan.target_node) is not None:
+                    raise IOError("VDS {file} already has an entry for node "
+                                  "{node}".format(file=output_file,
+                                                  node=plan.target_node))
+                plan.materialise(vds)
+
+
+class VDSPlan(object):
+
+    """A plan of the maps from source datasets into one virtual dataset.
+
+    The plan is plain python data, so it can be saved, loaded and compared
+    without h5py. It is only turned into h5py VirtualMaps by materialise.
+
+    """
+
+    # Default Values
+    fill_value = 0x1  # Value of VDS where no source is mapped
+
+    logger = logging.getLogger("VDSPlan")
+
+    def __init__(self, output_file, target_node, shape, dtype, mappings=None,
+                 fill_value=None, attributes=None, maxshape=None):
+        """
+        Args:
+            output_file(str): Path to VDS file
+            target_node(str): Data node in VDS file
+            shape(tuple(int)): Shape of virtual dataset
+            dtype(str or numpy.dtype): Data type of virtual dataset
+            mappings(list(Mapping)): Source and target of each map
+            fill_value(int): Value of VDS where no source is mapped
+            attributes(dict): Attributes to set on virtual dataset
+            maxshape(tuple(int)): Maximum shape of virtual dataset, with None
+                for an unlimited axis - Default is shape. Along an unlimited
+                axis, a selection with a stop of None maps all of a source
+                as it grows.
+
+        """
+        self.output_file = output_file
+        self.target_node = target_node
+        self.shape = tuple(shape)
+        # Store the string form of numpy dtypes, e.g. '<u2'
+        self.dtype = getattr(dtype, "str", dtype)
+        self.mappings = list(mappings) if mappings is not None else []
+        if fill_value is not None:
+            self.fill_value = fill_value
+        self.attributes = dict(attributes) if attributes is not None \
+            else dict()
+        self.maxshape = tuple(maxshape) if maxshape is not None else None
+
+    def __eq__(self, other):
+        return isinstance(other, VDSPlan) and \
+            self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "VDSPlan({file}:{node}, shape={shape}, {maps} maps)".format(
+            file=self.output_file, node=self.target_node, shape=self.shape,
+            maps=len(self.mappings))
+
+    def add_mapping(self, file_path, node, source_shape, target_index,
+                    source_index=None):
+        """Add a map from a source dataset into the virtual dataset.
+
+        Args:
+            file_path(str): Path to source HDF5 file
+            node(str): Data node in source HDF5 file
+            source_shape(tuple(int)): Shape of source dataset
+            target_index(tuple(slice)): Selection of virtual dataset
+            source_index(tuple(slice)): Selection of source dataset - Default
+                is all of it
+
+        """
+        self.mappings.append(Mapping(
+            file=file_path, node=node, source_shape=tuple(source_shape),
+            target_index=tuple(target_index),
+            source_index=tuple(source_index)
+            if source_index is not None else None))
+
+    def to_dict(self):
+        """Convert the plan into JSON serialisable data.
+
+        Returns:
+            dict: Plan
+
+        """
+        return dict(
+            output_file=self.output_file, target_node=self.target_node,
+            shape=list(self.shape), dtype=self.dtype,
+            fill_value=self.fill_value, attributes=self.attributes,
+            maxshape=list(self.maxshape) if self.maxshape is not None
+            else None,
+            mappings=[dict(file=mapping.file, node=mapping.node,
+                           source_shape=list(mapping.source_shape),
+                           target_index=encode_index(mapping.target_index),
+                           source_index=encode_index(mapping.source_index))
+                      for mapping in self.mappings])
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        """Create a plan from the maps of an existing virtual dataset.
+
+        Args:
+            dataset(h5py.Dataset): Virtual dataset
+
+        Returns:
+            VDSPlan: Plan
+
+        """
+        import h5py as h5
+
+        dcpl = dataset.id.get_create_plist()
+        if dcpl.get_layout() != h5.h5d.VIRTUAL:
+            raise IOError("Node {} is not a virtual dataset".format(
+                dataset.name))
+
+        maxshape = tuple(dataset.maxshape)
+        plan = cls(dataset.file.filename, dataset.name, dataset.shape,
+                   dataset.dtype, fill_value=native(dataset.fillvalue),
+                   attributes=dict((name, native(value))
+                                   for name, value in dataset.attrs.items()),
+                   maxshape=maxshape if None in maxshape else None)
+        for idx in range(dcpl.get_virtual_count()):
+            index = read_selection(dcpl.get_virtual_vspace(idx))
+
+            source_space = dcpl.get_virtual_srcspace(idx)
+            source_shape = source_space.shape
+            source_index = None
+            if not source_shape and None in [slice_.stop for slice_ in index]:
+                # A printf-style map, with one whole source in each block of
+                # the unlimited target selection
+                source_shape = tuple(
+                    dcpl.get_virtual_vspace(idx).get_regular_hyperslab()[3])
+            elif not source_shape:
+                # The extent is not stored when the whole source is selected,
+                # in which case it is the shape of the target selection
+                source_shape = tuple(
+                    -(-(slice_.stop - slice_.start) // (slice_.step or 1))
+                    for slice_ in index)
+            elif source_space.get_select_type() == h5.h5s.SEL_HYPERSLABS:
+                source_index = read_selection(source_space)
+                if None in [slice_.stop for slice_ in source_index]:
+                    # Nor is it stored for unlimited selections, so use the
+                    # extent currently visible through the target selection
+                    source_shape = tuple(
+                        len(xrange(*target.indices(dim)))
+                        if source.stop is None else source.stop
+                        for source, target, dim
+                        in zip(source_index, index, dataset.shape))
+
+            plan.add_mapping(dcpl.get_virtual_filename(idx),
+                             dcpl.get_virtual_dsetname(idx),
+                             source_shape, index, source_index)
+
+        return plan
+
+    @classmethod
+    def from_dict(cls, plan):
+        """Create a plan from the output of to_dict.
+
+        Args:
+            plan(dict): Plan
+
+        Returns:
+            VDSPlan: Plan
+
+        """
+        mappings = [Mapping(file=mapping["file"], node=mapping["node"],
+                            source_shape=tuple(mapping["source_shape"]),
+                            target_index=decode_index(mapping["target_index"]),
+                            source_index=decode_index(
+                                mapping.get("source_index")))
+                    for mapping in plan["mappings"]]
+        return cls(plan["output_file"], plan["target_node"], plan["shape"],
+                   plan["dtype"], mappings, fill_value=plan.get("fill_value"),
+                   attributes=plan.get("attributes"),
+                   maxshape=plan.get("maxshape"))
+
+    def substitute(self, substitutions, output_file=None):
+        """Create a copy of the plan with source file names substituted.
+
+        Args:
+            substitutions(list(tuple(str, str))): Regex pattern and
+                replacement to apply to each source file name, in order
+            output_file(str): Path to VDS file of the copy - Default is to
+                apply the substitutions to the output file of this plan
+
+        Returns:
+            VDSPlan: Plan with substituted file names
+
+        """
+        patterns = [(re.compile(pattern), replacement)
+                    for pattern, replacement in substitutions]
+
+        def substitute(file_path):
+            for pattern, replacement in patterns:
+                file_path = pattern.sub(replacement, file_path)
+            return file_path
+
+        if output_file is None:
+            output_file = substitute(self.output_file)
+        mappings = [mapping._replace(file=substitute(mapping.file))
+                    for mapping in self.mappings]
+        return VDSPlan(output_file, self.target_node, self.shape, self.dtype,
+                       mappings, fill_value=self.fill_value,
+                       attributes=self.attributes, maxshape=self.maxshape)
+
+    def expand_printf(self):
+        """Create a copy of the plan with a map for each file of a pattern.
+
+        Each printf-style map is replaced by maps of the source files of the
+        blocks within the current shape of the virtual dataset.
+
+        Returns:
+            VDSPlan: Plan without printf-style maps
+
+        """
+        mappings = []
+        for mapping in self.mappings:
+            if not is_printf(mapping.file):
+                mappings.append(mapping)
+                continue
+
+            axis = self.maxshape.index(None)
+            slice_ = mapping.target_index[axis]
+            first, size = slice_.start or 0, mapping.source_shape[axis]
+            step = slice_.step or size
+            for block, start in enumerate(
+                    xrange(first, self.shape[axis], step)):
+                target_index = list(mapping.target_index)
+                target_index[axis] = slice(start, start + size)
+                mappings.append(Mapping(
+                    format_printf(mapping.file, block), mapping.node,
+                    mapping.source_shape, tuple(target_index)))
+
+        return VDSPlan(self.output_file, self.target_node, self.shape,
+                       self.dtype, mappings, fill_value=self.fill_value,
+                       attributes=self.attributes, maxshape=self.maxshape)
+
+    def create_maps(self):
+        """Create the h5py VirtualMaps described by the plan.
+
+        Returns:
+            list(VirtualMap): Maps describing links between raw data and VDS
+
+        """
+        import h5py as h5
+
+        vds = h5.VirtualTarget(self.output_file, self.target_node,
+                               shape=self.shape)
+
+        map_list = []
+        for mapping in self.mappings:
+            v_source = h5.VirtualSource(mapping.file, mapping.node,
+                                        shape=mapping.source_shape)
+            if mapping.source_index is not None:
+                v_source = v_source[mapping.source_index]
+            v_target = vds[mapping.target_index]
+            map_list.append(
+                h5.VirtualMap(v_source, v_target, dtype=self.dtype))
+
+        return map_list
+
+    def create_unlimited(self, vds_file):
+        """Create a virtual dataset with an unlimited axis.
+
+        VirtualMaps can't select unlimited hyperslabs, so the dataset is
+        created with the low level API. Each source is given the same
+        unlimited axis as the virtual dataset, apart from printf-style maps,
+        which map a whole source file to each block.
+
+        Args:
+            vds_file(h5py.File): Open VDS file to create dataset in
+
+        """
+        import h5py as h5
+        import numpy as np
+
+        def create_space(shape, maxshape):
+            return h5.h5s.create_simple(
+                shape, tuple(h5.h5s.UNLIMITED if dim is None else dim
+                             for dim in maxshape))
+
+        dtype = np.dtype(self.dtype)
+        dcpl = h5.h5p.create(h5.h5p.DATASET_CREATE)
+        dcpl.set_fill_value(np.array(self.fill_value, dtype=dtype))
+        axis = self.maxshape.index(None)
+        for mapping in self.mappings:
+            block_size = 1
+            source_maxshape = tuple(
+                None if max_dim is None else dim for dim, max_dim
+                in zip(mapping.source_shape, self.maxshape))
+            if is_printf(mapping.file):
+                block_size = mapping.source_shape[axis]
+                source_maxshape = mapping.source_shape
+
+            target_space = create_space(self.shape, self.maxshape)
+            select_index(target_space, mapping.target_index, self.maxshape,
+                         block_size)
+
+            source_space = create_space(mapping.source_shape,
+                                        source_maxshape)
+            source_index = mapping.source_index
+            if source_index is None:
+                source_index = (slice(None),) * len(mapping.source_shape)
+            select_index(source_space, source_index, source_maxshape)
+
+            dcpl.set_virtual(target_space, encode(mapping.file),
+                             encode(mapping.node), source_space)
+
+        h5.h5d.create(vds_file.id, encode(self.target_node),
+                      h5.h5t.py_create(dtype),
+                      create_space(self.shape, self.maxshape), dcpl=dcpl)
+
+    def materialise(self, vds_file):
+        """Create the virtual dataset described by the plan.
+
+        Args:
+            vds_file(h5py.File): Open VDS file to create dataset in
+
+        """
+        self.logger.debug("Materialising %s", self)
+        if "/" in self.target_node.strip("/"):
+            sub_group = self.target_node.rsplit("/", 1)[0]
+            if vds_file.get(sub_group) is None:
+                vds_file.create_group(sub_group)
+        if self.maxshape is None:
+            vds_file.create_virtual_dataset(VMlist=self.create_maps(),
+                                            fillvalue=self.fill_value)
+        else:
+            self.create_unlimited(vds_file)
+        vds_file[self.target_node].attrs.update(self.attributes)
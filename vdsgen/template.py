@@ -0,0 +1,135 @@
+#!/bin/env dls-python
+"""A CLI tool to create a virtual dataset from an existing one as a
+template."""
+
+import os
+import sys
+import logging
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from vdsgenerator import VDSGenerator
+from plan import load_plans, read_plans, materialise_plans
+
+help_message = """
+-------------------------------------------------------------------------------
+A script to create a virtual dataset with the same layout as an existing VDS
+or plan file, substituting the names of the source files.
+
+The source files are not searched for or opened, so a scan with the same
+geometry as the template only costs writing the new VDS. Each -s <pattern>
+<replacement> is a regular expression substitution applied, in order, to the
+source file names and, if -o is not given, to the output file name. For
+example:
+
+ > ../vdsgen/template.py /scratch/scan_1/stripe_vds.h5 -s scan_1 scan_2
+ > ../vdsgen/app.py /scratch/scan_1 -p stripe_ --plan stripe_plan.json
+ > ../vdsgen/template.py stripe_plan.json -s scan_1 scan_2 -o scan_2.h5
+-------------------------------------------------------------------------------
+"""
+
+logger = logging.getLogger("VDSTemplate")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+
+def load_template(template, nodes=None):
+    """Load the plans of a template.
+
+    Args:
+        template(str): Path to JSON plan file or VDS file
+        nodes(list(str)): Virtual datasets to read from a VDS file - Default
+            is the VDSGenerator target node
+
+    Returns:
+        list(VDSPlan): Plans of template
+
+    """
+    if template.endswith(".json"):
+        return load_plans(template)
+
+    if nodes is None:
+        nodes = [VDSGenerator.target_node]
+    return read_plans(template, nodes)
+
+
+def generate_from_template(template, substitutions, output_file=None,
+                           nodes=None, check=False):
+    """Create a VDS from a template with the source file names substituted.
+
+    Args:
+        template(str): Path to JSON plan file or VDS file
+        substitutions(list(tuple(str, str))): Regex pattern and replacement
+            to apply to each source file name, in order
+        output_file(str): Path to VDS file to create - Default is to apply
+            the substitutions to the output file of the template
+        nodes(list(str)): Virtual datasets to read from a VDS file - Default
+            is the VDSGenerator target node
+        check(bool): Check that the substituted source files exist
+
+    Returns:
+        list(VDSPlan): Plans of created datasets
+
+    """
+    if output_file is not None:
+        output_file = os.path.abspath(output_file)
+
+    plans = [plan.substitute(substitutions, output_file)
+             for plan in load_template(template, nodes)]
+
+    if check:
+        missing = set()
+        for plan in plans:
+            # Relative source paths are relative to the VDS file
+            folder = os.path.dirname(plan.output_file)
+            for file_path in set(mapping.file for mapping in plan.mappings):
+                if not os.path.isfile(os.path.join(folder, file_path)):
+                    missing.add(file_path)
+        if missing:
+            raise IOError("Source files do not exist: {}".format(
+                ", ".join(sorted(missing))))
+
+    for plan in plans:
+        logger.info("Creating %s in %s from template %s",
+                    plan.target_node, plan.output_file, template)
+    materialise_plans(plans)
+    return plans
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(usage=help_message,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "template", type=str,
+        help="VDS file or JSON plan file (.json) to use as a template.")
+    parser.add_argument(
+        "-s", "--substitute", nargs=2, action="append", required=True,
+        metavar=("PATTERN", "REPLACEMENT"), dest="substitutions",
+        help="Regular expression substitution to apply to file names.")
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, dest="output",
+        help="Output file name. If None then the substitutions are applied "
+             "to the output file of the template.")
+    parser.add_argument(
+        "-n", "--nodes", type=str, nargs="*", default=None, dest="nodes",
+        help="Virtual datasets to read from a VDS template. If None then "
+             "the default target node.")
+    parser.add_argument(
+        "--check", action="store_true", dest="check",
+        help="Check that the substituted source files exist.")
+
+    return parser.parse_args()
+
+
+def main():
+    """Run program."""
+    args = parse_args()
+
+    generate_from_template(args.template,
+                           [tuple(pair) for pair in args.substitutions],
+                           output_file=args.output, nodes=args.nodes,
+                           check=args.check)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
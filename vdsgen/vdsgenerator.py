@@ -4,13 +4,247 @@
 import os
 import re
 import logging
+import operator
 
 from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing import Pool
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+from metadatacache import MetadataCache
+from geometry import parse_geometry, compact_offsets, geometry_shape
+from plan import VDSPlan, is_printf
+from metrics import Metrics
+from hooks import FIND_FILES, READ_METADATA, GRAB_METADATA, PLAN, \
+    CREATE_MAP, WRITE
+
+# h5py and numpy are imported where they are used, so that the CLI can parse
+# and validate arguments without paying for importing them
+
+Source = namedtuple("Source", ["frames", "height", "width", "dtype",
+                               "chunks"])
+Source.__new__.__defaults__ = (None,)  # Chunks are None if not chunked
+VDS = namedtuple("VDS", ["shape", "spacing", "offsets"])
+VDS.__new__.__defaults__ = (None,)  # Offsets are only used by grid layout
+# Number at the end of a source file name, with the text either side of it
+FILE_NUMBER = re.compile(r"^(.*?)(\d+)(\.(hdf5|hdf|h5))$")
+NodeMap = namedtuple("NodeMap", ["source_node", "target_node", "layout"])
+
+
+def read_metadata(file_path, source_nodes, swmr=False):
+    """Read the shape, data type and chunking of datasets in an HDF5 file.
+
+    The file is opened once for all of the datasets and closed again before
+    returning.
+
+    Args:
+        file_path(str): Path to HDF5 file
+        source_nodes(list(str)): Data nodes in HDF5 file
+        swmr(bool): Open the file as a SWMR reader, so that it can be read
+            while it is still being written
+
+    Returns:
+        tuple(dict, int): Number of frames, height, width, data type and
+            chunks of the dataset at each node, and bytes of file metadata
+            read to get them
+
+    """
+    import h5py as h5
+
+    # Only pass swmr if needed, as it is not supported by older h5py
+    options = dict(swmr=True) if swmr else dict()
+
+    metadata = dict()
+    with h5.File(file_path, VDSGenerator.READ, **options) as h5_file:
+        for source_node in source_nodes:
+            h5_data = h5_file[source_node]
+            frames, height, width = VDSGenerator.parse_shape(h5_data.shape)
+            metadata[source_node] = dict(
+                frames=frames, height=height, width=width,
+                dtype=h5_data.dtype, chunks=h5_data.chunks)
+        # Everything read from the file so far is in the metadata cache
+        metadata_bytes = h5_file.id.get_mdc_size()[2]
+
+    return metadata, metadata_bytes
+
+
+def image_shape(source):
+    """Get the shape of the image axes of a source.
+
+    Args:
+        source(Source): Source attributes
+
+    Returns:
+        tuple(int): Height and width, or empty for per-frame values
+
+    """
+    if source.height is None:
+        return ()
+    return source.height, source.width
+
+
+def next_prime(number):
+    """Find the smallest prime number greater than or equal to number.
+
+    Args:
+        number(int): Lower bound
+
+    Returns:
+        int: Prime number
+
+    """
+    candidate = max(number, 2)
+    while any(candidate % divisor == 0
+              for divisor in range(2, int(candidate ** 0.5) + 1)):
+        candidate += 1
+    return candidate
+
+
+def list_directory(path):
+    """Iterate over the names of the entries in a folder.
+
+    scandir is used if available, so that the names are streamed rather than
+    read into one list, and no entry is stat-ed.
+
+    Args:
+        path(str): Folder to list
+
+    Returns:
+        iterator(str): Names of entries
+
+    """
+    if scandir is None:
+        return iter(os.listdir(path))
+    return (entry.name for entry in scandir(path))
+
+
+def scan_files(path, prefix):
+    """Find HDF5 files in given folder with given prefix and their indexes.
+
+    Args:
+        path(str): Folder to search
+        prefix(str): Prefix of HDF5 files
+
+    Returns:
+        list(tuple(int, str)): Index and path of each HDF5 file in folder that
+            has the given prefix, in order of index
+
+    """
+    regex = re.compile(prefix + r"(\d+)\.(hdf5|hdf|h5)")
+    folder = os.path.abspath(path)
+
+    files = []
+    for file_ in list_directory(path):
+        match = regex.match(file_)
+        if match is not None:
+            files.append((int(match.group(1)), file_))
+
+    # Order by index, so stripe_10 comes after stripe_2, then by name
+    return [(index, os.path.join(folder, file_))
+            for index, file_ in sorted(files)]
+
+
+def find_files(path, prefix):
+    """Find HDF5 files in given folder with given prefix.
+
+    Args:
+        path(str): Folder to search
+        prefix(str): Prefix of HDF5 files
+
+    Returns:
+        list: HDF5 files in folder that have the given prefix, in order of
+            their index
+
+    """
+    return [file_ for _, file_ in scan_files(path, prefix)]
+
+
+def printf_pattern(file_paths):
+    """Find a printf-style pattern that names the given files in order.
+
+    HDF5 replaces the %b of the pattern with 0, 1, 2 and so on, without
+    padding, so the files must be numbered that way.
+
+    Args:
+        file_paths(list(str)): Paths of files
+
+    Returns:
+        str: Pattern, or None if the files can't be named by one
+
+    """
+    pattern = None
+    for block, file_path in enumerate(file_paths):
+        match = FILE_NUMBER.match(file_path)
+        if match is None or match.group(2) != str(block):
+            return None
+        name = match.group(1).replace("%", "%%") + "%b" + match.group(3)
+        if pattern is None:
+            pattern = name
+        elif name != pattern:
+            return None
+    return pattern
+
+
+def find_missing_indexes(indexes):
+    """Find the gaps in a sorted sequence of indexes.
+
+    Args:
+        indexes(list(int)): Sorted indexes
+
+    Returns:
+        list(int): Indexes between the first and last that are missing
+
+    """
+    missing = []
+    for previous, index in zip(indexes, indexes[1:]):
+        missing.extend(range(previous + 1, index))
+    return missing
+
+
+def find_missing_files(file_paths):
+    """Find which of the given files do not exist.
+
+    Folders with many of the files are listed once, rather than checking
+    each file separately, which is much faster on network file systems.
+
+    Args:
+        file_paths(list(str)): Paths of files
 
-import h5py as h5
+    Returns:
+        list(str): Paths of files that do not exist
 
-Source = namedtuple("Source", ["frames", "height", "width", "dtype"])
-VDS = namedtuple("VDS", ["shape", "spacing"])
+    """
+    folders = dict()
+    for file_path in file_paths:
+        folders.setdefault(os.path.dirname(file_path), []).append(file_path)
+
+    missing = set()
+    for folder, folder_files in folders.items():
+        if len(folder_files) < VDSGenerator.LIST_FOLDER_THRESHOLD:
+            missing.update(file_path for file_path in folder_files
+                           if not os.path.isfile(file_path))
+            continue
+
+        try:
+            names = set(list_directory(folder or os.curdir))
+        except OSError:
+            names = set()
+        missing.update(file_path for file_path in folder_files
+                       if os.path.basename(file_path) not in names)
+
+    return [file_path for file_path in file_paths if file_path in missing]
+
+
+def _read_metadata(args):
+    """Unpack arguments for read_metadata - for use with Pool.map."""
+    return read_metadata(*args)
 
 
 class VDSGenerator(object):
@@ -22,13 +256,38 @@ class VDSGenerator(object):
     APPEND = "a"
     READ = "r"
     FULL_SLICE = slice(None)
+    STRIPES = "stripes"  # Stack sources vertically with spacing
+    FRAMES = "frames"  # Concatenate sources along the first frame axis
+    INTERLEAVE = "interleave"  # Interleave frames of sources round-robin
+    GRID = "grid"  # Place sources as tiles of a 2D grid
+    LAYOUTS = [STRIPES, FRAMES, INTERLEAVE, GRID]
+    STRICT = "strict"  # Raise if sources have different numbers of frames
+    TRUNCATE = "truncate"  # Map the frames that every source has
+    PAD = "pad"  # Map every frame, with fill value where a source has none
+    FRAME_POLICIES = [STRICT, TRUNCATE, PAD]
+    DEFAULT_RDCC_NBYTES = 1024 ** 2  # HDF5 default chunk cache size
+    DEFAULT_RDCC_NSLOTS = 521  # HDF5 default chunk cache hash table size
+    LIST_FOLDER_THRESHOLD = 100  # Files to check at which to list the folder
 
     # Default Values
     stripe_spacing = 10  # Pixel spacing between stripes in a module
     module_spacing = 10  # Pixel spacing between modules
     source_node = "data"  # Data node in source HDF5 files
     target_node = "full_frame"  # Data node in VDS file
+    layout = STRIPES  # How to arrange source datasets in VDS
+    geometry = None  # Description of tile placement for grid layout
+    compact = False  # Leave out spacing between stripes, modules and tiles
+    compact_node = None  # Data node in VDS file for an extra compact dataset
+    extra_nodes = ()  # Other source nodes to map to other target nodes
+    live = False  # Map sources with an unlimited frame axis as they grow
+    frame_policy = STRICT  # How to handle sources with uneven frame counts
+    printf_maps = False  # Map a numbered series of sources with one map
+    append = False  # Only read sources not yet mapped into an existing VDS
+    hooks = ()  # Callbacks before and after each phase of generation
     mode = CREATE  # Write mode for vds file
+    workers = 1  # Number of processes to read source metadata with
+    cache_file = None  # File to cache source metadata in between runs
+    cache_size = MetadataCache.max_entries  # Maximum entries in cache file
     log_level = 2
 
     logger = logging.getLogger("VDSGenerator")
@@ -37,8 +296,11 @@ class VDSGenerator(object):
 
     def __init__(self, path, prefix=None, files=None, output=None, source=None,
                  source_node=None, target_node=None,
-                 stripe_spacing=None, module_spacing=None,
-                 log_level=None):
+                 stripe_spacing=None, module_spacing=None, layout=None,
+                 geometry=None, compact=None, compact_node=None,
+                 extra_nodes=None, live=None, frame_policy=None,
+                 printf_maps=None, append=None, workers=None, cache_file=None,
+                 cache_size=None, log_level=None, hooks=None):
         """
         Args:
             path(str): Root folder to find raw files and create VDS
@@ -46,14 +308,56 @@ class VDSGenerator(object):
                 e.g. image_ for image_1.hdf5, image_2.hdf5, image_3.hdf5
             files(list(str)): List of HDF5 files to generate from
             output(str): Name of VDS file.
-            source(dict): Height, width, data_type and frames for source data
+            source(dict): Shape, dtype and, optionally, chunks of source data
                 Provide this to create a VDS for raw files that don't exist yet
             source_node(str): Data node in source HDF5 files
             target_node(str): Data node in VDS file
             stripe_spacing(int): Spacing between stripes in module
             module_spacing(int): Spacing between modules
+            layout(str): How to arrange source datasets in VDS - stripes to
+                stack vertically with spacing, frames to concatenate along
+                the first frame axis, interleave to take frames from each
+                source in turn or grid to place sources as tiles of a 2D grid
+            geometry(dict): Description of tile placement for grid layout -
+                Either explicit row and column offsets of each source or the
+                rows, columns and gaps of a regular grid
+            compact(bool): Leave out the spacing between stripes, modules
+                and tiles, so that the VDS only contains real pixels
+            compact_node(str): Data node in VDS file to also create a
+                compact dataset at, alongside the spaced one at target_node
+            extra_nodes(list(dict)): Other datasets to create from the same
+                source files, e.g. timestamps - Each has a source_node,
+                target_node and, optionally, layout. Default layout is the
+                same as layout. If source is given, each also needs the shape
+                and dtype of its source data.
+            live(bool): Create the VDS with an unlimited frame axis that
+                maps the whole of each source as it grows, so that it can be
+                created once at the start of an acquisition - Source files
+                are read as a SWMR reader and may differ in number of frames.
+                Not possible with frames layout.
+            frame_policy(str): How to handle sources with different numbers
+                of frames, e.g. after an aborted acquisition - strict to
+                raise, truncate to map the frames every source has or pad to
+                map every frame, with fill value where a source has none.
+                With truncate or pad, the policy and frames of each source
+                are set as attributes of the VDS.
+            printf_maps(bool): With frames layout, map source files named
+                e.g. image_0.h5, image_1.h5, ... with one printf-style map,
+                image_%b.h5, rather than one map per file - The VDS then has
+                an unlimited frame axis and grows as more files of the
+                series are written. Falls back to a map per file if the
+                files can't be named by a pattern.
+            append(bool): Only keep, and read the metadata of, the source
+                files that are not yet mapped into the existing VDS, to
+                append them with append_vds
+            workers(int): Number of processes to read source metadata with
+            cache_file(str): File to cache source metadata in - metadata of
+                unchanged source files is then not read again on later runs
+            cache_size(int): Maximum number of entries in cache file
             log_level(int): Logging level (off=3, info=2, debug=1) -
                 Default is info
+            hooks(list(Hook)): Callbacks before and after each phase of
+                generation, e.g. to profile it - see vdsgen.hooks
 
         """
         if (prefix is None and files is None) or \
@@ -71,42 +375,125 @@ class VDSGenerator(object):
             self.stripe_spacing = stripe_spacing
         if module_spacing is not None:
             self.module_spacing = module_spacing
+        if layout is not None:
+            if layout not in self.LAYOUTS:
+                raise ValueError("Invalid layout {}. Must be one of "
+                                 "{}".format(layout, self.LAYOUTS))
+            self.layout = layout
+        if geometry is not None:
+            self.geometry = geometry
+        if self.layout == self.GRID and self.geometry is None:
+            raise ValueError("Grid layout requires a geometry")
+        if compact is not None:
+            self.compact = compact
+        if compact_node is not None:
+            self.compact_node = compact_node.rstrip("/")
+            if self.compact_node.strip("/") == self.target_node.strip("/"):
+                raise ValueError("Compact node {} must differ from target "
+                                 "node".format(compact_node))
+        if extra_nodes is not None:
+            self.extra_nodes = []
+            for extra_node in extra_nodes:
+                extra_node = dict(extra_node)
+                extra_node.setdefault("layout", self.layout)
+                if extra_node["layout"] not in self.LAYOUTS:
+                    raise ValueError("Invalid layout {}. Must be one of "
+                                     "{}".format(extra_node["layout"],
+                                                 self.LAYOUTS))
+                self.extra_nodes.append(extra_node)
+        if live is not None:
+            self.live = live
+        if printf_maps is not None:
+            self.printf_maps = printf_maps
+        if append is not None:
+            self.append = append
+        if frame_policy is not None:
+            if frame_policy not in self.FRAME_POLICIES:
+                raise ValueError("Invalid frame policy {}. Must be one of "
+                                 "{}".format(frame_policy,
+                                             self.FRAME_POLICIES))
+            self.frame_policy = frame_policy
+        if self.live:
+            for node_map in self.node_maps():
+                if node_map.layout == self.FRAMES:
+                    raise ValueError(
+                        "Live mode is not possible with frames layout - "
+                        "only the last source of a concatenation can grow")
+        if workers is not None:
+            self.workers = workers
+        if cache_file is not None:
+            self.cache_file = cache_file
+        if cache_size is not None:
+            self.cache_size = cache_size
         if log_level is not None:
             self.logger.setLevel(log_level * 10)
+        if hooks is not None:
+            self.hooks = list(hooks)
+        self.metrics = Metrics()
 
         # If Files not given, find files using path and prefix.
         if files is None:
             self.prefix = prefix
-            self.datasets = self.find_files()
+            with self.metrics.timer("discovery"), \
+                    self.hook(FIND_FILES, path=path, prefix=prefix):
+                self.datasets = self.find_files()
             files = [path_.split("/")[-1] for path_ in self.datasets]
         # Else, get common prefix of given files and store full path
         else:
             self.prefix = os.path.commonprefix(files)
             self.datasets = [os.path.join(path, file_) for file_ in files]
+        self.metrics.count("files_scanned", len(self.datasets))
 
         # If output vds file name given, use, otherwise generate a default
         if output is None:
             self.name = self.construct_vds_name(files)
         else:
             self.name = output
+        self.output_file = os.path.abspath(os.path.join(self.path, self.name))
 
+        # Sources already in the VDS to append to are not opened again
+        if self.append:
+            self.datasets = self.find_unmapped(self.datasets)
+
+        # If nothing to append, there is no metadata to get
+        if source is None and not self.datasets:
+            self.source_metadata = None
+            self.extra_metadata = dict()
+            self.source_frames = dict()
         # If source not given, check files exist and get metadata.
-        if source is None:
-            for file_ in self.datasets:
-                if not os.path.isfile(file_):
+        elif source is None:
+            # Files found with prefix are known to exist
+            if prefix is None:
+                with self.metrics.timer("discovery"):
+                    missing = find_missing_files(self.datasets)
+                if missing:
                     raise IOError(
                         "File {} does not exist. To create VDS from raw "
                         "files that haven't been created yet, source "
-                        "must be provided.".format(file_))
-            self.source_metadata = self.process_source_datasets()
+                        "must be provided.".format(missing[0]))
+            with self.metrics.timer("metadata"):
+                self.source_metadata = self.process_source_datasets()
         # Else, store given source metadata
         else:
             frames, height, width = self.parse_shape(source['shape'])
             self.source_metadata = Source(
                 frames=frames, height=height, width=width,
-                dtype=source['dtype'])
-
-        self.output_file = os.path.abspath(os.path.join(self.path, self.name))
+                dtype=source['dtype'], chunks=source.get('chunks'))
+            self.extra_metadata = dict()
+            self.source_frames = dict()
+            for extra_node in self.extra_nodes:
+                if extra_node["source_node"] == self.source_node:
+                    continue
+                if "shape" not in extra_node or "dtype" not in extra_node:
+                    raise ValueError(
+                        "Extra node {} needs a shape and dtype to create VDS "
+                        "from raw files that haven't been created "
+                        "yet".format(extra_node["source_node"]))
+                frames, height, width = self.parse_shape(extra_node['shape'])
+                self.extra_metadata[extra_node["source_node"]] = Source(
+                    frames=frames, height=height, width=width,
+                    dtype=extra_node['dtype'],
+                    chunks=extra_node.get('chunks'))
 
     @staticmethod
     def parse_shape(shape):
@@ -119,6 +506,10 @@ class VDSGenerator(object):
             frames, height, width
 
         """
+        if len(shape) < 2:
+            # Per-frame values, e.g. timestamps, have no image axes
+            return tuple(shape), None, None
+
         # The last two elements of shape are the height and width of the image
         height, width = shape[-2:]
         # Everything before that is the frames for each axis
@@ -126,25 +517,367 @@ class VDSGenerator(object):
 
         return frames, height, width
 
+    def add_hook(self, hook):
+        """Add a callback before and after each phase of generation.
+
+        Hooks added after initialisation miss the discovery and metadata
+        phases, which run in __init__ - pass them to __init__ to see those.
+
+        Args:
+            hook(Hook): Callbacks
+
+        """
+        self.hooks = list(self.hooks) + [hook]
+
+    @contextmanager
+    def hook(self, event, **details):
+        """Call the hooks before and after the body of the with statement.
+
+        Args:
+            event(str): Name of event
+            details: Details of event to pass to the hooks
+
+        """
+        for hook in self.hooks:
+            hook.before(event, **details)
+        try:
+            yield
+        finally:
+            for hook in reversed(self.hooks):
+                hook.after(event, **details)
+
+    def node_maps(self):
+        """Get the source node, target node and layout of each dataset.
+
+        Returns:
+            list(NodeMap): Main dataset, then each of the extra nodes
+
+        """
+        return [NodeMap(self.source_node, self.target_node, self.layout)] + \
+            [NodeMap(extra_node["source_node"], extra_node["target_node"],
+                     extra_node.get("layout", self.layout))
+             for extra_node in self.extra_nodes]
+
+    def source_nodes(self):
+        """Get the data nodes to read from each source file.
+
+        Returns:
+            list(str): Source node, then any other nodes of extra_nodes
+
+        """
+        source_nodes = []
+        for node_map in self.node_maps():
+            if node_map.source_node not in source_nodes:
+                source_nodes.append(node_map.source_node)
+        return source_nodes
+
     def generate_vds(self):
-        """Generate a virtual dataset."""
+        """Generate a virtual dataset.
+
+        Returns:
+            dict: Seconds taken by each phase and counters of work done, from
+                discovery of the source files to the write of the VDS
+
+        """
+        import h5py as h5
+
+        nodes = [node_map.target_node for node_map in self.node_maps()]
+        if self.compact_node is not None:
+            nodes.append(self.compact_node)
+
         if os.path.isfile(self.output_file):
             with h5.File(self.output_file, self.READ, libver="latest") as vds:
-                node = vds.get(self.target_node)
-            if node is not None:
-                raise IOError("VDS {file} already has an entry for node "
-                              "{node}".format(file=self.output_file,
-                                              node=self.target_node))
-            else:
-                self.mode = self.APPEND
+                for node_name in nodes:
+                    node = vds.get(node_name)
+                    if node is not None:
+                        raise IOError("VDS {file} already has an entry for "
+                                      "node {node}".format(
+                                          file=self.output_file,
+                                          node=node_name))
+            self.mode = self.APPEND
 
-        vds_data = self.construct_vds_metadata(self.source_metadata)
-        map_list = self.create_vds_maps(self.source_metadata, vds_data)
+        plans = self.plan_vds()
 
         self.logger.info("Creating VDS at %s", self.output_file)
-        with h5.File(self.output_file, self.mode, libver="latest") as vds:
-            self.validate_node(vds)
+        with self.metrics.timer("write"), \
+                self.hook(WRITE, output_file=self.output_file):
+            self.metrics.count("file_opens")
+            with h5.File(self.output_file, self.mode, libver="latest") as vds:
+                for plan in plans:
+                    self.validate_node(vds, plan.target_node)
+                    plan.materialise(vds)
+
+        self.logger.debug("Metrics: %s", self.metrics.to_dict())
+        return self.metrics.to_dict()
+
+    def generate_vds_in_memory(self, file_image=False):
+        """Generate a virtual dataset in an in-memory HDF5 file.
+
+        Nothing is written to disk, so a VDS for a single request costs no
+        file system operations and leaves nothing to clean up. The in-memory
+        file is named output_file, so relative source paths resolve as they
+        would for a VDS written there.
+
+        The file has the default library version bounds, because HDF5 1.10
+        can't read an image of a file with the latest bounds while it is
+        open.
+
+        Args:
+            file_image(bool): Return the bytes of the file image instead of
+                the open file - Open the image with
+                h5py.h5f.open_file_image or write it to disk, as sources of
+                a VDS can't be resolved from a file-like object
+
+        Returns:
+            h5py.File or str: Open in-memory VDS file, for the caller to
+                close, or the bytes of its file image
+
+        """
+        import h5py as h5
+
+        plans = self.plan_vds()
+
+        self.logger.info("Creating VDS in memory")
+        with self.metrics.timer("write"), \
+                self.hook(WRITE, output_file=self.output_file):
+            vds = h5.File(self.output_file, self.CREATE, driver="core",
+                          backing_store=False)
+            try:
+                for plan in plans:
+                    plan.materialise(vds)
+                if file_image:
+                    vds.flush()
+                    result = vds.id.get_file_image()
+                    vds.close()
+                else:
+                    result = vds
+            except Exception:
+                vds.close()
+                raise
+
+        self.logger.debug("Metrics: %s", self.metrics.to_dict())
+        return result
+
+    def plan_vds(self):
+        """Plan the virtual datasets to create, without creating them.
+
+        Returns:
+            list(VDSPlan): Plan of dataset at target node and, if configured,
+                compact dataset at compact node and datasets of extra_nodes
+
+        """
+        with self.metrics.timer("plan"), \
+                self.hook(PLAN, output_file=self.output_file):
+            plans = self._plan_vds()
+        self.metrics.count("maps", sum(len(plan.mappings) for plan in plans))
+        return plans
+
+    def _plan_vds(self):
+        """Plan the virtual datasets to create - see plan_vds."""
+        chunk_cache = self.check_chunking(self.source_metadata)
+
+        vds_data = self.construct_vds_metadata(self.source_metadata)
+        plans = [self.create_vds_plan(self.source_metadata, vds_data)]
+        if self.compact_node is not None:
+            compact_data = self.construct_vds_metadata(
+                self.source_metadata, compact=True)
+            plans.append(self.create_vds_plan(
+                self.source_metadata, compact_data,
+                target_node=self.compact_node))
+
+        for plan in plans:
+            plan.attributes.update(chunk_cache)
+
+        sources = dict(self.extra_metadata)
+        sources[self.source_node] = self.source_metadata
+        for node_map in self.node_maps()[1:]:
+            source = sources[node_map.source_node]
+            vds_data = self.construct_vds_metadata(source,
+                                                   layout=node_map.layout)
+            plan = self.create_vds_plan(source, vds_data,
+                                        target_node=node_map.target_node,
+                                        source_node=node_map.source_node,
+                                        layout=node_map.layout)
+            plan.attributes.update(self.check_chunking(source,
+                                                       node_map.layout))
+            plans.append(plan)
+
+        return plans
+
+    def append_vds(self):
+        """Append source datasets to the end of an existing frames VDS.
+
+        Source datasets that are already mapped into the VDS are skipped. The
+        existing maps are recreated from the VDS itself, so the sources they
+        point to are not opened again - create the generator with append to
+        not read their metadata either. A VDS with an unlimited frame axis,
+        from live mode or printf_maps, can't be appended to - it already
+        grows as its sources are written.
+
+        Returns:
+            dict: Seconds taken by each phase and counters of work done
+
+        """
+        if self.layout != self.FRAMES:
+            raise ValueError("Can only append to a VDS with frames layout")
+        if self.extra_nodes:
+            raise ValueError("Cannot append to a VDS with extra nodes")
+
+        with self.metrics.timer("write"), \
+                self.hook(WRITE, output_file=self.output_file):
+            self.metrics.count("file_opens")
+            self._append_vds()
+
+        self.logger.debug("Metrics: %s", self.metrics.to_dict())
+        return self.metrics.to_dict()
+
+    def _append_vds(self):
+        """Append source datasets to the VDS - see append_vds."""
+        import h5py as h5
+
+        self.check_append_file()
+        with h5.File(self.output_file, self.APPEND, libver="latest") as vds:
+            dataset = self.get_append_node(vds)
+            existing_maps = self.read_vds_maps(dataset)
+            if None in dataset.maxshape or \
+                    any(is_printf(mapping.file) for mapping in existing_maps):
+                # Its maps already cover sources as they are written
+                raise ValueError("Cannot append to VDS {file} - it has an "
+                                 "unlimited frame axis, from live mode or a "
+                                 "printf-style map".format(
+                                     file=self.output_file))
+            datasets = self.unmapped_datasets(self.datasets, existing_maps)
+            if not datasets:
+                self.logger.info("No new datasets to append to %s",
+                                 self.output_file)
+                return
+
+            source = self.source_metadata
+            frame_shape = source.frames[1:] + image_shape(source)
+            if dataset.shape[1:] != frame_shape:
+                raise ValueError("Source frame shape {source} does not match "
+                                 "VDS frame shape {vds}".format(
+                                     source=frame_shape,
+                                     vds=dataset.shape[1:]))
+
+            frames_per_dataset = source.frames[0] if source.frames else 1
+            shape = (dataset.shape[0] + frames_per_dataset * len(datasets),) \
+                + frame_shape
+            vds_data = VDS(shape=shape, spacing=[0] * len(datasets))
+
+            new_plan = self.create_vds_plan(
+                source, vds_data, datasets=datasets, offset=dataset.shape[0])
+            # Existing maps keep their source selection, e.g. if truncated
+            plan = VDSPlan(self.output_file, self.target_node, shape,
+                           dataset.dtype, existing_maps + new_plan.mappings)
+            map_list = plan.create_maps()
+            self.metrics.count("maps", len(new_plan.mappings))
+
+            self.logger.info("Appending %s datasets to VDS at %s",
+                             len(datasets), self.output_file)
+            attributes = dict(dataset.attrs)
+            if "source_frames" in attributes or \
+                    "source_frames" in new_plan.attributes:
+                # Frames of each source, in order - see create_vds_plan
+                source_frames = list(attributes.get(
+                    "source_frames",
+                    [mapping.source_shape[0] for mapping in existing_maps]))
+                source_frames += new_plan.attributes.get(
+                    "source_frames", [frames_per_dataset] * len(datasets))
+                attributes.update(new_plan.attributes)
+                attributes["source_frames"] = source_frames
+            attributes.update(self.check_chunking(source))
+            del vds[self.target_node]
             vds.create_virtual_dataset(VMlist=map_list, fillvalue=0x1)
+            vds[self.target_node].attrs.update(attributes)
+
+    def check_append_file(self):
+        """Check that the VDS file to append to exists.
+
+        Raises:
+            IOError: If it doesn't, before an empty file is created
+
+        """
+        if not os.path.isfile(self.output_file):
+            raise IOError("VDS {} does not exist to append to".format(
+                self.output_file))
+
+    def get_append_node(self, vds):
+        """Get the virtual dataset to append to.
+
+        Args:
+            vds(h5py.File): Open VDS file
+
+        Returns:
+            h5py.Dataset: Virtual dataset at target_node
+
+        Raises:
+            IOError: If the VDS file has no target_node
+
+        """
+        dataset = vds.get(self.target_node)
+        if dataset is None:
+            raise IOError("VDS {file} has no node {node} to append "
+                          "to".format(file=self.output_file,
+                                      node=self.target_node))
+        return dataset
+
+    def find_unmapped(self, datasets):
+        """Find the source datasets not yet mapped into the VDS to append to.
+
+        Only the VDS file is opened, not the sources.
+
+        Args:
+            datasets(list(str)): Paths to source HDF5 files
+
+        Returns:
+            list(str): Paths to source HDF5 files not mapped into the VDS
+
+        """
+        import h5py as h5
+
+        self.check_append_file()
+        self.metrics.count("file_opens")
+        with h5.File(self.output_file, self.READ, libver="latest") as vds:
+            existing_maps = self.read_vds_maps(self.get_append_node(vds))
+        unmapped = self.unmapped_datasets(datasets, existing_maps)
+        self.logger.debug("%s of %s datasets already mapped into %s",
+                          len(datasets) - len(unmapped), len(datasets),
+                          self.output_file)
+        return unmapped
+
+    def unmapped_datasets(self, datasets, existing_maps):
+        """Filter out the source datasets of the given maps of the VDS.
+
+        Args:
+            datasets(list(str)): Paths to source HDF5 files
+            existing_maps(list(Mapping)): Maps of the VDS
+
+        Returns:
+            list(str): Paths to source HDF5 files not in the maps
+
+        """
+        # Relative source paths are relative to the VDS file
+        vds_folder = os.path.dirname(self.output_file)
+        mapped_files = set(
+            os.path.abspath(os.path.join(vds_folder, mapping.file))
+            for mapping in existing_maps)
+        return [dataset for dataset in datasets
+                if os.path.abspath(dataset) not in mapped_files]
+
+    @staticmethod
+    def read_vds_maps(dataset):
+        """Read the source and target of each map of a virtual dataset.
+
+        Args:
+            dataset(h5py.Dataset): Virtual dataset
+
+        Returns:
+            list(Mapping): File path, data node, source shape, target index
+                and source index of each map
+
+        """
+        return VDSPlan.from_dataset(dataset).mappings
 
     def find_files(self):
         """Find HDF5 files in given folder with given prefix.
@@ -153,12 +886,17 @@ class VDSGenerator(object):
             list: HDF5 files in folder that have the given prefix
 
         """
-        regex = re.compile(self.prefix + r"\d+\.(hdf5|hdf|h5)")
-
-        files = []
-        for file_ in sorted(os.listdir(self.path)):
-            if re.match(regex, file_):
-                files.append(os.path.abspath(os.path.join(self.path, file_)))
+        indexed_files = scan_files(self.path, self.prefix)
+        files = [file_ for _, file_ in indexed_files]
+
+        missing = find_missing_indexes([index for index, _ in indexed_files])
+        if missing:
+            shown = ", ".join(str(index) for index in missing[:10])
+            if len(missing) > 10:
+                shown += ", ..."
+            self.logger.warning("Files with prefix %s are missing %s "
+                                "indexes: %s", self.prefix, len(missing),
+                                shown)
 
         if len(files) == 0:
             raise IOError("No files matching pattern found. Got path: {path}, "
@@ -195,55 +933,228 @@ class VDSGenerator(object):
             file_path(str): Path to HDF5 file
 
         Returns:
-            dict: Number of frames, height, width and data type of datasets
+            tuple(dict, int): Number of frames, height, width, data type and
+                chunks of the dataset at each source node, and bytes of file
+                metadata read
 
         """
-        h5_data = h5.File(file_path, 'r')[self.source_node]
-        frames, height, width = self.parse_shape(h5_data.shape)
-        data_type = h5_data.dtype
+        return read_metadata(file_path, self.source_nodes(), self.live)
+
+    def read_source_metadata(self, datasets):
+        """Grab data from the given HDF5 files.
+
+        The metadata is read in parallel if more than one worker is
+        configured. The files opened and bytes of metadata read are added to
+        metrics.
 
-        return dict(frames=frames, height=height, width=width, dtype=data_type)
+        Args:
+            datasets(list(str)): Paths to HDF5 files
+
+        Returns:
+            list(dict): Number of frames, height, width and data type of the
+                dataset at each source node of each file
+
+        """
+        workers = min(self.workers, len(datasets))
+        with self.hook(READ_METADATA, files=datasets):
+            if workers > 1:
+                self.logger.debug("Reading metadata with %s processes",
+                                  workers)
+                source_nodes = self.source_nodes()
+                pool = Pool(workers)
+                try:
+                    results = pool.map(
+                        _read_metadata,
+                        [(dataset, source_nodes, self.live)
+                         for dataset in datasets])
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results = []
+                for dataset in datasets:
+                    with self.hook(GRAB_METADATA, file_path=dataset):
+                        results.append(self.grab_metadata(dataset))
+
+        self.metrics.count("file_opens", len(results))
+        self.metrics.count("metadata_bytes",
+                           sum(size for _, size in results))
+        return [metadata for metadata, _ in results]
 
     def process_source_datasets(self):
         """Grab data from the given HDF5 files and check for consistency.
 
+        The metadata of every source node is read in one pass over the files.
+        If a cache file is configured, only files without a valid cache entry
+        are opened. Every file is checked before any mismatch is raised. The
+        metadata of the source nodes of extra_nodes is stored in
+        extra_metadata.
+
         Returns:
             Source: Number of datasets and the attributes of them (frames,
                 height width and data type)
 
         """
-        data = self.grab_metadata(self.datasets[0])
-        for dataset in self.datasets[1:]:
-            temp_data = self.grab_metadata(dataset)
-            for attribute, value in data.items():
-                if temp_data[attribute] != value:
-                    raise ValueError("Files have mismatched "
-                                     "{}".format(attribute))
+        source_nodes = self.source_nodes()
+        if self.cache_file is None:
+            metadata = self.read_source_metadata(self.datasets)
+        else:
+            cache = MetadataCache(self.cache_file, self.cache_size)
+            metadata = []
+            for dataset in self.datasets:
+                data = dict((source_node, cache.get(dataset, source_node))
+                            for source_node in source_nodes)
+                if None in data.values():
+                    data = None
+                metadata.append(data)
+            missing = [dataset for dataset, cached
+                       in zip(self.datasets, metadata) if cached is None]
+            self.logger.debug("Metadata cache hits: %s, misses: %s",
+                              len(self.datasets) - len(missing), len(missing))
+            self.metrics.count("cache_hits",
+                               len(self.datasets) - len(missing))
+
+            if missing:
+                new_metadata = dict(zip(
+                    missing, self.read_source_metadata(missing)))
+                for dataset, data in new_metadata.items():
+                    for source_node in source_nodes:
+                        cache.put(dataset, source_node, data[source_node])
+                cache.save()
+                metadata = [new_metadata.get(dataset, data)
+                            for dataset, data in zip(self.datasets, metadata)]
+
+        mismatches = []
+        sources = dict()
+        self.source_frames = dict()
+        for source_node in source_nodes:
+            sources[source_node] = self.check_metadata(
+                source_node, [data[source_node] for data in metadata],
+                mismatches)
+        if mismatches:
+            raise ValueError("Files have mismatched metadata:\n" +
+                             "\n".join(mismatches))
+
+        self.extra_metadata = dict(
+            (source_node, sources[source_node])
+            for source_node in source_nodes[1:])
+        self.logger.debug("Source metadata retrieved: %s", sources)
+        return sources[self.source_node]
+
+    def check_metadata(self, source_node, metadata, mismatches):
+        """Check the metadata of one source node is the same in every file.
+
+        In live mode, sources are still being written, so their number of
+        frames is not checked. With a frame policy of truncate or pad, the
+        number of frames along the first frame axis may differ - the frames
+        of each source are stored in source_frames and the first frame axis
+        of the returned Source is the minimum or maximum respectively.
 
-        source = Source(frames=data['frames'], height=data['height'],
-                        width=data['width'], dtype=data['dtype'])
+        Args:
+            source_node(str): Data node in source files
+            metadata(list(dict)): Metadata of the node in each file
+            mismatches(list(str)): List to add a line to for each mismatch
 
-        self.logger.debug("Source metadata retrieved: %s", source)
-        return source
+        Returns:
+            Source: Attributes of the node in the first file
 
-    def construct_vds_metadata(self, source):
+        """
+        uneven = self.live or self.frame_policy != self.STRICT
+        # Only name the node if it is not the main one
+        node = "" if source_node == self.source_node else " " + source_node
+        data = metadata[0]
+        for dataset, temp_data in zip(self.datasets[1:], metadata[1:]):
+            if temp_data.get("chunks") != data.get("chunks"):
+                # Not an error, but the chunk cache advice assumes the first
+                self.logger.warning("%s has chunks %s, but %s has %s",
+                                    dataset.split("/")[-1] + node,
+                                    temp_data.get("chunks"),
+                                    self.datasets[0].split("/")[-1],
+                                    data.get("chunks"))
+            for attribute in sorted(data.keys()):
+                if attribute == "chunks":
+                    continue
+                value, expected = temp_data[attribute], data[attribute]
+                if attribute == "frames" and uneven:
+                    value, expected = value[1:], expected[1:]
+                if value != expected:
+                    mismatches.append("{file}{node}: {attribute} {value} != "
+                                      "{expected}".format(
+                                          file=dataset.split("/")[-1],
+                                          node=node,
+                                          attribute=attribute,
+                                          value=temp_data[attribute],
+                                          expected=data[attribute]))
+
+        frames = data['frames']
+        if frames and self.frame_policy != self.STRICT and not self.live:
+            counts = [temp_data['frames'][0] for temp_data in metadata]
+            self.source_frames[source_node] = dict(zip(self.datasets,
+                                                       counts))
+            if self.frame_policy == self.TRUNCATE:
+                frames = (min(counts),) + frames[1:]
+            else:
+                frames = (max(counts),) + frames[1:]
+            if min(counts) != max(counts):
+                self.logger.warning(
+                    "Sources%s have %s to %s frames - mapping %s frames of "
+                    "each (%s)", node, min(counts), max(counts), frames[0],
+                    self.frame_policy)
+
+        return Source(frames=frames, height=data['height'],
+                      width=data['width'], dtype=data['dtype'],
+                      chunks=data.get('chunks'))
+
+    def construct_vds_metadata(self, source, compact=None, layout=None):
         """Construct VDS data attributes from source attributes.
 
         Args:
             source(Source): Attributes of data sets
+            compact(bool): Leave out spacing between sources - Default is
+                the compact attribute
+            layout(str): Layout of VDS - Default is the layout attribute
 
         Returns:
             VDS: Shape, dataset spacing and output path of virtual data set
 
         """
+        if compact is None:
+            compact = self.compact
+        if layout is None:
+            layout = self.layout
+        if layout in [self.STRIPES, self.GRID] and source.height is None:
+            raise ValueError("Layout {} requires 2D source images".format(
+                layout))
+
         stripes = len(self.datasets)
+        if layout == self.GRID:
+            offsets = parse_geometry(self.geometry, stripes,
+                                     source.height, source.width)
+            if compact:
+                offsets = compact_offsets(offsets, source.height,
+                                          source.width)
+            shape = source.frames + \
+                geometry_shape(offsets, source.height, source.width)
+            vds = VDS(shape=shape, spacing=[0] * stripes, offsets=offsets)
+            self.logger.debug("VDS metadata constructed: %s", vds)
+            return vds
+        if layout in [self.FRAMES, self.INTERLEAVE]:
+            # Sources with no frame axis are one frame each
+            frames = source.frames[0] if source.frames else 1
+            shape = (frames * stripes,) + source.frames[1:] + \
+                image_shape(source)
+            vds = VDS(shape=shape, spacing=[0] * stripes)
+            self.logger.debug("VDS metadata constructed: %s", vds)
+            return vds
+
         spacing = [0] * stripes
-        for idx in range(0, stripes - 1, 2):
-            spacing[idx] = self.stripe_spacing
-        for idx in range(1, stripes, 2):
-            spacing[idx] = self.module_spacing
-        # We don't want the final stripe to have a gap afterwards
-        spacing[-1] = 0
+        if not compact:
+            for idx in range(0, stripes - 1, 2):
+                spacing[idx] = self.stripe_spacing
+            for idx in range(1, stripes, 2):
+                spacing[idx] = self.module_spacing
+            # We don't want the final stripe to have a gap afterwards
+            spacing[-1] = 0
 
         height = (source.height * stripes) + sum(spacing)
         shape = source.frames + (height, source.width)
@@ -252,56 +1163,251 @@ class VDSGenerator(object):
         self.logger.debug("VDS metadata constructed: %s", vds)
         return vds
 
-    def create_vds_maps(self, source, vds_data):
+    def create_vds_maps(self, source, vds_data, datasets=None, offset=0,
+                        target_node=None, source_node=None, layout=None):
         """Create a list of VirtualMaps of raw data to the VDS.
 
         Args:
             source(Source): Source attributes
             vds_data(VDS): VDS attributes
+            datasets(list(str)): Source files to map - Default is all datasets
+            offset(int): Position in VDS to map first source file to - Frame
+                for frames layout, row for stripes layout
+            target_node(str): Data node in VDS file - Default is target_node
+            source_node(str): Data node in source files - Default is
+                source_node
+            layout(str): Layout of VDS - Default is the layout attribute
 
         Returns:
             list(VirtualMap): Maps describing links between raw data and VDS
 
         """
-        source_shape = source.frames + (source.height, source.width)
-        vds = h5.VirtualTarget(self.output_file, self.target_node,
-                               shape=vds_data.shape)
+        return self.create_vds_plan(source, vds_data, datasets, offset,
+                                    target_node, source_node,
+                                    layout).create_maps()
 
-        map_list = []
-        current_position = 0
-        for idx, dataset in enumerate(self.datasets):
+    def create_vds_plan(self, source, vds_data, datasets=None, offset=0,
+                        target_node=None, source_node=None, layout=None):
+        """Plan the maps of raw data to the VDS.
 
-            v_source = h5.VirtualSource(dataset, self.source_node,
-                                        shape=source_shape)
+        Args:
+            source(Source): Source attributes
+            vds_data(VDS): VDS attributes
+            datasets(list(str)): Source files to map - Default is all datasets
+            offset(int): Position in VDS to map first source file to - Frame
+                for frames layout, row for stripes layout
+            target_node(str): Data node in VDS file - Default is target_node
+            source_node(str): Data node in source files - Default is
+                source_node
+            layout(str): Layout of VDS - Default is the layout attribute
 
-            start = current_position
-            stop = start + source.height + vds_data.spacing[idx]
-            current_position = stop
+        Returns:
+            VDSPlan: Source and target selection of each map
 
-            index = tuple([self.FULL_SLICE] * len(source.frames) +
-                          [slice(start, stop)] + [self.FULL_SLICE])
-            v_target = vds[index]
-            v_map = h5.VirtualMap(v_source, v_target, dtype=source.dtype)
+        """
+        source_shape = source.frames + image_shape(source)
+        if target_node is None:
+            target_node = self.target_node
+        if source_node is None:
+            source_node = self.source_node
+        if layout is None:
+            layout = self.layout
+        maxshape = None
+        if self.live:
+            if not source.frames:
+                raise ValueError("Live mode requires sources with a frame "
+                                 "axis")
+            maxshape = (None,) + tuple(vds_data.shape[1:])
+        plan = VDSPlan(self.output_file, target_node, vds_data.shape,
+                       source.dtype, maxshape=maxshape)
+
+        if datasets is None:
+            datasets = self.datasets
+
+        # Frames of each source, if they may differ - see check_metadata
+        source_frames = dict()
+        if self.frame_policy != self.STRICT and not self.live and \
+                source.frames:
+            source_frames = self.source_frames.get(source_node, dict())
+            plan.attributes.update(
+                frame_policy=self.frame_policy,
+                source_frames=[source_frames.get(dataset, source.frames[0])
+                               for dataset in datasets])
+        # Frames of VDS for each source - Sources with no frame axis are one
+        # frame each
+        slot = source.frames[0] if source.frames else 1
+
+        if self.printf_maps:
+            pattern = None
+            if layout == self.FRAMES and offset == 0 and slot > 0 and \
+                    source.frames and \
+                    all(frames == slot for frames in source_frames.values()):
+                pattern = printf_pattern(datasets)
+            if pattern is not None:
+                self.create_printf_mapping(plan, pattern, source_node,
+                                           source_shape)
+                return plan
+            self.logger.info("Sources of %s can't be mapped with a "
+                             "printf-style pattern - mapping each file",
+                             target_node)
+
+        current_position = offset
+        for idx, dataset in enumerate(datasets):
+            dataset_shape, source_index = source_shape, None
+            frames = slot
+            if dataset in source_frames:
+                dataset_shape = (source_frames[dataset],) + source_shape[1:]
+                frames = min(slot, source_frames[dataset])
+                if frames < source_frames[dataset]:
+                    # Truncate - Leave out the frames other sources don't have
+                    source_index = tuple([slice(0, frames)] +
+                                         [self.FULL_SLICE] *
+                                         (len(source_shape) - 1))
+            # Pad - Leave the frames this source doesn't have as fill value
+            frame_index = self.FULL_SLICE if frames == slot \
+                else slice(0, frames)
+
+            if layout == self.FRAMES:
+                start = current_position
+                stop = start + frames
+                current_position = start + slot
+
+                index = tuple([slice(start, stop)] + [self.FULL_SLICE] *
+                              (len(vds_data.shape) - 1))
+            elif layout == self.INTERLEAVE:
+                # Every len(datasets)th frame, starting from this source
+                start = offset + idx
+                stop = start + (frames - 1) * len(datasets) + 1
+                if self.live:
+                    # Every len(datasets)th frame however far the VDS grows
+                    stop = None
+
+                index = tuple([slice(start, stop, len(datasets))] +
+                              [self.FULL_SLICE] * (len(vds_data.shape) - 1))
+            elif layout == self.GRID:
+                row, column = vds_data.offsets[idx]
+
+                index = tuple([frame_index] +
+                              [self.FULL_SLICE] * (len(source.frames) - 1) +
+                              [slice(row, row + source.height),
+                               slice(column, column + source.width)])
+            else:
+                start = current_position
+                stop = start + source.height + vds_data.spacing[idx]
+                current_position = stop
+                if self.live:
+                    # Unlimited selections must match the source exactly
+                    stop = start + source.height
+
+                index = tuple([frame_index] +
+                              [self.FULL_SLICE] * (len(source.frames) - 1) +
+                              [slice(start, stop)] + [self.FULL_SLICE])
+            if frames == 0 and dataset in source_frames:
+                self.logger.debug("Dataset %s has no frames to map.",
+                                  dataset.split("/")[-1])
+                continue
+            with self.hook(CREATE_MAP, file_path=dataset, target_index=index):
+                plan.add_mapping(dataset, source_node, dataset_shape, index,
+                                 source_index)
 
             self.logger.debug("Mapping dataset %s to %s of %s.",
                               dataset.split("/")[-1], index, self.name)
-            map_list.append(v_map)
 
-        return map_list
+        return plan
+
+    def create_printf_mapping(self, plan, pattern, source_node,
+                              source_shape):
+        """Map a numbered series of sources, in frames layout, with one map.
+
+        Each block of source_shape[0] frames of the unlimited frame axis of
+        the VDS is mapped to the whole of the source file named by the
+        pattern with the number of the block.
+
+        Args:
+            plan(VDSPlan): Plan to add the map to
+            pattern(str): printf-style pattern of source file names
+            source_node(str): Data node in source files
+            source_shape(tuple(int)): Shape of each source dataset
+
+        """
+        plan.maxshape = (None,) + plan.shape[1:]
+        index = tuple([slice(0, None, source_shape[0])] +
+                      [self.FULL_SLICE] * (len(plan.shape) - 1))
+        with self.hook(CREATE_MAP, file_path=pattern, target_index=index):
+            plan.add_mapping(pattern, source_node, source_shape, index)
+
+        self.logger.debug("Mapping datasets %s to %s of %s.",
+                          pattern.split("/")[-1], index, self.name)
 
-    def validate_node(self, vds_file):
+    def check_chunking(self, source, layout=None):
+        """Check how source chunking affects reads through the VDS.
+
+        A warning is logged if reading one frame through the VDS has to read
+        more than one frame from the source chunks. The chunk cache each
+        source needs to read whole frames without rereading chunks is
+        returned, to store as attributes of the VDS for readers to use.
+
+        Args:
+            source(Source): Source attributes
+            layout(str): Layout of VDS - Default is the layout attribute
+
+        Returns:
+            dict: Recommended rdcc_nbytes and rdcc_nslots for each source -
+                Empty if the sources are not chunked images
+
+        """
+        import numpy as np
+
+        if source.chunks is None or source.height is None:
+            return dict()
+        if layout is None:
+            layout = self.layout
+
+        frame_chunks = source.chunks[:-2]
+        chunk_height, chunk_width = source.chunks[-2:]
+        frames_per_chunk = reduce(operator.mul, frame_chunks, 1)
+        if frames_per_chunk > 1:
+            self.logger.warning(
+                "Source chunks %s span %s frames - reading one frame through "
+                "the VDS reads %s frames from each source",
+                source.chunks, frames_per_chunk, frames_per_chunk)
+        if layout == self.FRAMES and frame_chunks and source.frames and \
+                source.frames[0] % frame_chunks[0] != 0:
+            self.logger.warning(
+                "Source frames %s are not a multiple of chunk frames %s - "
+                "frame ranges across sources read partial chunks",
+                source.frames[0], frame_chunks[0])
+
+        chunks_per_frame = \
+            -(-source.height // chunk_height) * -(-source.width // chunk_width)
+        chunk_bytes = reduce(operator.mul, source.chunks, 1) * \
+            np.dtype(source.dtype).itemsize
+        chunk_cache = dict(
+            rdcc_nbytes=max(chunks_per_frame * chunk_bytes,
+                            self.DEFAULT_RDCC_NBYTES),
+            # HDF5 recommends ~100 times the number of chunks in the cache
+            rdcc_nslots=max(next_prime(100 * chunks_per_frame),
+                            self.DEFAULT_RDCC_NSLOTS))
+
+        self.logger.debug("Recommended chunk cache: %s", chunk_cache)
+        return chunk_cache
+
+    def validate_node(self, vds_file, node=None):
         """Check if it is possible to create the given node.
 
-        Create any sub-group of the target node if it doesn't exist.
+        Create any sub-group of the node if it doesn't exist.
 
         Args:
             vds_file(h5py.File): File to check for node
+            node(str): Node to check - Default is target node
 
         """
         while self.target_node.endswith("/"):
             self.target_node = self.target_node[:-1]
+        if node is None:
+            node = self.target_node
 
-        if "/" in self.target_node:
-            sub_group = self.target_node.rsplit("/", 1)[0]
+        if "/" in node:
+            sub_group = node.rsplit("/", 1)[0]
             if vds_file.get(sub_group) is None:
                 vds_file.create_group(sub_group)
@@ -0,0 +1,334 @@
+#!/bin/env dls-python
+"""A CLI tool to check that a virtual dataset resolves to its source data."""
+
+import os
+import re
+import sys
+import random
+import hashlib
+import logging
+from multiprocessing import Pool
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from vdsgenerator import VDSGenerator
+from plan import read_plans, encode_index
+
+help_message = """
+-------------------------------------------------------------------------------
+A script to verify that a virtual dataset resolves to the right source data.
+
+Every source file of the VDS is checked to exist and contain a dataset of the
+mapped shape. Random regions of each map are then read through the VDS and
+directly from the mapped source slices, in a pool of processes, and their
+checksums compared. This finds missing files, maps in the wrong order and
+regions that silently read as fill values, reading only a small sample of the
+data. Maps of numbered source files are also checked to be placed in the
+order of their numbers, apart from tiles of a grid. For example:
+
+ > ../vdsgen/verify.py /scratch/images/stripe_vds.h5
+ > ../vdsgen/verify.py /scratch/images/stripe_vds.h5 --samples 4 \\
+       --region 128 --maps 1000 -w 8
+
+The exit code is 1 if any source is unresolved, out of order or any sample
+mismatches.
+-------------------------------------------------------------------------------
+"""
+
+logger = logging.getLogger("VDSVerify")
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+# Number at the end of a source file name, as found by VDSGenerator
+FILE_INDEX = re.compile(r"(\d+)\.(hdf5|hdf|h5)$")
+
+# The virtual dataset, opened once by each process of the pool
+_dataset = None
+
+
+def _open_dataset(vds_file, node):
+    """Open the virtual dataset - for use as a Pool initializer."""
+    import h5py as h5
+
+    global _dataset
+    _dataset = h5.File(vds_file, "r")[node]
+
+
+def _verify_map(args):
+    """Unpack arguments for verify_map - for use with Pool.map."""
+    return verify_map(_dataset, *args)
+
+
+def checksum(data):
+    """Calculate a checksum of an array.
+
+    Args:
+        data(numpy.ndarray): Array
+
+    Returns:
+        str: SHA-1 hex digest of the array data
+
+    """
+    import numpy as np
+
+    return hashlib.sha1(np.ascontiguousarray(data).tobytes()).hexdigest()
+
+
+def find_out_of_order(mappings, target_shape):
+    """Find maps of numbered source files that are not in numeric order.
+
+    Sources are placed by VDSGenerator in the order of the numbers at the end
+    of their file names, so the position of each map in the virtual dataset
+    should increase with the number of its file. This is not checked if the
+    maps are placed along more than one axis, as tiles of a grid layout are
+    placed by its geometry, which may give them in any order.
+
+    Args:
+        mappings(list(Mapping)): Maps of virtual dataset
+        target_shape(tuple(int)): Shape of virtual dataset
+
+    Returns:
+        list(str): Files placed before a file with a lower number - Empty if
+            any file is not numbered or maps are placed in a grid
+
+    """
+    numbered = []
+    for mapping in mappings:
+        match = FILE_INDEX.search(mapping.file)
+        if match is None:
+            return []
+        position = tuple(slice_.indices(dim)[0] for slice_, dim
+                         in zip(mapping.target_index, target_shape))
+        numbered.append((int(match.group(1)), position, mapping.file))
+
+    placed_along = [axis for axis, starts
+                    in enumerate(zip(*[start for _, start, _ in numbered]))
+                    if len(set(starts)) > 1]
+    if len(placed_along) > 1:
+        return []
+
+    out_of_order = []
+    numbered.sort()
+    for (_, previous, _), (_, position, file_path) in zip(numbered,
+                                                          numbered[1:]):
+        if position <= previous:
+            out_of_order.append(file_path)
+    return out_of_order
+
+
+def sample_selections(mapping, target_shape, samples, region, rng):
+    """Choose random regions of a map.
+
+    Each region is one element of the frame axes and up to region elements of
+    each of the last two axes.
+
+    Args:
+        mapping(Mapping): Map from source dataset into virtual dataset
+        target_shape(tuple(int)): Shape of virtual dataset
+        samples(int): Number of regions to choose
+        region(int): Maximum length of region along the image axes
+        rng(random.Random): Random number generator
+
+    Returns:
+        list(tuple(tuple(slice), tuple(slice))): Selection of virtual dataset
+            and source dataset of each region
+
+    """
+    source_index = mapping.source_index
+    if source_index is None:
+        source_index = (slice(None),) * len(mapping.source_shape)
+    axes = [(target.indices(target_dim), source.indices(source_dim))
+            for target, target_dim, source, source_dim
+            in zip(mapping.target_index, target_shape,
+                   source_index, mapping.source_shape)]
+    image_axes = range(max(0, len(axes) - 2), len(axes))
+
+    selections = []
+    for _ in range(samples):
+        target_selection, source_selection = [], []
+        for axis, (target, source) in enumerate(axes):
+            length = min(len(xrange(*target)), len(xrange(*source)))
+            if length == 0:
+                break
+            size = min(region, length) if axis in image_axes else 1
+            first = rng.randint(0, length - size)
+            for (start, _, step), selection in [(target, target_selection),
+                                                (source, source_selection)]:
+                begin = start + first * step
+                selection.append(
+                    slice(begin, begin + (size - 1) * step + 1, step))
+        else:
+            selections.append((tuple(target_selection),
+                               tuple(source_selection)))
+
+    return selections
+
+
+def verify_map(dataset, source_file, mapping, samples, region, seed):
+    """Check a source of a virtual dataset and compare samples of its data.
+
+    Args:
+        dataset(h5py.Dataset): Virtual dataset
+        source_file(str): Absolute path of source file
+        mapping(Mapping): Map from source dataset into virtual dataset
+        samples(int): Number of regions to compare
+        region(int): Maximum length of region along the image axes
+        seed(int): Seed for choosing regions
+
+    Returns:
+        dict: Source file, error if it could not be resolved, number of
+            samples compared and target selections of any mismatched samples
+
+    """
+    import h5py as h5
+
+    result = dict(file=mapping.file, error=None, samples=0, mismatches=[])
+    if not os.path.isfile(source_file):
+        result["error"] = "File does not exist"
+        return result
+
+    try:
+        with h5.File(source_file, "r") as source:
+            source_dataset = source.get(mapping.node)
+            if source_dataset is None:
+                result["error"] = "No node {}".format(mapping.node)
+                return result
+            if tuple(source_dataset.shape) != tuple(mapping.source_shape):
+                result["error"] = "Shape {} != mapped shape {}".format(
+                    tuple(source_dataset.shape), tuple(mapping.source_shape))
+                return result
+
+            selections = sample_selections(mapping, dataset.shape, samples,
+                                           region, random.Random(seed))
+            result["samples"] = len(selections)
+            for target_selection, source_selection in selections:
+                expected = source_dataset[source_selection].astype(
+                    dataset.dtype)
+                if checksum(dataset[target_selection]) != checksum(expected):
+                    result["mismatches"].append(
+                        encode_index(target_selection))
+    except IOError as error:
+        result["error"] = str(error)
+
+    return result
+
+
+def verify_vds(vds_file, node=None, samples=1, region=64, maps=None,
+               workers=1, seed=None):
+    """Check that a virtual dataset resolves to its source data.
+
+    Args:
+        vds_file(str): Path to VDS file
+        node(str): Data node in VDS file - Default is the VDSGenerator target
+            node
+        samples(int): Number of regions to compare for each map
+        region(int): Maximum length of region along the image axes
+        maps(int): Number of maps to check, chosen at random - Default is all
+        workers(int): Number of processes to check maps with
+        seed(int): Seed for choosing maps and regions
+
+    Returns:
+        dict: Number of maps and samples checked, unresolved sources, out of
+            order sources and mismatched samples
+
+    """
+    import h5py as h5
+
+    if node is None:
+        node = VDSGenerator.target_node
+
+    plan = read_plans(vds_file, [node])[0].expand_printf()
+    rng = random.Random(seed)
+    mappings = plan.mappings
+    if maps is not None and maps < len(mappings):
+        mappings = rng.sample(mappings, maps)
+
+    out_of_order = find_out_of_order(plan.mappings, plan.shape)
+
+    # Relative source paths are relative to the VDS file
+    folder = os.path.dirname(os.path.abspath(vds_file))
+    tasks = [(os.path.join(folder, mapping.file), mapping, samples, region,
+              rng.randint(0, sys.maxint))
+             for mapping in mappings]
+    logger.info("Verifying %s of %s maps of %s in %s", len(tasks),
+                len(plan.mappings), node, vds_file)
+
+    workers = min(workers, len(tasks))
+    if workers > 1:
+        pool = Pool(workers, _open_dataset, (vds_file, node))
+        try:
+            results = pool.map(_verify_map, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        with h5.File(vds_file, "r") as vds:
+            results = [verify_map(vds[node], *task) for task in tasks]
+
+    unresolved = [dict(file=result["file"], error=result["error"])
+                  for result in results if result["error"] is not None]
+    mismatches = [dict(file=result["file"], target_index=target_index)
+                  for result in results
+                  for target_index in result["mismatches"]]
+    for source in unresolved:
+        logger.error("Unresolved source %s: %s", source["file"],
+                     source["error"])
+    for file_path in out_of_order:
+        logger.error("Source %s is out of order", file_path)
+    for mismatch in mismatches:
+        logger.error("Mismatch in %s at %s", mismatch["file"],
+                     mismatch["target_index"])
+
+    return dict(maps=len(tasks),
+                samples=sum(result["samples"] for result in results),
+                unresolved=unresolved, out_of_order=out_of_order,
+                mismatches=mismatches)
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(usage=help_message,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "vds_file", type=str, help="VDS file to verify.")
+    parser.add_argument(
+        "-n", "--node", type=str, default=VDSGenerator.target_node,
+        dest="node", help="Data node in VDS file.")
+    parser.add_argument(
+        "--samples", type=int, default=1, dest="samples",
+        help="Number of regions to compare for each map.")
+    parser.add_argument(
+        "--region", type=int, default=64, dest="region",
+        help="Maximum length of each region along the image axes.")
+    parser.add_argument(
+        "--maps", type=int, default=None, dest="maps",
+        help="Number of maps to check, chosen at random. If None then all.")
+    parser.add_argument(
+        "-w", "--workers", type=int, default=VDSGenerator.workers,
+        dest="workers", help="Number of processes to check maps with.")
+    parser.add_argument(
+        "--seed", type=int, default=None, dest="seed",
+        help="Seed for choosing maps and regions, to repeat a check.")
+
+    return parser.parse_args()
+
+
+def main():
+    """Run program."""
+    args = parse_args()
+
+    report = verify_vds(args.vds_file, node=args.node, samples=args.samples,
+                        region=args.region, maps=args.maps,
+                        workers=args.workers, seed=args.seed)
+
+    logger.info("Checked %s samples of %s maps: %s unresolved sources, %s "
+                "out of order, %s mismatches", report["samples"],
+                report["maps"], len(report["unresolved"]),
+                len(report["out_of_order"]), len(report["mismatches"]))
+    if report["unresolved"] or report["out_of_order"] or \
+            report["mismatches"]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
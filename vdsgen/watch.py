@@ -0,0 +1,368 @@
+#!/bin/env dls-python
+"""A CLI tool to generate a virtual dataset as soon as its sources appear."""
+
+import os
+import sys
+import time
+import logging
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+from vdsgenerator import VDSGenerator, find_files
+
+help_message = """
+-------------------------------------------------------------------------------
+A script to watch a folder for complete sets of raw HDF5 files and create a
+virtual dataset from each of them.
+
+A set is complete when at least -n <expected> files matching the prefix
+exist, or, if not given, when at least two exist, and none of them have
+changed for --settle seconds. The VDS is created again whenever the set
+changes and is complete again, until --timeout seconds pass without a new
+complete set, or only once with --once. For example:
+
+ > ../vdsgen/watch.py /scratch/images -p stripe_ -n 6
+ > ../vdsgen/watch.py /scratch/images -p stripe_ --settle 10 --once
+
+inotify is used to wait for changes if pyinotify is installed, otherwise the
+folder is polled every --poll seconds.
+-------------------------------------------------------------------------------
+"""
+
+
+class VDSWatcher(object):
+
+    """A class to watch for sets of source files and make VDSs from them."""
+
+    # Default Values
+    expected = None  # Number of files in a complete set
+    settle_time = 5.0  # Seconds files must be unchanged for if not expected
+    expected_settle_time = 1.0  # Seconds files must be unchanged for if
+    # expected - not 0, as the last file may still be being written
+    poll_interval = 1.0  # Seconds between checks when polling
+    timeout = None  # Seconds to wait for a new complete set before stopping
+    once = False  # Stop after creating the first VDS
+
+    logger = logging.getLogger("VDSWatcher")
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+    def __init__(self, path, prefix, expected=None, settle_time=None,
+                 poll_interval=None, timeout=None, once=None,
+                 **generator_args):
+        """
+        Args:
+            path(str): Root folder to watch for raw files and create VDS
+            prefix(str): Prefix of HDF5 files to generate from
+            expected(int): Number of files in a complete set
+            settle_time(float): Seconds files must be unchanged for - Default
+                is 1 if expected is given, else 5
+            poll_interval(float): Seconds between checks when polling
+            timeout(float): Seconds to wait for a new complete set
+            once(bool): Stop after creating the first VDS
+            generator_args: Other arguments to pass to VDSGenerator
+
+        """
+        self.path = path
+        self.prefix = prefix
+        self.generator_args = generator_args
+
+        if expected is not None:
+            self.expected = expected
+            self.settle_time = self.expected_settle_time
+        if settle_time is not None:
+            self.settle_time = settle_time
+        if poll_interval is not None:
+            self.poll_interval = poll_interval
+        if timeout is not None:
+            self.timeout = timeout
+        if once is not None:
+            self.once = once
+
+        self._folder_mtime = None
+        self._files = []
+        self._outputs = set()  # VDS files created by this watcher
+
+    def snapshot(self):
+        """Get the size and modification time of each matching file.
+
+        The folder is only listed again if its modification time has changed.
+
+        Returns:
+            dict: Size and modification time of each file path
+
+        """
+        folder_mtime = os.stat(self.path).st_mtime
+        if folder_mtime != self._folder_mtime:
+            self._folder_mtime = folder_mtime
+            self._files = find_files(self.path, self.prefix)
+
+        snapshot = dict()
+        for file_ in self._files:
+            try:
+                stat = os.stat(file_)
+            except OSError:
+                # File removed since folder was listed
+                self._folder_mtime = None
+                continue
+            snapshot[file_] = (stat.st_size, stat.st_mtime)
+
+        return snapshot
+
+    def is_complete(self, snapshot):
+        """Check if the given files are a complete set.
+
+        Args:
+            snapshot(dict): Size and modification time of each file path
+
+        Returns:
+            bool: True if complete
+
+        """
+        if self.expected is not None:
+            return len(snapshot) >= self.expected
+        else:
+            return len(snapshot) >= 2
+
+    def wait(self, previous=None):
+        """Wait until there is a complete, settled set of files.
+
+        Args:
+            previous(dict): Snapshot of the last set a VDS was created from,
+                to wait for a set that differs from it
+
+        Returns:
+            dict: Size and modification time of each file of the set
+
+        """
+        notifier = self.create_notifier()
+        start = last_change = time.time()
+        last_snapshot = None
+        changed = True
+        try:
+            while True:
+                if changed or notifier is None:
+                    snapshot = self.snapshot()
+                    if snapshot != last_snapshot:
+                        self.logger.debug("Found %s files", len(snapshot))
+                        last_snapshot = snapshot
+                        last_change = time.time()
+
+                now = time.time()
+                settled = now - last_change >= self.settle_time
+                if self.is_complete(last_snapshot) and settled and \
+                        last_snapshot != previous:
+                    return last_snapshot
+                if self.timeout is not None and now - start > self.timeout:
+                    raise IOError(
+                        "Timed out waiting for files with prefix {prefix} in "
+                        "{path}".format(prefix=self.prefix, path=self.path))
+
+                interval = self.poll_interval
+                if self.is_complete(last_snapshot) and not settled:
+                    interval = min(
+                        interval, self.settle_time - (now - last_change))
+                changed = self.wait_for_change(notifier, max(interval, 0))
+        finally:
+            if notifier is not None:
+                notifier.stop()
+
+    def create_notifier(self):
+        """Create an inotify notifier for the watched folder, if possible.
+
+        Returns:
+            pyinotify.Notifier: Notifier, or None if pyinotify not installed
+
+        """
+        if pyinotify is None:
+            self.logger.debug("pyinotify not installed - polling %s",
+                              self.path)
+            return None
+
+        watch_manager = pyinotify.WatchManager()
+        watch_manager.add_watch(
+            self.path, pyinotify.IN_CREATE | pyinotify.IN_MODIFY |
+            pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO |
+            pyinotify.IN_DELETE)
+        return pyinotify.Notifier(watch_manager)
+
+    @staticmethod
+    def wait_for_change(notifier, timeout):
+        """Wait for a change in the watched folder, or until timeout.
+
+        Args:
+            notifier(pyinotify.Notifier): Notifier, or None to just sleep
+            timeout(float): Seconds to wait
+
+        Returns:
+            bool: True if the folder changed, or might have when polling
+
+        """
+        if notifier is None:
+            time.sleep(timeout)
+            return True
+
+        if notifier.check_events(int(timeout * 1000)):
+            notifier.read_events()
+            notifier.process_events()
+            return True
+        return False
+
+    def run(self):
+        """Generate a VDS from each new complete set of files.
+
+        An error creating the VDS of one set is logged and the watcher waits
+        for the next set, unless once is set.
+
+        Returns:
+            VDSGenerator: Generator used to create the last VDS, or None if
+                none could be created
+
+        Raises:
+            IOError: If there is no complete set within the timeout
+
+        """
+        self.logger.info("Watching for files with prefix %s in %s",
+                         self.prefix, self.path)
+        snapshot = gen = None
+        while True:
+            try:
+                snapshot = self.wait(snapshot)
+            except IOError:
+                if snapshot is None:
+                    raise
+                self.logger.info("No new set of files for %s seconds - "
+                                 "stopping", self.timeout)
+                return gen
+
+            try:
+                gen = self.generate(snapshot)
+            except Exception:
+                if self.once:
+                    raise
+                self.logger.exception("Failed to create VDS from %s files",
+                                      len(snapshot))
+                continue
+            if self.once:
+                return gen
+
+    def generate(self, snapshot):
+        """Generate a VDS from a set of files.
+
+        Args:
+            snapshot(dict): Size and modification time of each file of the set
+
+        The VDS file of a previous set is replaced. Any other existing file
+        is left alone, so generate_vds raises an error if it has the node.
+
+        Returns:
+            VDSGenerator: Generator used to create the VDS
+
+        """
+        # Keep the order of find_files, so stripe_10 comes after stripe_2
+        files = [os.path.basename(file_) for file_ in self._files
+                 if file_ in snapshot]
+        self.logger.info("Creating VDS from %s files", len(files))
+
+        gen = VDSGenerator(self.path, files=files, **self.generator_args)
+        if gen.output_file in self._outputs and \
+                os.path.isfile(gen.output_file):
+            self.logger.info("Replacing VDS at %s", gen.output_file)
+            os.remove(gen.output_file)
+        gen.generate_vds()
+        self._outputs.add(gen.output_file)
+        return gen
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(usage=help_message,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "path", type=str, help="Root folder to watch for source files.")
+    parser.add_argument(
+        "-p", "--prefix", type=str, required=True, dest="prefix",
+        help="Prefix of files to wait for - e.g 'stripe_' to combine "
+             "'stripe_1.hdf5' and 'stripe_2.hdf5'.")
+
+    # Arguments defining when the set of files is complete
+    complete = parser.add_argument_group()
+    complete.add_argument(
+        "-n", "--expected", type=int, default=VDSWatcher.expected,
+        dest="expected", help="Number of files in a complete set.")
+    complete.add_argument(
+        "--settle", type=float, default=None, dest="settle_time",
+        help="Seconds files must be unchanged for. If None then 1 if "
+             "--expected is given, else 5.")
+    complete.add_argument(
+        "--poll", type=float, default=VDSWatcher.poll_interval,
+        dest="poll_interval",
+        help="Seconds between checks if polling without inotify.")
+    complete.add_argument(
+        "--timeout", type=float, default=VDSWatcher.timeout, dest="timeout",
+        help="Seconds to wait for a new complete set before stopping. If "
+             "None then watch forever.")
+    complete.add_argument(
+        "--once", action="store_true", dest="once",
+        help="Stop after creating the first VDS.")
+
+    # Arguments to override VDSGenerator defaults
+    other_args = parser.add_argument_group()
+    other_args.add_argument(
+        "-o", "--output", type=str, default=None, dest="output",
+        help="Output file name. If None then generated as input file prefix "
+             "with vds suffix.")
+    other_args.add_argument(
+        "-s", "--stripe_spacing", type=int, dest="stripe_spacing",
+        default=VDSGenerator.stripe_spacing,
+        help="Spacing between two stripes in a module.")
+    other_args.add_argument(
+        "-m", "--module_spacing", type=int, dest="module_spacing",
+        default=VDSGenerator.module_spacing,
+        help="Spacing between two modules.")
+    other_args.add_argument(
+        "--source_node", type=str, dest="source_node",
+        default=VDSGenerator.source_node,
+        help="Data node in source HDF5 files.")
+    other_args.add_argument(
+        "--target_node", type=str, dest="target_node",
+        default=VDSGenerator.target_node, help="Data node in VDS file.")
+    other_args.add_argument(
+        "--layout", type=str, dest="layout", default=VDSGenerator.layout,
+        choices=VDSGenerator.LAYOUTS,
+        help="Stack sources vertically as stripes, concatenate them along "
+             "the frame axis or interleave their frames.")
+    other_args.add_argument(
+        "-l", "--log_level", type=int, dest="log_level",
+        default=VDSGenerator.log_level,
+        help="Logging level (off=3, info=2, debug=1).")
+
+    return parser.parse_args()
+
+
+def main():
+    """Run program."""
+    args = parse_args()
+
+    watcher = VDSWatcher(args.path, args.prefix,
+                         expected=args.expected,
+                         settle_time=args.settle_time,
+                         poll_interval=args.poll_interval,
+                         timeout=args.timeout,
+                         once=args.once,
+                         output=args.output,
+                         source_node=args.source_node,
+                         target_node=args.target_node,
+                         stripe_spacing=args.stripe_spacing,
+                         module_spacing=args.module_spacing,
+                         layout=args.layout,
+                         log_level=args.log_level)
+    watcher.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())